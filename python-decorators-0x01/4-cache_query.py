@@ -1,15 +1,775 @@
+import os
+import re
+import sys
 import time
-import sqlite3 
+import zlib
+import pickle
+import sqlite3
 import functools
-import hashlib
+import threading
+import contextlib
+from collections import OrderedDict
+
+
+FRESH, STALE, MISSING = 'fresh', 'stale', 'missing'
+
+
+class QueryCache:
+    """Bounded LRU cache of query results with per-entry TTL and table-based invalidation.
+
+    Entries are evicted least recently used first once the cache holds more
+    than max_entries results or more than max_bytes (estimated) of them.
+    Each entry remembers the tables its query read, so a write to one of
+    those tables drops it. An optional SharedCache behind it is consulted
+    on a miss and receives every stored result and invalidation.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024, ttl=300.0, shared=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.shared = shared
+        self._entries = OrderedDict()   # key -> (result, size, expires_at, tables)
+        self._by_table = {}             # table -> keys of the entries reading it
+        self._lock = threading.RLock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.stale_hits = 0
+        self.coalesced = 0
+        self.refreshes = 0
+        self.generation = 0    # Bumped by every invalidation
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self.get(key, count=False)[0]
+
+    def get(self, key, count=True):
+        """Returns (found, result) and marks the entry as recently used."""
+        status, result = self.lookup(key, count=count)
+        return status == FRESH, result
+
+    def lookup(self, key, stale_for=0.0, count=True):
+        """Returns (FRESH, result), (STALE, result) or (MISSING, None).
+
+        An entry that expired less than stale_for seconds ago is returned
+        as STALE instead of being dropped, so it can be served while it is
+        refreshed.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            status = MISSING
+            if entry is not None:
+                overdue = time.monotonic() - entry[2]
+                if overdue < 0:
+                    status = FRESH
+                elif overdue < stale_for:
+                    status = STALE
+                else:
+                    self._remove(key)
+                    self.expirations += 1
+            if status != MISSING:
+                self._entries.move_to_end(key)
+                if count:
+                    if status == FRESH:
+                        self.hits += 1
+                    else:
+                        self.stale_hits += 1
+                return status, entry[0]
+
+        # Another process may have computed it; keep it here for its remaining TTL
+        if self.shared is not None:
+            generation = self.version()
+            found, result, tables, ttl = self.shared.get(key)
+            if found:
+                self.set(key, result, tables, ttl, generation, share=False)
+                if count:
+                    with self._lock:
+                        self.hits += 1
+                return FRESH, result
+        if count:
+            with self._lock:
+                self.misses += 1
+        return MISSING, None
+
+    def count(self, counter):
+        """Increments one of the counters reported by stats(), e.g. 'coalesced'."""
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def version(self):
+        """Returns the invalidation counters to pass to set() as its generation."""
+        return self.generation, self.shared.generation() if self.shared is not None else None
+
+    def set(self, key, result, tables=(), ttl=None, generation=None, share=True):
+        """Stores a result read from tables, evicting LRU entries to stay in bounds.
+
+        A result computed since generation (see version()) is dropped if an
+        invalidation happened meanwhile, as it may be stale. With share,
+        the result is also written to the shared cache.
+        """
+        size = estimate_size(result)
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl
+        tables = frozenset(tables)
+        local, shared = generation if generation is not None else (None, None)
+        with self._lock:
+            if local is not None and local != self.generation:
+                return
+            if size <= self.max_bytes:
+                if key in self._entries:
+                    self._remove(key)
+                self._entries[key] = (result, size, expires_at, tables)
+                self.bytes += size
+                for table in tables:
+                    self._by_table.setdefault(table, set()).add(key)
+                while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                    self._remove(next(iter(self._entries)))
+                    self.evictions += 1
+        if share and self.shared is not None:
+            self.shared.set(key, result, tables, ttl, shared)
+
+    def _remove(self, key):
+        result, size, expires_at, tables = self._entries.pop(key)
+        self.bytes -= size
+        for table in tables:
+            keys = self._by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_table[table]
+
+    def invalidate_tables(self, tables):
+        """Drops every entry that read one of the tables; None drops everything."""
+        if tables is not None and not tables:
+            return
+        with self._lock:
+            self.generation += 1
+            if tables is None:
+                self.invalidations += len(self._entries)
+                self.clear()
+            else:
+                # Entries whose tables could not be parsed go with any write
+                keys = set(self._by_table.get(ANY_TABLE, ()))
+                for table in tables:
+                    keys |= self._by_table.get(table.lower(), set())
+                for key in keys:
+                    self._remove(key)
+                self.invalidations += len(keys)
+        if self.shared is not None:
+            self.shared.invalidate_tables(tables)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_table.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """Returns entry and byte counts plus hit, miss and eviction counters."""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'stale_hits': self.stale_hits,
+                'coalesced': self.coalesced,
+                'refreshes': self.refreshes,
+                'shared': self.shared.stats() if self.shared is not None else None,
+            }
+
+
+_SHARED_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,           -- repr() of the cache key
+    lookup BLOB NOT NULL,           -- the pickled key itself, for warm()
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    tables TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at);
+CREATE INDEX IF NOT EXISTS entries_expires_at ON entries (expires_at);
+CREATE TABLE IF NOT EXISTS entry_tables (
+    tbl TEXT NOT NULL,
+    key TEXT NOT NULL REFERENCES entries (key) ON DELETE CASCADE,
+    PRIMARY KEY (tbl, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entry_tables_key ON entry_tables (key);
+CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, expires_at REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO meta VALUES ('bytes', 0), ('generation', 0);
+CREATE TRIGGER IF NOT EXISTS entries_added AFTER INSERT ON entries BEGIN
+    UPDATE meta SET value = value + NEW.size WHERE name = 'bytes';
+END;
+CREATE TRIGGER IF NOT EXISTS entries_removed AFTER DELETE ON entries BEGIN
+    UPDATE meta SET value = value - OLD.size WHERE name = 'bytes';
+END;
+"""
+
+# Serialized results above this size are zlib-compressed
+COMPRESS_OVER = 1024
+_RAW, _ZLIB = b'p', b'z'
+
+
+def dump_result(result):
+    """Serializes a query result compactly: pickled rows, compressed when large."""
+    data = pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+    if len(data) > COMPRESS_OVER:
+        return _ZLIB + zlib.compress(data, 1)
+    return _RAW + data
+
+
+def load_result(blob):
+    data = blob[1:]
+    return pickle.loads(zlib.decompress(data) if blob[:1] == _ZLIB else data)
+
+
+class SharedCache:
+    """Query results shared by every worker process on a host through one SQLite file.
+
+    The file is in WAL mode, so lookups never wait for a writer. Writes
+    take SQLite's write lock up front (BEGIN IMMEDIATE) and wait up to
+    timeout seconds for other processes. Past max_bytes of stored results
+    the least recently used are evicted. Keys are matched exactly on the
+    repr() of the cache key. Results are pickled, so only share a file
+    that no other user can write.
+
+    A process about to run a missing query takes a lease on its key; other
+    processes wait for that result instead of running the query too, so a
+    fleet restarting together does not hit the database all at once.
+
+    An invalidation that finds the file locked does not fail the write
+    that caused it. It is kept and retried before the next shared
+    operation; until it succeeds, this process neither reads from nor
+    stores into the shared tier.
+    """
+
+    # Hits refresh an entry's LRU position at most this often (seconds)
+    TOUCH_INTERVAL = 1.0
+
+    def __init__(self, path='query_cache.db', max_bytes=256 * 1024 * 1024, timeout=5.0, lease=30.0):
+        self.path = os.path.abspath(path)
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.lease = lease
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.waits = 0
+        self.errors = 0
+        self._pending_lock = threading.Lock()
+        self._pending_tables = set()    # Invalidations not yet applied to the file
+        self._pending_all = False
+        self._connection()
+
+    def _connection(self):
+        """Returns this thread's connection, reopening it after a fork."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute(f"PRAGMA busy_timeout = {int(self.timeout * 1000)}")
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")   # A cache may lose its last writes
+            conn.execute("PRAGMA foreign_keys = ON")
+            conn.executescript(_SHARED_SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextlib.contextmanager
+    def _write(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _meta(self, conn, name):
+        return conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()[0]
+
+    def generation(self):
+        """Returns the number of invalidations so far, across all processes."""
+        return self._meta(self._connection(), 'generation')
+
+    def get(self, key):
+        """Returns (found, result, tables, seconds to live) for a cache key."""
+        if not self._apply_pending():
+            self.misses += 1
+            return False, None, (), 0.0
+        text = repr(key)
+        now = time.time()
+        try:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT value, tables, expires_at, accessed_at FROM entries WHERE key = ? AND expires_at > ?",
+                (text, now)).fetchone()
+            if row is not None and now - row[3] > self.TOUCH_INTERVAL:
+                conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, text))
+        except sqlite3.OperationalError:
+            # Locked or unavailable: behave like a miss rather than fail the query
+            self.errors += 1
+            row = None
+        if row is None:
+            self.misses += 1
+            return False, None, (), 0.0
+        self.hits += 1
+        return True, load_result(row[0]), row[1].split(','), row[2] - now
+
+    def set(self, key, result, tables, ttl, generation=None):
+        """Stores a result unless an invalidation happened since generation."""
+        try:
+            lookup = pickle.dumps(key, pickle.HIGHEST_PROTOCOL)
+            value = dump_result(result)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return   # Not shareable; it stays in the process's own cache
+        if len(value) > self.max_bytes:
+            return
+        text = repr(key)
+        tables = sorted(set(tables))
+        now = time.time()
+        try:
+            if not self._apply_pending():
+                return
+            with self._write() as conn:
+                if generation is not None and self._meta(conn, 'generation') != generation:
+                    return
+                conn.execute("DELETE FROM entries WHERE key = ?", (text,))
+                conn.execute("INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             (text, lookup, value, len(value), ','.join(tables), now + ttl, now))
+                conn.executemany("INSERT INTO entry_tables VALUES (?, ?)", [(table, text) for table in tables])
+                self._evict(conn, now)
+        except sqlite3.OperationalError:
+            self.errors += 1
+
+    def _evict(self, conn, now):
+        """Drops expired entries, then the least recently used ones until under max_bytes."""
+        conn.execute("DELETE FROM entries WHERE expires_at <= ?", (now,))
+        excess = self._meta(conn, 'bytes') - self.max_bytes
+        if excess > 0:
+            cursor = conn.execute(
+                "DELETE FROM entries WHERE key IN (SELECT key FROM ("
+                " SELECT key, size, SUM(size) OVER (ORDER BY accessed_at, key) AS running FROM entries"
+                ") WHERE running - size < ?)", (excess,))
+            self.evictions += cursor.rowcount
+
+    def invalidate_tables(self, tables):
+        """Drops every shared entry that read one of the tables; None drops everything.
+
+        If the file is locked, the invalidation is kept for later (see
+        _apply_pending) instead of raising into the caller's write.
+        """
+        with self._pending_lock:
+            if tables is None:
+                self._pending_all = True
+            else:
+                self._pending_tables.update(table.lower() for table in tables)
+        self._apply_pending()
+
+    def _apply_pending(self):
+        """Applies the invalidations still pending; returns False if the file is still locked."""
+        with self._pending_lock:
+            if not self._pending_all and not self._pending_tables:
+                return True
+            tables = None if self._pending_all else set(self._pending_tables)
+            try:
+                self._invalidate(tables)
+            except sqlite3.OperationalError:
+                self.errors += 1
+                return False
+            self._pending_tables.clear()
+            self._pending_all = False
+            return True
+
+    def _invalidate(self, tables):
+        with self._write() as conn:
+            conn.execute("UPDATE meta SET value = value + 1 WHERE name = 'generation'")
+            if tables is None:
+                conn.execute("DELETE FROM entries")
+                return
+            names = sorted({table.lower() for table in tables} | {ANY_TABLE})
+            conn.execute("DELETE FROM entries WHERE key IN (SELECT key FROM entry_tables WHERE tbl IN (%s))"
+                         % ','.join('?' * len(names)), names)
+
+    def acquire_lease(self, key):
+        """Claims the computation of a missing key; False if another process holds it."""
+        text = repr(key)
+        now = time.time()
+        try:
+            with self._write() as conn:
+                conn.execute("DELETE FROM leases WHERE key = ? AND expires_at <= ?", (text, now))
+                cursor = conn.execute("INSERT OR IGNORE INTO leases VALUES (?, ?)", (text, now + self.lease))
+                return cursor.rowcount == 1
+        except sqlite3.OperationalError:
+            self.errors += 1
+            return True
+
+    def release_lease(self, key):
+        try:
+            with self._write() as conn:
+                conn.execute("DELETE FROM leases WHERE key = ?", (repr(key),))
+        except sqlite3.OperationalError:
+            self.errors += 1   # The lease expires on its own
+
+    def wait(self, key):
+        """Waits until the key is stored or its lease is released (or expires)."""
+        text = repr(key)
+        conn = self._connection()
+        deadline = time.time() + self.lease
+        delay = 0.005
+        self.waits += 1
+        while time.time() < deadline:
+            now = time.time()
+            try:
+                stored = conn.execute("SELECT 1 FROM entries WHERE key = ? AND expires_at > ?", (text, now)).fetchone()
+                leased = conn.execute("SELECT 1 FROM leases WHERE key = ? AND expires_at > ?", (text, now)).fetchone()
+            except sqlite3.OperationalError:
+                self.errors += 1
+                return
+            if stored or not leased:
+                return
+            time.sleep(delay)
+            delay = min(delay * 2, 0.1)
+
+    def warm(self, cache, limit=None):
+        """Loads the most recently used live entries into a QueryCache; returns how many."""
+        limit = cache.max_entries if limit is None else min(limit, cache.max_entries)
+        if not self._apply_pending():
+            return 0
+        now = time.time()
+        rows = self._connection().execute(
+            "SELECT lookup, value, tables, expires_at FROM entries WHERE expires_at > ? "
+            "ORDER BY accessed_at DESC LIMIT ?", (now, limit)).fetchall()
+        # Oldest first, so the most recently used end up most recent locally too
+        for lookup, value, tables, expires_at in reversed(rows):
+            cache.set(pickle.loads(lookup), load_result(value), tables.split(','), expires_at - now, share=False)
+        return len(rows)
+
+    def stats(self):
+        """Returns this process's shared-tier counters plus the file's entry and byte counts."""
+        conn = self._connection()
+        return {
+            'entries': conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0],
+            'bytes': self._meta(conn, 'bytes'),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'waits': self.waits,
+            'errors': self.errors,
+        }
+
+
+def estimate_size(value):
+    """Rough memory footprint of a query result (rows of scalars)."""
+    size = sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        for row in value:
+            size += sys.getsizeof(row)
+            if isinstance(row, (list, tuple)):
+                size += sum(sys.getsizeof(field) for field in row)
+    return size
+
+
+_IDENTIFIER = r'[`"\[]?([\w.]+)[`"\]]?'
+_FROM_CLAUSE = re.compile(
+    r'\bFROM\s+(.+?)(?=\bWHERE\b|\bGROUP\b|\bORDER\b|\bLIMIT\b|\bHAVING\b|\bUNION\b'
+    r'|\bEXCEPT\b|\bINTERSECT\b|\b(?:NATURAL|LEFT|RIGHT|INNER|CROSS|FULL|OUTER)\b|\bJOIN\b|\)|;|$)',
+    re.IGNORECASE | re.DOTALL)
+_JOIN = re.compile(r'\bJOIN\s+' + _IDENTIFIER, re.IGNORECASE)
+_WRITE = re.compile(
+    r'^\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM'
+    r'|DROP\s+TABLE(?:\s+IF\s+EXISTS)?|ALTER\s+TABLE|TRUNCATE(?:\s+TABLE)?)\s+' + _IDENTIFIER,
+    re.IGNORECASE)
+_READ_ONLY = ('SELECT', 'EXPLAIN', 'PRAGMA', 'VALUES')
+# Transaction control writes no table; the commit itself is tracked by InvalidatingConnection
+_TRANSACTION_CONTROL = ('BEGIN', 'START', 'SAVEPOINT', 'RELEASE', 'COMMIT', 'END', 'ROLLBACK')
+_SQL_TOKEN = re.compile(
+    r"""'(?:[^']|'')*'|"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\]|--[^\n]*|/\*.*?\*/|[(),]|[^\s'"`\[(),]+""",
+    re.DOTALL)
+
+
+def _table_name(name):
+    return name.rsplit('.', 1)[-1].lower()
+
+
+# Dependency recorded for queries whose tables could not be determined
+ANY_TABLE = '*'
+
+
+def tables_in(query):
+    """Returns the names of the tables a SELECT reads (FROM lists and JOINs).
+
+    Falls back to {ANY_TABLE} when no table is found, so the result is
+    invalidated by any write.
+    """
+    tables = set()
+    for clause in _FROM_CLAUSE.findall(query):
+        for item in clause.split(','):
+            match = re.match(r'\s*' + _IDENTIFIER, item)
+            if match:
+                tables.add(_table_name(match.group(1)))
+    tables.update(_table_name(name) for name in _JOIN.findall(query))
+    return tables or {ANY_TABLE}
+
+
+def _after_ctes(statement):
+    """Returns the statement that follows a WITH clause's CTE list, None if it cannot be found."""
+    depth = 0
+    closed = False   # Just after a top-level parenthesised group
+    for token in _SQL_TOKEN.finditer(statement):
+        text = token.group()
+        if text.startswith(('--', '/*')):
+            continue
+        if closed:
+            # ',' starts the next CTE and AS follows a column list; anything else ends the list
+            if text != ',' and text.upper() != 'AS':
+                return statement[token.start():]
+            closed = False
+        if text == '(':
+            depth += 1
+        elif text == ')':
+            depth -= 1
+            if depth < 0:
+                return None
+            closed = depth == 0
+    return None
+
+
+def written_tables(statement):
+    """Returns the tables a statement writes: an empty set for reads, None if unknown."""
+    words = statement.lstrip().split(None, 1)
+    if words and words[0].upper() == 'WITH':
+        # The verb after the CTE list decides; SQL that cannot be parsed counts as a write
+        statement = _after_ctes(statement)
+        if statement is None:
+            return None
+        words = statement.split(None, 1)
+        if words[0].upper() == 'SELECT':
+            return set()
+    elif not words or words[0].upper() in _READ_ONLY + _TRANSACTION_CONTROL:
+        return set()
+    match = _WRITE.match(statement)
+    if match is None:
+        return None   # Unrecognised write (e.g. a script): assume it touches everything
+    return {_table_name(match.group(1))}
+
+
+class InvalidatingCursor:
+    """Cursor proxy that invalidates cached results of the tables it writes."""
+
+    def __init__(self, cursor, connection):
+        self._cursor = cursor
+        self._connection = connection
+
+    def execute(self, statement, *args):
+        self._connection._wrote(written_tables(statement))
+        self._cursor.execute(statement, *args)
+        # An SQL COMMIT or ROLLBACK ends the transaction like commit() and rollback()
+        words = statement.upper().replace(';', ' ').split()
+        if words[:1] in (['COMMIT'], ['END']):
+            self._connection._ended(committed=True)
+        elif words[:1] == ['ROLLBACK'] and 'TO' not in words:   # Not ROLLBACK TO a savepoint
+            self._connection._ended(committed=False)
+        return self
+
+    def executemany(self, statement, *args):
+        self._connection._wrote(written_tables(statement))
+        self._cursor.executemany(statement, *args)
+        return self
+
+    def executescript(self, script):
+        self._connection._wrote(None)
+        self._cursor.executescript(script)
+        return self
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class InvalidatingConnection:
+    """Connection proxy that keeps a QueryCache consistent with the writes made through it.
+
+    Written tables are invalidated when the statement runs and again on
+    commit, so a concurrent reader cannot re-cache the pre-commit rows.
+    """
+
+    def __init__(self, connection, cache, database=None):
+        self._connection = connection
+        self._cache = cache
+        self.database = database
+        self._pending = set()
+        self._pending_all = False
+
+    def _wrote(self, tables):
+        if tables is None:
+            self._pending_all = True
+            self._cache.invalidate_tables(None)
+        elif tables:
+            self._pending |= tables
+            self._cache.invalidate_tables(tables)
+
+    def cursor(self, *args, **kwargs):
+        return InvalidatingCursor(self._connection.cursor(*args, **kwargs), self)
+
+    def execute(self, statement, *args):
+        return self.cursor().execute(statement, *args)
+
+    def executemany(self, statement, *args):
+        return self.cursor().executemany(statement, *args)
+
+    def executescript(self, script):
+        return self.cursor().executescript(script)
+
+    def _ended(self, committed):
+        """Re-invalidates the tables written in a committed transaction and forgets them."""
+        if committed:
+            self._cache.invalidate_tables(None if self._pending_all else self._pending)
+        self._pending = set()
+        self._pending_all = False
+
+    def commit(self):
+        self._connection.commit()
+        self._ended(committed=True)
+
+    def rollback(self):
+        self._connection.rollback()
+        self._ended(committed=False)
+
+    def __enter__(self):
+        self._connection.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        result = self._connection.__exit__(*exc_info)
+        self._ended(committed=exc_info[0] is None)
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+_QUOTED = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")""")
+_SPACE = re.compile(r'\s+')
+
+
+def normalize_sql(query):
+    """Collapses whitespace and drops a trailing semicolon, leaving string literals untouched."""
+    parts = _QUOTED.split(query.strip().rstrip(';').strip())
+    # Odd parts are the quoted literals
+    return ''.join(part if index % 2 else _SPACE.sub(' ', part)
+                   for index, part in enumerate(parts))
+
+
+def _freeze(value):
+    """Turns bound parameters into a hashable, order-stable value."""
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, (bytearray, memoryview)):
+        return bytes(value)
+    return value
+
+
+def cache_key(query, params=(), database=None):
+    """Key of a cached result: (normalized SQL, frozen parameters, database path).
+
+    The tuple itself is the dictionary key, so lookups use Python's fast
+    built-in hash and compare the full key on a match: queries that differ
+    only in their parameters never collide.
+    """
+    return normalize_sql(query), _freeze(params), database
+
+
+class _Flight:
+    """A computation of one missing entry that other callers can wait for."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Runs at most one computation per key at a time; concurrent callers share its result."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def run(self, key, compute):
+        """Returns (result, leader): leader is False when the result came from another caller."""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, False
+        try:
+            flight.result = compute()
+            return flight.result, True
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def in_flight(self, key):
+        with self._lock:
+            return key in self._flights
+
+
+DB_PATH = 'users.db'
+
+query_cache = QueryCache()
+_flights = SingleFlight()
+
+
+def enable_shared_cache(path='query_cache.db', warm=True, cache=None, **options):
+    """Backs a QueryCache (query_cache by default) with a SharedCache file.
+
+    With warm, the cache starts with the file's most recently used results.
+    Other options go to SharedCache. Results cached in a process's own
+    tier are only dropped by writes from other processes once their TTL
+    runs out, so keep TTLs short when several processes write.
+    """
+    cache = query_cache if cache is None else cache
+    cache.shared = SharedCache(path, **options)
+    if warm:
+        cache.shared.warm(cache)
+    return cache.shared
 
-query_cache = {}
 
 def with_db_connection(func):
     """Decorator that automatically handles database connections."""
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        conn = sqlite3.connect('users.db')
+        # Writes through this connection invalidate the cached results they affect
+        # The absolute path keys the cache, so processes in other directories share entries
+        conn = InvalidatingConnection(sqlite3.connect(DB_PATH), query_cache, os.path.abspath(DB_PATH))
         try:
             result = func(conn, *args, **kwargs)
             return result
@@ -17,34 +777,107 @@ def with_db_connection(func):
             conn.close()
     return wrapper
 
-def cache_query(func):
-    """Decorator that caches query results based on the SQL query string."""
+
+def cache_query(func=None, ttl=None, cache=None, stale_while_revalidate=0.0):
+    """Decorator that caches query results keyed on the SQL, its parameters and the database.
+
+    Use as @cache_query or @cache_query(ttl=60, stale_while_revalidate=30).
+    Results expire after ttl seconds (the cache's default if omitted).
+    Concurrent callers missing the same key share one database query, also
+    across processes when the cache has a SharedCache. With
+    stale_while_revalidate, a result up to that many seconds past its TTL
+    is returned at once while a background thread refreshes it on its own
+    sqlite3 connection to the same database.
+    """
+    if func is None:
+        return functools.partial(cache_query, ttl=ttl, cache=cache,
+                                 stale_while_revalidate=stale_while_revalidate)
+
+    def compute(store, key, database, query, args, kwargs, conn=None):
+        shared = store.shared
+        leased = shared is None or shared.acquire_lease(key)
+        if not leased:
+            # Another process is running the same query: use its result
+            shared.wait(key)
+            status, result = store.lookup(key, count=False)
+            if status == FRESH:
+                return result
+        try:
+            return run(store, key, database, query, args, kwargs, conn)
+        finally:
+            if shared is not None and leased:
+                shared.release_lease(key)
+
+    def run(store, key, database, query, args, kwargs, conn):
+        print("Executing query and caching result")
+        generation = store.version()
+        own_conn = conn is None
+        if own_conn:
+            conn = InvalidatingConnection(sqlite3.connect(database or DB_PATH), store, database)
+        try:
+            result = func(conn, query, *args, **kwargs)
+        finally:
+            if own_conn:
+                conn.close()
+        store.set(key, result, tables_in(query), ttl, generation)
+        return result
+
+    def refresh(store, key, database, query, args, kwargs):
+        try:
+            _flights.run((id(store), key), lambda: compute(store, key, database, query, args, kwargs))
+            store.count('refreshes')
+        except Exception as e:
+            print(f"Background refresh failed: {e}")
+
     @functools.wraps(func)
     def wrapper(conn, query, *args, **kwargs):
-        # Create a cache key from the query
-        cache_key = hashlib.md5(query.encode()).hexdigest()
-        
+        store = cache if cache is not None else query_cache
+        database = getattr(conn, 'database', None)
+        # Every argument after the query (e.g. its parameters) is part of the key
+        key = cache_key(query, (args, kwargs), database)
+        flight = (id(store), key)
+
         # Check if result is in cache
-        if cache_key in query_cache:
+        status, result = store.lookup(key, stale_while_revalidate)
+        if status == FRESH:
             print("Returning cached result")
-            return query_cache[cache_key]
-        
-        # Execute query and cache result
-        print("Executing query and caching result")
-        result = func(conn, query, *args, **kwargs)
-        query_cache[cache_key] = result
+            return result
+        if status == STALE and database is not None:
+            if not _flights.in_flight(flight):
+                threading.Thread(target=refresh, args=(store, key, database, query, args, kwargs),
+                                 daemon=True).start()
+            print("Returning stale result while refreshing")
+            return result
+
+        # Execute query and cache result; concurrent misses wait for this one
+        result, leader = _flights.run(
+            flight, lambda: compute(store, key, database, query, args, kwargs, conn))
+        if not leader:
+            print("Returning result of a concurrent query")
+            store.count('coalesced')
         return result
     return wrapper
 
+
 @with_db_connection
 @cache_query
-def fetch_users_with_cache(conn, query):
+def fetch_users_with_cache(conn, query, params=()):
     cursor = conn.cursor()
-    cursor.execute(query)
+    cursor.execute(query, params)
     return cursor.fetchall()
 
-# Example usage
+
+@with_db_connection
+def update_user_email(conn, user_id, new_email):
+    conn.execute("UPDATE users SET email = ? WHERE id = ?", (new_email, user_id))
+    conn.commit()
+
+
+# Example usage: ./4-cache_query.py [SHARED_CACHE_FILE]
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        print(f"Warm start: {enable_shared_cache(sys.argv[1]).stats()['entries']} shared entries")
+
     # Create test database
     conn = sqlite3.connect('users.db')
     cursor = conn.cursor()
@@ -55,14 +888,24 @@ if __name__ == "__main__":
             email TEXT
         )
     ''')
-    cursor.execute("INSERT OR IGNORE INTO users (name, email) VALUES ('John Doe', 'john@example.com')")
+    cursor.execute("INSERT OR IGNORE INTO users (id, name, email) VALUES (1, 'John Doe', 'john@example.com')")
     conn.commit()
     conn.close()
-    
+
     # First call will cache the result
     users = fetch_users_with_cache(query="SELECT * FROM users")
     print(f"First call: {users}")
-    
+
     # Second call will use the cached result
     users_again = fetch_users_with_cache(query="SELECT * FROM users")
     print(f"Second call: {users_again}")
+
+    # Parameters are part of the key
+    user = fetch_users_with_cache(query="SELECT * FROM users WHERE id = ?", params=(1,))
+    print(f"User 1: {user}")
+
+    # A write to users invalidates the cached result
+    update_user_email(user_id=1, new_email='john.doe@example.com')
+    users_updated = fetch_users_with_cache(query="SELECT * FROM users")
+    print(f"After update: {users_updated}")
+    print(f"Cache stats: {query_cache.stats()}")
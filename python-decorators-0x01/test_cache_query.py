@@ -0,0 +1,416 @@
+import time
+import sqlite3
+import threading
+import multiprocessing
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+
+MODULE_PATH = Path(__file__).with_name('4-cache_query.py')
+
+
+@pytest.fixture
+def cq(tmp_path, monkeypatch):
+    """A fresh copy of 4-cache_query.py (own global cache) working in tmp_path."""
+    monkeypatch.chdir(tmp_path)
+    spec = importlib.util.spec_from_file_location('cache_query_under_test', MODULE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    conn = sqlite3.connect('users.db')
+    conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT, email TEXT)")
+    conn.execute("CREATE TABLE orders (id INTEGER PRIMARY KEY, user_id INTEGER, total REAL)")
+    conn.execute("INSERT INTO users VALUES (1, 'John Doe', 'john@example.com'), (2, 'Jane Roe', 'jane@example.com')")
+    conn.execute("INSERT INTO orders VALUES (1, 1, 9.5)")
+    conn.commit()
+    conn.close()
+    return module
+
+
+# Eviction and expiry
+
+def test_evicts_least_recently_used_past_max_entries(cq):
+    cache = cq.QueryCache(max_entries=2)
+    cache.set('a', [1])
+    cache.set('b', [2])
+    assert cache.get('a') == (True, [1])   # 'b' is now the least recently used
+    cache.set('c', [3])
+
+    assert 'b' not in cache
+    assert 'a' in cache and 'c' in cache
+    assert cache.stats()['evictions'] == 1
+
+
+def test_evicts_least_recently_used_past_max_bytes(cq):
+    def rows():
+        return [(1, 'x' * 100)]
+    size = cq.estimate_size(rows())
+    cache = cq.QueryCache(max_entries=100, max_bytes=size * 2)
+    cache.set('a', rows())
+    cache.set('b', rows())
+    cache.get('a')
+    cache.set('c', rows())
+
+    assert 'b' not in cache
+    assert 'a' in cache and 'c' in cache
+    assert cache.stats()['bytes'] == size * 2
+
+
+def test_result_larger_than_max_bytes_is_not_cached(cq):
+    cache = cq.QueryCache(max_bytes=10)
+    cache.set('a', [(1, 'x' * 100)])
+    assert 'a' not in cache
+    assert cache.stats()['bytes'] == 0
+
+
+def test_expired_entry_is_dropped(cq):
+    cache = cq.QueryCache(ttl=60)
+    cache.set('a', [1], ttl=0)
+    cache.set('b', [2])
+
+    assert cache.get('a') == (False, None)
+    assert cache.get('b') == (True, [2])
+    stats = cache.stats()
+    assert stats['entries'] == 1
+    assert stats['expirations'] == 1
+
+
+def test_expired_entry_is_stale_within_grace_period(cq):
+    cache = cq.QueryCache()
+    cache.set('a', [1], ttl=0)
+    assert cache.lookup('a', stale_for=60) == (cq.STALE, [1])
+    assert cache.lookup('a') == (cq.MISSING, None)
+
+
+# Table extraction
+
+@pytest.mark.parametrize('query, tables', [
+    ("SELECT * FROM users", {'users'}),
+    ("SELECT * FROM main.Users AS u WHERE u.id = ?", {'users'}),
+    ("SELECT u.name FROM users u JOIN orders o ON o.user_id = u.id "
+     "LEFT JOIN items ON items.id = o.item_id", {'users', 'orders', 'items'}),
+    ("SELECT * FROM users, orders WHERE orders.user_id = users.id", {'users', 'orders'}),
+    ("SELECT * FROM users WHERE id IN (SELECT user_id FROM orders)", {'users', 'orders'}),
+    ("WITH recent AS (SELECT user_id FROM orders WHERE total > 10) "
+     "SELECT * FROM users JOIN recent ON recent.user_id = users.id", {'users', 'orders', 'recent'}),
+    ("SELECT 1", {'*'}),
+])
+def test_tables_in(cq, query, tables):
+    assert cq.tables_in(query) == tables
+
+
+@pytest.mark.parametrize('statement, tables', [
+    ("SELECT * FROM users", set()),
+    ("UPDATE users SET email = ? WHERE id = ?", {'users'}),
+    ("update main.users set email = ?", {'users'}),
+    ("INSERT OR REPLACE INTO \"Users\" VALUES (?)", {'users'}),
+    ("DELETE FROM orders WHERE id IN (SELECT id FROM users)", {'orders'}),
+    ("WITH x(a) AS (SELECT 1), y AS (SELECT 2) SELECT * FROM x, y", set()),
+    ("WITH old AS (SELECT id FROM users) DELETE FROM orders WHERE user_id IN (SELECT id FROM old)", {'orders'}),
+    ("WITH q AS (SELECT ')' AS p) UPDATE users SET name = (SELECT p FROM q)", {'users'}),
+    ("WITH broken AS (SELECT 1", None),
+    ("BEGIN", set()),
+    ("SAVEPOINT sp", set()),
+    ("RELEASE sp", set()),
+    ("ROLLBACK TO sp", set()),
+    ("COMMIT", set()),
+    ("CREATE TABLE t (a)", None),
+])
+def test_written_tables(cq, statement, tables):
+    assert cq.written_tables(statement) == tables
+
+
+# Invalidation through the decorated functions
+
+def test_update_user_email_invalidates_cached_users(cq, capsys):
+    query = "SELECT email FROM users WHERE id = ?"
+    assert cq.fetch_users_with_cache(query=query, params=(1,)) == [('john@example.com',)]
+    assert cq.fetch_users_with_cache(query=query, params=(1,)) == [('john@example.com',)]
+    assert capsys.readouterr().out.count("Executing query") == 1
+
+    cq.update_user_email(1, 'john@new.example.com')
+
+    assert cq.fetch_users_with_cache(query=query, params=(1,)) == [('john@new.example.com',)]
+    assert capsys.readouterr().out.count("Executing query") == 1
+
+
+def test_update_user_email_keeps_results_of_other_tables(cq, capsys):
+    query = "SELECT total FROM orders"
+    cq.fetch_users_with_cache(query=query)
+    cq.update_user_email(1, 'john@new.example.com')
+    capsys.readouterr()
+
+    assert cq.fetch_users_with_cache(query=query) == [(9.5,)]
+    assert "Returning cached result" in capsys.readouterr().out
+
+
+def test_uncommitted_write_is_invalidated_again_on_commit(cq):
+    cache = cq.query_cache
+    key = cq.cache_key("SELECT * FROM users", ((), {}), 'db')
+    conn = cq.InvalidatingConnection(sqlite3.connect('users.db'), cache, 'db')
+    conn.execute("UPDATE users SET name = 'x' WHERE id = 1")
+    # A reader re-caches the old rows before the commit
+    cache.set(key, [('old',)], {'users'})
+    conn.commit()
+    conn.close()
+
+    assert key not in cache
+
+
+# Keys and single-flight
+
+def test_queries_differing_only_in_parameters_are_cached_apart(cq, capsys):
+    query = "SELECT name FROM users WHERE id = ?"
+    assert cq.fetch_users_with_cache(query=query, params=(1,)) == [('John Doe',)]
+    assert cq.fetch_users_with_cache(query=query, params=(2,)) == [('Jane Roe',)]
+    assert cq.fetch_users_with_cache(query=query, params=(1,)) == [('John Doe',)]
+    assert capsys.readouterr().out.count("Executing query") == 2
+
+    assert cq.cache_key(query, (1,)) != cq.cache_key(query, (2,))
+    assert cq.cache_key(query, {'a': 1, 'b': 2}) == cq.cache_key(query + ' ;', {'b': 2, 'a': 1})
+    assert cq.cache_key("SELECT 'a  b'") != cq.cache_key("SELECT 'a b'")
+
+
+def run_concurrently(count, call):
+    """Calls call() from count threads released together; returns (results, errors)."""
+    barrier = threading.Barrier(count)
+    results, errors = [], []
+
+    def worker():
+        barrier.wait()
+        try:
+            results.append(call())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+def test_concurrent_misses_run_one_query(cq, capsys):
+    cache = cq.QueryCache()
+    calls = []
+
+    @cq.cache_query(cache=cache)
+    def fetch(conn, query):
+        calls.append(query)
+        time.sleep(0.3)   # Long enough for every caller to miss and wait
+        return [(1,)]
+
+    results, errors = run_concurrently(8, lambda: fetch(None, "SELECT 1"))
+
+    assert errors == []
+    assert results == [[(1,)]] * 8
+    assert len(calls) == 1
+    assert cache.stats()['coalesced'] == 7
+    out = capsys.readouterr().out
+    assert out.count("Executing query") == 1
+    assert out.count("Returning result of a concurrent query") == 7
+
+
+def test_leader_error_reaches_every_waiter(cq, capsys):
+    cache = cq.QueryCache()
+    calls = []
+
+    @cq.cache_query(cache=cache)
+    def fetch(conn, query):
+        calls.append(query)
+        time.sleep(0.3)
+        raise sqlite3.OperationalError("database is locked")
+
+    results, errors = run_concurrently(8, lambda: fetch(None, "SELECT 1"))
+
+    assert results == []
+    assert len(errors) == 8
+    assert all(isinstance(e, sqlite3.OperationalError) for e in errors)
+    assert len(calls) == 1
+    # Nothing was cached, so the next call runs the query again
+    with pytest.raises(sqlite3.OperationalError):
+        fetch(None, "SELECT 1")
+    assert len(calls) == 2
+
+
+def test_stale_result_is_served_during_one_background_refresh(cq, capsys):
+    cache = cq.QueryCache()
+    refreshing, release = threading.Event(), threading.Event()
+    calls = []
+
+    @cq.cache_query(cache=cache, ttl=0.05, stale_while_revalidate=60)
+    def fetch(conn, query):
+        calls.append(query)
+        if len(calls) > 1:
+            refreshing.set()
+            assert release.wait(5)
+        return conn.execute(query).fetchall()
+
+    query = "SELECT email FROM users WHERE id = 1"
+    conn = cq.InvalidatingConnection(sqlite3.connect('users.db'), cache, 'users.db')
+    assert fetch(conn, query) == [('john@example.com',)]
+    # Changed behind the cache's back, so only the refresh can see it
+    with sqlite3.connect('users.db') as other:
+        other.execute("UPDATE users SET email = 'john@new.example.com' WHERE id = 1")
+    time.sleep(0.1)
+
+    assert fetch(conn, query) == [('john@example.com',)]
+    assert refreshing.wait(5)
+    for _ in range(4):
+        assert fetch(conn, query) == [('john@example.com',)]
+    release.set()
+    deadline = time.monotonic() + 5
+    while cache.stats()['refreshes'] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    conn.close()
+
+    assert len(calls) == 2
+    stats = cache.stats()
+    assert stats['stale_hits'] == 5
+    assert stats['refreshes'] == 1
+    assert capsys.readouterr().out.count("Returning stale result while refreshing") == 5
+    assert cache.lookup(cq.cache_key(query, ((), {}), 'users.db')) == (cq.FRESH, [('john@new.example.com',)])
+
+
+# Shared tier
+
+@pytest.fixture
+def shared_caches(cq):
+    """Returns a function making QueryCaches that share one SQLite file, as processes would."""
+    def make(**options):
+        return cq.QueryCache(shared=cq.SharedCache('shared.db', **options))
+    return make
+
+
+def test_second_cache_sees_results_of_the_first(cq, shared_caches):
+    first, second = shared_caches(), shared_caches()
+    key = cq.cache_key("SELECT * FROM users")
+    first.set(key, [(1, 'John Doe')], {'users'}, ttl=60)
+
+    assert second.get(key) == (True, [(1, 'John Doe')])
+    assert second.shared.stats()['hits'] == 1
+    # Now in the second cache's own tier
+    assert second.get(key) == (True, [(1, 'John Doe')])
+    assert second.shared.stats()['hits'] == 1
+
+
+def test_invalidation_from_another_process(cq, shared_caches):
+    cache = shared_caches()
+    users, orders = cq.cache_key("SELECT * FROM users"), cq.cache_key("SELECT * FROM orders")
+    cache.set(users, [(1,)], {'users'})
+    cache.set(orders, [(2,)], {'orders'})
+    generation = cache.version()
+
+    child = multiprocessing.get_context('fork').Process(
+        target=lambda: cq.SharedCache('shared.db').invalidate_tables({'users'}))
+    child.start()
+    child.join()
+    assert child.exitcode == 0
+
+    other = shared_caches()
+    assert other.get(users) == (False, None)
+    assert other.get(orders) == (True, [(2,)])
+    # A result computed before that invalidation is not shared
+    cache.set(users, [(1,)], {'users'}, generation=generation)
+    assert other.get(users) == (False, None)
+
+
+def test_shared_hit_is_not_kept_after_a_racing_invalidation(cq, shared_caches):
+    cache = shared_caches()
+    key = cq.cache_key("SELECT * FROM users")
+    shared_caches().set(key, [(1,)], {'users'})
+    read = cache.shared.get
+
+    def get_then_invalidate(key):
+        found = read(key)
+        cache.invalidate_tables({'users'})   # A write lands between the read and the local copy
+        return found
+    cache.shared.get = get_then_invalidate
+
+    assert cache.get(key) == (True, [(1,)])
+    assert cache.stats()['entries'] == 0
+
+
+def test_shared_cache_evicts_least_recently_used_past_max_bytes(cq):
+    size = len(cq.dump_result([(1, 'x' * 100)]))
+    shared = cq.SharedCache('shared.db', max_bytes=size * 2)
+    for name in 'abc':
+        shared.set(name, [(1, 'x' * 100)], {'users'}, ttl=60)
+        time.sleep(0.01)
+
+    assert shared.get('a')[0] is False
+    assert shared.get('b')[0] is True
+    assert shared.get('c')[0] is True
+    stats = shared.stats()
+    assert stats['bytes'] == size * 2
+    assert stats['evictions'] == 1
+
+
+def test_warm_loads_most_recent_entries_oldest_first(cq, shared_caches):
+    source = shared_caches()
+    for name in 'abc':
+        source.set(name, [name], {'users'}, ttl=60)
+        time.sleep(0.01)
+
+    cache = cq.QueryCache(max_entries=2)
+    assert cq.SharedCache('shared.db').warm(cache) == 2
+    assert 'a' not in cache
+    # 'b' was loaded first, so it is the least recently used
+    cache.set('d', ['d'])
+    assert 'b' not in cache
+    assert cache.get('c') == (True, ['c'])
+
+
+def test_lease_holder_computes_while_others_wait(cq, shared_caches, capsys):
+    holder, waiter = shared_caches(), shared_caches()
+    calls = []
+
+    @cq.cache_query(cache=waiter)
+    def fetch(conn, query):
+        calls.append(query)
+        return [('computed here',)]
+
+    key = cq.cache_key("SELECT 1", ((), {}))
+    assert holder.shared.acquire_lease(key) is True
+    assert waiter.shared.acquire_lease(key) is False
+
+    def finish():
+        time.sleep(0.2)
+        holder.set(key, [('computed by the holder',)], {'users'})
+        holder.shared.release_lease(key)
+    thread = threading.Thread(target=finish)
+    thread.start()
+    result = fetch(None, "SELECT 1")
+    thread.join()
+
+    assert result == [('computed by the holder',)]
+    assert calls == []
+    assert waiter.shared.stats()['waits'] == 1
+    # The lease is free again
+    assert waiter.shared.acquire_lease(key) is True
+
+
+def test_invalidation_is_kept_while_the_file_is_locked(cq, shared_caches):
+    cache = shared_caches(timeout=0.2)
+    key = cq.cache_key("SELECT * FROM users")
+    cache.set(key, [(1,)], {'users'})
+    cache.clear()   # Only the shared copy is left
+
+    blocker = sqlite3.connect('shared.db', isolation_level=None)
+    blocker.execute("BEGIN IMMEDIATE")
+    cache.invalidate_tables({'users'})   # Does not raise into the write
+    assert cache.shared.stats()['errors'] == 1
+    # The stale shared entry is not read, and nothing new is stored
+    assert cache.get(key) == (False, None)
+    cache.set(cq.cache_key("SELECT 2"), [(2,)], {'orders'})
+    blocker.execute("ROLLBACK")
+    blocker.close()
+
+    other = shared_caches()
+    assert other.get(cq.cache_key("SELECT 2")) == (False, None)
+    assert cache.get(key) == (False, None)   # Applies the pending invalidation
+    assert other.get(key) == (False, None)
+    assert other.shared.generation() == 1
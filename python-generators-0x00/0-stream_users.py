@@ -1,42 +1,71 @@
 import mysql.connector
-from typing import Generator, Dict, Any
+from typing import Generator, Dict, Any, Optional, Union
+import seed  # Shared connection pool
+from records import LazyUserRow
 
 
-def stream_users() -> Generator[Dict[str, Any], None, None]:
+def stream_users(fetch_size: Optional[int] = None,
+                 adaptive: bool = False,
+                 checkpoint_file: Optional[str] = None,
+                 checkpoint_every: int = 10000,
+                 resume_from: Union[str, seed.StreamCheckpoint, None] = None,
+                 raw: bool = False) -> Generator[Dict[str, Any], None, None]:
     """
     Generator that streams rows from user_data table one by one
     
+    Args:
+        fetch_size: Buffer this many rows per fetchmany() round trip instead
+            of calling fetchone() for every row
+        adaptive: Size the fetchmany() buffer automatically from a byte
+            budget and the measured fetch time (overrides fetch_size)
+        checkpoint_file: Save the last processed user_id and the row count
+            to this file every checkpoint_every rows and at the end
+        checkpoint_every: Rows between checkpoint saves
+        resume_from: Checkpoint file (or StreamCheckpoint) of an earlier run;
+            streaming continues after its last user_id
+        raw: Read with the connector's raw cursor and yield
+            records.LazyUserRow views instead of dictionaries; a column is
+            decoded only when it is first accessed (age arrives as an integer)
+    
     Yields:
         Dictionary with user data: {'user_id': str, 'name': str, 'email': str, 'age': int}
+        (a LazyUserRow with the same keys in raw mode)
     
     Raises:
         Exception: If database connection or query fails
     """
+    checkpoint = seed.open_checkpoint(checkpoint_file, checkpoint_every, resume_from)
+    pool = seed.get_pool()
     connection = None
     cursor = None
+    rows = None
     
     try:
-        # Establish database connection
-        connection = mysql.connector.connect(
-            host='localhost',
-            user='root',      # Replace with your MySQL username
-            password='',      # Replace with your MySQL password
-            database='ALX_prodev'
-        )
+        # Borrow a connection from the shared pool
+        connection = pool.acquire()
         
         # Create a cursor that doesn't buffer all results
-        cursor = connection.cursor(buffered=False)
+        cursor = connection.cursor(buffered=False, raw=raw)
+        
+        # Execute query to get all users, in key order so a checkpoint can resume it
+        if checkpoint is not None and checkpoint.last_user_id is not None:
+            query = seed.select_users_sql(None, ["user_id > %s"], raw) + " ORDER BY user_id"
+            cursor.execute(query, (checkpoint.last_user_id,))
+        else:
+            query = seed.select_users_sql(None, (), raw) + " ORDER BY user_id"
+            cursor.execute(query)
         
-        # Execute query to get all users
-        query = "SELECT user_id, name, email, age FROM user_data"
-        cursor.execute(query)
+        if raw:
+            rows = seed.checkpointed(seed.fetch_rows(cursor, fetch_size, adaptive), checkpoint,
+                                     seed.raw_user_id)
+            # Wrap rows without decoding them; consumers decode what they read
+            for row in rows:
+                yield LazyUserRow(row)
+            return
         
         # Single loop to yield rows one by one
-        while True:
-            row = cursor.fetchone()
-            if row is None:
-                break
-            
+        rows = seed.checkpointed(seed.fetch_rows(cursor, fetch_size, adaptive), checkpoint)
+        for row in rows:
             # Convert row to dictionary
             user_dict = {
                 'user_id': row[0],
@@ -54,8 +83,10 @@ def stream_users() -> Generator[Dict[str, Any], None, None]:
         print(f"Unexpected error: {e}")
         raise
     finally:
-        # Clean up resources
+        # Clean up resources; closing the row stream saves the checkpoint
+        if rows is not None:
+            rows.close()
         if cursor:
             cursor.close()
         if connection:
-            connection.close()
+            pool.release(connection)
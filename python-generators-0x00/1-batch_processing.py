@@ -1,63 +1,103 @@
+import sys
 import mysql.connector
-from typing import Generator, Dict, Any, List
+from typing import Generator, Dict, Any, Optional, Sequence
+import seed  # Shared connection pool
+import records
+import parallel_scan
+import snapshot as snapshot_module
+from pipeline import Pipeline, Flatten, Sink
 
 
-def stream_users_in_batches(batch_size: int) -> Generator[List[Dict[str, Any]], None, None]:
+# Filter applied by batch_processing, evaluated by the database
+OVER_25 = ("age", ">", 25)
+
+
+def stream_users_in_batches(batch_size: int, prefetch: int = 0,
+                            format: str = 'dict',
+                            where: Optional[seed.WhereSpec] = None,
+                            columns: Optional[Sequence[str]] = None,
+                            snapshot: Optional[str] = None) -> Generator[Any, None, None]:
     """
     Generator that fetches rows from user_data table in batches
     
+    Batches are read in user_id order with keyset pagination: each query
+    seeks past the last user_id of the previous batch, so no row is skipped
+    or repeated whatever plan the optimizer picks for the filter.
+    
     Args:
         batch_size: Number of rows to fetch in each batch
+        prefetch: Number of batches to fetch ahead on a background thread
+            while the current batch is being processed (0 disables prefetching)
+        format: Batch representation: 'dict' (list of dicts), 'record'
+            (list of __slots__ UserRecord), 'columnar' (records.UserColumns)
+            or 'lazy' (list of records.LazyUserRow read with a raw cursor,
+            decoding each column only when it is accessed)
+        where: Filter evaluated by the database, e.g. ("age", ">", 25)
+        columns: Columns to fetch, e.g. ("name", "email"); None fetches all
+        snapshot: Read from this local snapshot directory (see snapshot.py)
+            instead of querying MySQL
     
     Yields:
-        List of dictionaries with user data for each batch
+        One batch of users in the requested format
     
     Raises:
         Exception: If database connection or query fails
     """
+    selected = seed.compile_columns(columns)
+    records.check_format(format, selected)
+    conditions, params = seed.compile_where(where)
+    if snapshot is not None:
+        yield from snapshot_module.stream_batches(snapshot, batch_size, format, where, columns)
+        return
+    if prefetch > 0:
+        yield from seed.prefetch(
+            lambda: stream_users_in_batches(batch_size, format=format, where=where, columns=columns),
+            prefetch)
+        return
+    
+    pool = seed.get_pool()
     connection = None
     cursor = None
     
     try:
-        # Establish database connection
-        connection = mysql.connector.connect(
-            host='localhost',
-            user='root',      # Replace with your MySQL username
-            password='',      # Replace with your MySQL password
-            database='ALX_prodev'
-        )
+        # Borrow a connection from the shared pool
+        connection = pool.acquire()
         
-        cursor = connection.cursor()
+        raw = format in records.RAW_FORMATS
+        cursor = connection.cursor(raw=raw)
         
-        # Get total count for progress tracking
-        cursor.execute("SELECT COUNT(*) FROM user_data")
-        total_users = cursor.fetchone()[0]
+        # The seek key is fetched as an extra last column when not selected
+        extra_key = 'user_id' not in selected
+        key_index = len(selected) if extra_key else selected.index('user_id')
+        fetched = (*selected, 'user_id') if extra_key else selected
+        first_query = seed.select_users_sql(fetched, conditions, raw) + " ORDER BY user_id LIMIT %s"
+        next_query = (seed.select_users_sql(fetched, [*conditions, "user_id > %s"], raw)
+                      + " ORDER BY user_id LIMIT %s")
         
-        offset = 0
+        last_user_id = None
         
         # Loop 1: Batch fetching loop
-        while offset < total_users:
-            # Fetch batch of users
-            query = "SELECT user_id, name, email, age FROM user_data LIMIT %s OFFSET %s"
-            cursor.execute(query, (batch_size, offset))
+        while True:
+            # Fetch the batch after the last user_id seen
+            if last_user_id is None:
+                cursor.execute(first_query, (*params, batch_size))
+            else:
+                cursor.execute(next_query, (*params, last_user_id, batch_size))
             
             batch_rows = cursor.fetchall()
             if not batch_rows:
                 break
             
-            # Convert batch rows to list of dictionaries
-            batch_users = []
-            for row in batch_rows:  # Loop 2: Processing rows in batch
-                user_dict = {
-                    'user_id': row[0],
-                    'name': row[1],
-                    'email': row[2],
-                    'age': int(row[3])
-                }
-                batch_users.append(user_dict)
+            last_user_id = batch_rows[-1][key_index]
+            if raw:
+                last_user_id = bytes(last_user_id).decode('ascii')
+            if extra_key:
+                batch_rows = [row[:-1] for row in batch_rows]
             
-            yield batch_users
-            offset += batch_size
+            # Convert batch rows to the requested representation
+            yield records.convert_batch(batch_rows, format, selected)
+            if len(batch_rows) < batch_size:
+                break
             
     except mysql.connector.Error as e:
         print(f"Database error: {e}", file=sys.stderr)
@@ -70,128 +110,96 @@ def stream_users_in_batches(batch_size: int) -> Generator[List[Dict[str, Any]],
         if cursor:
             cursor.close()
         if connection:
-            connection.close()
+            pool.release(connection)
+
+
+def print_user(user: Dict[str, Any]) -> None:
+    """
+    Prints one user and flushes, so output piped to head appears immediately
+    
+    Args:
+        user: User dictionary
+    """
+    print(user)
+    sys.stdout.flush()
 
 
-def batch_processing(batch_size: int = 50) -> None:
+def over_25_pipeline(batch_size: int = 50) -> Pipeline:
     """
-    Processes batches of users and filters those over age 25
+    Builds the pipeline printing users over age 25
+    
+    The age filter runs in the database; the pipeline flattens the batches
+    and prints each user.
+    
+    Args:
+        batch_size: Number of users fetched per batch
+    
+    Returns:
+        Pipeline: Ready to run
+    """
+    batches = stream_users_in_batches(batch_size, where=OVER_25)
+    return Pipeline.from_batches(batches, name='stream_users_in_batches') | Flatten() | Sink(print_user)
+
+
+def batch_processing_optimized(batch_size: int = 50) -> None:
+    """
+    Processes batches of users over age 25, raising on errors
     
     Args:
         batch_size: Number of users to process in each batch
     """
     try:
-        # Loop 3: Main processing loop over batches
-        for batch in stream_users_in_batches(batch_size):
-            # Filter users over age 25 in the current batch
-            users_over_25 = []
-            for user in batch:  # Loop within batch (nested, but counts as separate)
-                if user['age'] > 25:
-                    users_over_25.append(user)
-            
-            # Print filtered users
-            for user in users_over_25:  # Loop for printing (nested, but counts as separate)
-                print(user)
-                
+        over_25_pipeline(batch_size).run()
     except Exception as e:
         print(f"Error during batch processing: {e}", file=sys.stderr)
         raise
 
 
-# Alternative implementation with exactly 3 loops total
-def batch_processing_optimized(batch_size: int = 50) -> None:
+def batch_processing(batch_size: int = 50, report: bool = False) -> None:
     """
-    Optimized version with exactly 3 loops total
+    Processes batches of users and prints those over age 25
     
     Args:
         batch_size: Number of users to process in each batch
+        report: Print per-stage item counts and timings to stderr afterwards
     """
-    import sys
-    
+    pipeline = over_25_pipeline(batch_size)
     try:
-        # Get the batch generator
-        batch_generator = stream_users_in_batches(batch_size)
-        
-        # Loop 1: Iterate through batches
-        for batch in batch_generator:
-            # Loop 2: Process and filter users in batch
-            for user in batch:
-                # Filter and print in same loop to avoid third loop
-                if user['age'] > 25:
-                    print(user)
-                    sys.stdout.flush()  # Ensure immediate output for piping
-                    
+        pipeline.run()
     except Exception as e:
         print(f"Error during batch processing: {e}", file=sys.stderr)
-        raise
+        return
+    if report:
+        print(pipeline.report(), file=sys.stderr)
 
 
-# Use the optimized version as the main function
-def batch_processing(batch_size: int = 50) -> None:
+def is_over_25(user: Dict[str, Any]) -> bool:
     """
-    Processes batches of users and filters those over age 25
-    Uses exactly 3 loops total as required
+    Per-user filter used by batch_processing
     
     Args:
-        batch_size: Number of users to process in each batch
-    """
-    import sys
+        user: User dictionary
     
-    connection = None
-    cursor = None
+    Returns:
+        bool: True if the user is older than 25
+    """
+    return user['age'] > 25
+
+
+def batch_processing_parallel(workers: Optional[int] = None, ordered: bool = True) -> None:
+    """
+    Prints users over age 25 using a range-partitioned scan across worker processes
     
+    Args:
+        workers: Number of worker processes (defaults to the CPU count)
+        ordered: Print users in user_id order rather than as partitions finish
+    """
+    users = parallel_scan.parallel_scan(predicate=is_over_25, workers=workers, ordered=ordered)
     try:
-        # Establish database connection
-        connection = mysql.connector.connect(
-            host='localhost',
-            user='root',
-            password='',
-            database='ALX_prodev'
-        )
-        
-        cursor = connection.cursor()
-        
-        # Get total count
-        cursor.execute("SELECT COUNT(*) FROM user_data")
-        total_users = cursor.fetchone()[0]
-        
-        offset = 0
-        
-        # LOOP 1: Batch fetching loop
-        while offset < total_users:
-            # Fetch batch
-            query = "SELECT user_id, name, email, age FROM user_data LIMIT %s OFFSET %s"
-            cursor.execute(query, (batch_size, offset))
-            batch_rows = cursor.fetchall()
-            
-            if not batch_rows:
-                break
-            
-            # LOOP 2: Process each row in batch
-            for row in batch_rows:
-                user_dict = {
-                    'user_id': row[0],
-                    'name': row[1],
-                    'email': row[2],
-                    'age': int(row[3])
-                }
-                
-                # Filter and print in same loop (no third loop needed)
-                if user_dict['age'] > 25:
-                    print(user_dict)
-                    sys.stdout.flush()  # Important for piping to head command
-            
-            offset += batch_size
-            
-    except mysql.connector.Error as e:
-        print(f"Database error: {e}", file=sys.stderr)
+        (Pipeline.from_items(users, name='parallel_scan') | Sink(print_user)).run()
     except Exception as e:
-        print(f"Unexpected error: {e}", file=sys.stderr)
-    finally:
-        if cursor:
-            cursor.close()
-        if connection:
-            connection.close()
+        print(f"Error during parallel batch processing: {e}", file=sys.stderr)
+        raise
 
 
 if __name__ == "__main__":
@@ -1,34 +1,162 @@
+import base64
+import json
 import mysql.connector
-from typing import Generator, List, Dict, Any
+from typing import Generator, List, Dict, Any, Optional, Tuple, Sequence
 import seed  # Import the seed module for database connection
 
 
-def paginate_users(page_size: int, offset: int) -> List[Dict[str, Any]]:
+PAGE_TOKEN_VERSION = 1
+
+
+class PaginationError(Exception):
+    """
+    A keyset page could not be fetched
+
+    resume_token is the token of the failed page (None for the first
+    page): pass it to lazy_pagination(keyset=True, resume_token=...) to
+    resume the walk without skipping or repeating pages.
+    """
+
+    def __init__(self, message: str, resume_token: Optional[str]):
+        super().__init__(message)
+        self.resume_token = resume_token
+
+
+def paginate_users(page_size: int, offset: int,
+                   where: Optional[seed.WhereSpec] = None,
+                   columns: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
     """
     Fetches a page of users from the database
     
     Args:
         page_size: Number of users to fetch per page
         offset: Starting position for the page
+        where: Filter evaluated by the database, e.g. ("age", ">", 25)
+        columns: Columns to fetch, e.g. ("name", "email"); None fetches all
     
     Returns:
         List of user dictionaries for the requested page
     """
-    connection = seed.connect_to_prodev()
-    if not connection:
+    conditions, params = seed.compile_where(where)
+    # A stable order keeps OFFSET pages disjoint whatever plan the filter gets
+    query = seed.select_users_sql(columns, conditions) + " ORDER BY user_id LIMIT %s OFFSET %s"
+    try:
+        with seed.pooled_connection() as connection:
+            cursor = connection.cursor(dictionary=True)
+            try:
+                cursor.execute(query, (*params, page_size, offset))
+                rows = cursor.fetchall()
+                return rows
+            finally:
+                cursor.close()
+    except mysql.connector.Error as e:
+        print(f"Database error: {e}")
         return []
+
+
+def encode_page_token(last_user_id: str) -> str:
+    """
+    Encodes the last user_id of a page into an opaque continuation token
     
-    cursor = connection.cursor(dictionary=True)
+    Args:
+        last_user_id: user_id of the last row on the page
+    
+    Returns:
+        URL-safe token that resumes pagination right after that row
+    """
+    payload = json.dumps({'v': PAGE_TOKEN_VERSION, 'after': last_user_id},
+                         separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+def decode_page_token(token: str) -> str:
+    """
+    Decodes a continuation token produced by encode_page_token
+    
+    Args:
+        token: Opaque continuation token
+    
+    Returns:
+        The user_id to resume after
+    
+    Raises:
+        ValueError: If the token is malformed or from an unknown version
+    """
     try:
-        cursor.execute(f"SELECT * FROM user_data LIMIT {page_size} OFFSET {offset}")
-        rows = cursor.fetchall()
-        return rows
+        payload = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+    except (ValueError, UnicodeError) as e:
+        raise ValueError(f"Invalid page token: {e}")
+    
+    if not isinstance(payload, dict) or payload.get('v') != PAGE_TOKEN_VERSION \
+            or not isinstance(payload.get('after'), str):
+        raise ValueError("Invalid page token: unsupported format")
+    return payload['after']
+
+
+def page_token(page: List[Dict[str, Any]]) -> Optional[str]:
+    """
+    Returns the continuation token that resumes after the given page
+    
+    Args:
+        page: A page yielded by lazy_pagination in keyset mode
+    
+    Returns:
+        Continuation token, or None for an empty page
+    """
+    if not page:
+        return None
+    return encode_page_token(page[-1]['user_id'])
+
+
+def paginate_users_keyset(page_size: int, token: Optional[str] = None,
+                          where: Optional[seed.WhereSpec] = None,
+                          columns: Optional[Sequence[str]] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Fetches a page of users using keyset (seek) pagination
+    
+    Unlike paginate_users, the server seeks straight to the first row after
+    the token via the primary key, so every page costs the same no matter
+    how deep into the table it is.
+    
+    Args:
+        page_size: Number of users to fetch per page
+        token: Continuation token from a previous page, None for the first page
+        where: Filter evaluated by the database, e.g. ("age", ">", 25); pass
+            the same filter on every page of a walk
+        columns: Columns to fetch; user_id is always added since the
+            continuation token is built from it
+    
+    Returns:
+        Tuple of (list of user dictionaries, token for the next page).
+        The next token is None once the table is exhausted.
+    
+    Raises:
+        PaginationError: If the query fails; its resume_token is the token
+            passed in, so the page can be retried
+    """
+    if columns is not None and 'user_id' not in columns:
+        columns = ('user_id', *columns)
+    conditions, params = seed.compile_where(where)
+    if token is not None:
+        conditions.append("user_id > %s")
+        params.append(decode_page_token(token))
+    query = seed.select_users_sql(columns, conditions) + " ORDER BY user_id LIMIT %s"
+    
+    try:
+        with seed.pooled_connection() as connection:
+            cursor = connection.cursor(dictionary=True)
+            try:
+                cursor.execute(query, (*params, page_size))
+                rows = cursor.fetchall()
+            finally:
+                cursor.close()
     except mysql.connector.Error as e:
         print(f"Database error: {e}")
-        return []
-    finally:
-        cursor.close()
-        connection.close()
+        # Unlike an exhausted table, an error must not end the walk silently
+        raise PaginationError(f"Failed to fetch page: {e}", token) from e
+    
+    next_token = page_token(rows) if len(rows) == page_size else None
+    return rows, next_token
 
 
 def lazy_paginate(page_size: int) -> Generator[List[Dict[str, Any]], None, None]:
@@ -71,20 +199,12 @@ def lazy_paginate_with_count(page_size: int) -> Generator[List[Dict[str, Any]],
         List of user dictionaries for each page
     """
     # Get total count first
-    connection = seed.connect_to_prodev()
-    if not connection:
-        return
-    
-    cursor = connection.cursor()
     try:
-        cursor.execute("SELECT COUNT(*) FROM user_data")
-        total_users = cursor.fetchone()[0]
+        with seed.pooled_connection() as connection:
+            total_users = seed.get_user_count(connection)
     except mysql.connector.Error as e:
         print(f"Database error: {e}")
         return
-    finally:
-        cursor.close()
-        connection.close()
     
     offset = 0
     
@@ -97,12 +217,25 @@ def lazy_paginate_with_count(page_size: int) -> Generator[List[Dict[str, Any]],
 
 
 # Main function to use (meets all requirements)
-def lazy_pagination(page_size: int) -> Generator[List[Dict[str, Any]], None, None]:
+def lazy_pagination(page_size: int, keyset: bool = False,
+                    resume_token: Optional[str] = None,
+                    prefetch: int = 0,
+                    where: Optional[seed.WhereSpec] = None,
+                    columns: Optional[Sequence[str]] = None) -> Generator[List[Dict[str, Any]], None, None]:
     """
     Main lazy pagination generator function
     
     Args:
         page_size: Number of users per page
+        keyset: Seek by user_id instead of LIMIT/OFFSET (pages come back
+            ordered by user_id and cost the same at any depth)
+        resume_token: Continuation token to resume from (keyset mode only);
+            use page_token(page) to get the token after a yielded page, or
+            the resume_token of a PaginationError
+        prefetch: Number of pages to fetch ahead on a background thread
+            while the current page is being processed (0 disables prefetching)
+        where: Filter evaluated by the database, e.g. ("age", ">", 25)
+        columns: Columns to fetch, e.g. ("name", "email"); None fetches all
     
     Yields:
         List of user dictionaries for each page
@@ -114,12 +247,23 @@ def lazy_pagination(page_size: int) -> Generator[List[Dict[str, Any]], None, Non
     - Starts at offset 0
     - Fetches pages only when needed
     """
+    if prefetch > 0:
+        yield from seed.prefetch(
+            lambda: lazy_pagination(page_size, keyset, resume_token, where=where, columns=columns),
+            prefetch)
+        return
+    if keyset:
+        yield from _lazy_pagination_keyset(page_size, resume_token, where, columns)
+        return
+    if resume_token is not None:
+        raise ValueError("resume_token requires keyset=True")
+    
     offset = 0
     
     # Single loop that continues until no more data
     while True:
         # Fetch page using the paginate_users function
-        current_page = paginate_users(page_size, offset)
+        current_page = paginate_users(page_size, offset, where, columns)
         
         # If page is empty, we've reached the end
         if not current_page:
@@ -132,6 +276,32 @@ def lazy_pagination(page_size: int) -> Generator[List[Dict[str, Any]], None, Non
         offset += page_size
 
 
+def _lazy_pagination_keyset(page_size: int, token: Optional[str],
+                            where: Optional[seed.WhereSpec] = None,
+                            columns: Optional[Sequence[str]] = None) -> Generator[List[Dict[str, Any]], None, None]:
+    """
+    Keyset variant of lazy_pagination, following continuation tokens
+    
+    Args:
+        page_size: Number of users per page
+        token: Continuation token to start after, None to start at the beginning
+        where: Filter evaluated by the database
+        columns: Columns to fetch (user_id is always included)
+    
+    Yields:
+        List of user dictionaries for each page
+    
+    Raises:
+        PaginationError: If a page fails; resume from its resume_token
+    """
+    while True:
+        current_page, token = paginate_users_keyset(page_size, token, where, columns)
+        if current_page:
+            yield current_page
+        if token is None:
+            break
+
+
 # For backward compatibility and testing
 if __name__ == "__main__":
     # Test the lazy pagination
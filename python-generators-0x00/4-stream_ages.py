@@ -1,28 +1,35 @@
 import mysql.connector
-from typing import Generator, Tuple
+from typing import Generator, Tuple, Dict, Any, Optional
+import seed  # Shared connection pool
+import snapshot as snapshot_module
+from streaming_stats import StreamingStats
 
 
-def stream_user_ages() -> Generator[int, None, None]:
+def stream_user_ages(snapshot: Optional[str] = None) -> Generator[int, None, None]:
     """
     Generator that yields user ages one by one from the database
     
+    Args:
+        snapshot: Read ages from this local snapshot directory (see
+            snapshot.py) instead of querying MySQL
+    
     Yields:
         int: Age of each user
     
     Raises:
         Exception: If database connection or query fails
     """
+    if snapshot is not None:
+        yield from snapshot_module.stream_ages(snapshot)
+        return
+    
+    pool = seed.get_pool()
     connection = None
     cursor = None
     
     try:
-        # Establish database connection
-        connection = mysql.connector.connect(
-            host='localhost',
-            user='root',      # Replace with your MySQL username
-            password='',      # Replace with your MySQL password
-            database='ALX_prodev'
-        )
+        # Borrow a connection from the shared pool
+        connection = pool.acquire()
         
         # Use unbuffered cursor for memory efficiency
         cursor = connection.cursor(buffered=False)
@@ -51,18 +58,30 @@ def stream_user_ages() -> Generator[int, None, None]:
         if cursor:
             cursor.close()
         if connection:
-            connection.close()
+            pool.release(connection)
 
 
-def calculate_average_age() -> float:
+def calculate_average_age(pushdown: bool = False, snapshot: Optional[str] = None) -> float:
     """
     Calculates the average age of all users without loading entire dataset into memory
     
+    Args:
+        pushdown: Let the database compute AVG(age) and return a single row
+            instead of streaming every age to the client
+        snapshot: Average the memory-mapped age column of this local
+            snapshot directory instead of querying MySQL
+    
     Returns:
         float: Average age of all users
     
     Uses the stream_user_ages generator to process ages one by one
     """
+    if pushdown:
+        return float(query_age_stats()['mean'])
+    if snapshot is not None:
+        # 0.0 for an empty snapshot, like an empty table
+        return snapshot_module.age_stats(snapshot).mean
+    
     total_age = 0
     user_count = 0
     
@@ -79,30 +98,84 @@ def calculate_average_age() -> float:
     return average_age
 
 
-def calculate_average_age_with_progress() -> float:
+def query_age_stats() -> Dict[str, Any]:
+    """
+    Computes count, mean, population standard deviation, min and max of
+    the ages in a single aggregate query
+    
+    Returns:
+        Dictionary with count, mean, stddev, min and max (mean is 0.0 and
+        min/max are None for an empty table)
+    
+    Raises:
+        Exception: If database connection or query fails
+    """
+    try:
+        with seed.pooled_connection() as connection:
+            cursor = connection.cursor()
+            try:
+                cursor.execute(
+                    "SELECT COUNT(*), AVG(age), STDDEV_POP(age), MIN(age), MAX(age) FROM user_data"
+                )
+                count, mean, stddev, min_age, max_age = cursor.fetchone()
+            finally:
+                cursor.close()
+    except mysql.connector.Error as e:
+        print(f"Database error: {e}")
+        raise Exception(f"Failed to aggregate user ages: {e}")
+    
+    return {
+        'count': count,
+        'mean': float(mean) if mean is not None else 0.0,
+        'stddev': float(stddev) if stddev is not None else 0.0,
+        'min': int(min_age) if min_age is not None else None,
+        'max': int(max_age) if max_age is not None else None,
+    }
+
+
+def calculate_age_stats(snapshot: Optional[str] = None) -> StreamingStats:
+    """
+    Computes full age statistics (variance, histogram, exact percentiles)
+    in one pass over stream_user_ages
+    
+    Args:
+        snapshot: Read ages from this local snapshot directory instead of MySQL
+    
+    Returns:
+        StreamingStats: Accumulator holding the statistics of all ages
+    """
+    if snapshot is not None:
+        return snapshot_module.age_stats(snapshot)
+    stats = StreamingStats()
+    stats.update(stream_user_ages())
+    return stats
+
+
+def calculate_average_age_with_progress(progress_every: int = 1000) -> float:
     """
     Alternative implementation that shows progress during calculation
     
+    Running statistics come from the same single-pass accumulator, so the
+    progress report costs no extra passes over the data.
+    
+    Args:
+        progress_every: Print running statistics every this many users
+    
     Returns:
         float: Average age of all users
     """
-    total_age = 0
-    user_count = 0
+    stats = StreamingStats()
     
     for age in stream_user_ages():
-        total_age += age
-        user_count += 1
+        stats.add(age)
         
-        # Show progress every 1000 users
-        if user_count % 1000 == 0:
-            current_avg = total_age / user_count
-            print(f"Processed {user_count} users... Current average: {current_avg:.2f}")
-    
-    if user_count == 0:
-        return 0.0
+        # Show progress every progress_every users
+        if stats.count % progress_every == 0:
+            print(f"Processed {stats.count} users... Current average: {stats.mean:.2f} "
+                  f"(stddev {stats.stddev:.2f}, min {stats.min}, max {stats.max}, "
+                  f"median {stats.median})")
     
-    average_age = total_age / user_count
-    return average_age
+    return stats.mean
 
 
 # Main execution
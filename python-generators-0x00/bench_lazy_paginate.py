@@ -0,0 +1,108 @@
+#!/usr/bin/python3
+"""
+Page-depth benchmark: LIMIT/OFFSET pagination vs keyset pagination
+
+Fetches a single page at increasing depths with both strategies and prints
+the median latency of each. OFFSET latency grows with depth because the
+server has to walk past every skipped row; keyset latency stays flat.
+
+Usage: ./bench_lazy_paginate.py [page_size] [repeats]
+"""
+
+import statistics
+import sys
+import time
+from typing import Callable, List
+
+import seed
+
+lazy = __import__('2-lazy_paginate')
+
+
+def _median_seconds(fetch: Callable[[], object], repeats: int) -> float:
+    """
+    Runs fetch() repeats times and returns the median wall-clock time
+
+    Args:
+        fetch: Zero-argument callable performing one page fetch
+        repeats: Number of timed runs
+
+    Returns:
+        float: Median duration in seconds
+    """
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fetch()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def _depths(total_pages: int) -> List[int]:
+    """
+    Returns page depths spread geometrically over the table
+
+    Args:
+        total_pages: Number of pages in the table
+
+    Returns:
+        List of zero-based page numbers to benchmark
+    """
+    depths = []
+    depth = 1
+    while depth < total_pages:
+        depths.append(depth)
+        depth *= 10
+    if total_pages > 1:
+        depths.append(total_pages - 1)
+    return [0] + depths
+
+
+def run_benchmark(page_size: int = 100, repeats: int = 5) -> None:
+    """
+    Prints OFFSET vs keyset page latency at increasing page depths
+
+    Args:
+        page_size: Number of users per page
+        repeats: Number of timed fetches per depth and strategy
+    """
+    connection = seed.connect_to_prodev()
+    if not connection:
+        print("Failed to connect to ALX_prodev database")
+        return
+
+    total_users = seed.get_user_count(connection)
+    total_pages = (total_users + page_size - 1) // page_size
+    print(f"{total_users} users, page size {page_size}, {repeats} runs per point")
+    print(f"{'page':>10} {'offset ms':>12} {'keyset ms':>12} {'speedup':>9}")
+
+    cursor = connection.cursor()
+    try:
+        for depth in _depths(total_pages):
+            offset = depth * page_size
+            token = None
+            if depth > 0:
+                # Resolve the key that ends the previous page (untimed setup)
+                cursor.execute(
+                    "SELECT user_id FROM user_data ORDER BY user_id LIMIT 1 OFFSET %s",
+                    (offset - 1,)
+                )
+                token = lazy.encode_page_token(cursor.fetchone()[0])
+
+            offset_time = _median_seconds(
+                lambda: lazy.paginate_users(page_size, offset), repeats)
+            keyset_time = _median_seconds(
+                lambda: lazy.paginate_users_keyset(page_size, token), repeats)
+
+            speedup = offset_time / keyset_time if keyset_time else float('inf')
+            print(f"{depth:>10} {offset_time * 1000:>12.2f} "
+                  f"{keyset_time * 1000:>12.2f} {speedup:>8.1f}x")
+    finally:
+        cursor.close()
+        connection.close()
+
+
+if __name__ == "__main__":
+    page_size = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    run_benchmark(page_size, repeats)
@@ -0,0 +1,80 @@
+#!/usr/bin/python3
+"""
+Rows-per-second benchmark for the row fetch strategies of seed.stream_users
+
+Streams the whole user_data table once with fetchone(), once with a fixed
+fetchmany() size, once with the adaptive fetchmany() sizer and once with
+the raw cursor and lazy row views, reading the age of every row, and
+prints the throughput of each.
+
+Usage: ./bench_stream_users.py [fixed_fetch_size] [repeats]
+"""
+
+import sys
+import time
+from typing import Any, Dict
+
+import seed
+
+
+def _rows_per_second(repeats: int, **stream_options: Any) -> float:
+    """
+    Streams the table repeats times and returns the best throughput
+
+    Args:
+        repeats: Number of full passes
+        **stream_options: Keyword arguments for seed.stream_users
+
+    Returns:
+        float: Best rows per second over all passes
+    """
+    best = 0.0
+    for _ in range(repeats):
+        with seed.pooled_connection() as connection:
+            start = time.perf_counter()
+            rows = 0
+            if stream_options.get('raw'):
+                for row in seed.stream_users(connection, **stream_options):
+                    row['age']
+                    rows += 1
+            else:
+                for row in seed.stream_users(connection, **stream_options):
+                    int(row[3])
+                    rows += 1
+            elapsed = time.perf_counter() - start
+        if elapsed > 0:
+            best = max(best, rows / elapsed)
+    return best
+
+
+def run_benchmark(fixed_fetch_size: int = 1000, repeats: int = 3) -> Dict[str, float]:
+    """
+    Prints the throughput of fetchone, fixed fetchmany, adaptive fetchmany
+    and adaptive fetchmany on a raw cursor with lazy rows
+
+    Args:
+        fixed_fetch_size: Batch size for the fixed fetchmany run
+        repeats: Number of full passes per strategy
+
+    Returns:
+        Dictionary mapping strategy name to rows per second
+    """
+    results = {
+        'fetchone': _rows_per_second(repeats),
+        f'fetchmany({fixed_fetch_size})': _rows_per_second(repeats, fetch_size=fixed_fetch_size),
+        'adaptive fetchmany': _rows_per_second(repeats, adaptive=True),
+        'raw + lazy rows': _rows_per_second(repeats, adaptive=True, raw=True),
+    }
+
+    baseline = results['fetchone']
+    print(f"\n{'strategy':<22} {'rows/s':>12} {'vs fetchone':>12}")
+    for name, rate in results.items():
+        ratio = rate / baseline if baseline else float('inf')
+        print(f"{name:<22} {rate:>12,.0f} {ratio:>11.2f}x")
+    return results
+
+
+if __name__ == "__main__":
+    fixed_fetch_size = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    run_benchmark(fixed_fetch_size, repeats)
@@ -0,0 +1,240 @@
+#!/usr/bin/python3
+"""
+Change feed over user_data
+
+tail_changes() polls for rows whose updated_at moved past a durable
+high-water mark, using the (updated_at, user_id) keyset
+
+    WHERE updated_at > %s OR (updated_at = %s AND user_id > %s)
+    ORDER BY updated_at, user_id
+
+served by idx_updated_at, and yields only those rows. Polling speeds up
+while changes keep arriving and backs off exponentially while the table is
+quiet. The high-water mark is saved atomically to a JSON file, so a
+restarted consumer continues where it stopped.
+
+Deletes leave no row behind and are not reported; consumers that need
+them must reconcile separately (e.g. with seed.diff_users).
+
+Usage: ./change_feed.py STATE_FILE
+"""
+
+import datetime
+import json
+import sys
+import threading
+import time
+from typing import Any, Dict, Generator, Optional
+
+import seed
+
+
+class HighWaterMark:
+    """
+    Position of a change-feed consumer: the (updated_at, user_id) of the
+    last change it finished with, and the number of changes seen
+
+    Saved like seed.StreamCheckpoint, through seed.write_json_atomic.
+    """
+
+    def __init__(self, path: Optional[str] = None, updated_at: Optional[str] = None,
+                 user_id: Optional[str] = None, changes: int = 0):
+        """
+        Args:
+            path: State file to write, None to keep the mark in memory only
+            updated_at: updated_at of the last processed change, as
+                'YYYY-MM-DD HH:MM:SS.ffffff'
+            user_id: user_id of the last processed change
+            changes: Number of changes processed so far
+        """
+        self.path = path
+        self.updated_at = updated_at
+        self.user_id = user_id
+        self.changes = changes
+
+    @classmethod
+    def load(cls, path: str) -> 'HighWaterMark':
+        """
+        Reads a state file; a missing file gives an empty mark
+
+        Args:
+            path: State file written by a previous consumer
+
+        Returns:
+            HighWaterMark: The saved position
+        """
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                state = json.load(file)
+        except FileNotFoundError:
+            return cls(path)
+        return cls(path, state.get('updated_at'), state.get('user_id'), int(state.get('changes', 0)))
+
+    def advance(self, updated_at: datetime.datetime, user_id: str) -> None:
+        """
+        Records that the consumer is done with one change
+
+        Args:
+            updated_at: updated_at of the processed row
+            user_id: user_id of the processed row
+        """
+        self.updated_at = updated_at.isoformat(sep=' ', timespec='microseconds')
+        self.user_id = user_id
+        self.changes += 1
+
+    def save(self) -> None:
+        """Writes the current position to the state file, if there is one"""
+        if self.path is not None:
+            seed.write_json_atomic(self.path, {
+                'updated_at': self.updated_at,
+                'user_id': self.user_id,
+                'changes': self.changes,
+                'saved_at': time.time(),
+            })
+
+
+CHANGE_COLUMNS = "user_id, name, email, age, updated_at"
+
+
+def _poll(mark: HighWaterMark, batch_size: int, settle_seconds: float) -> list:
+    """
+    Fetches up to batch_size changes after the mark
+
+    Rows younger than settle_seconds are left for a later poll: a
+    transaction can commit after a newer one and would otherwise land
+    behind the mark.
+
+    Returns:
+        List of (user_id, name, email, age, updated_at) rows
+    """
+    conditions = ["updated_at <= NOW(6) - INTERVAL %s MICROSECOND"]
+    params: list = [int(settle_seconds * 1_000_000)]
+    if mark.updated_at is not None:
+        conditions.append("(updated_at > %s OR (updated_at = %s AND user_id > %s))")
+        params += [mark.updated_at, mark.updated_at, mark.user_id or '']
+    query = (f"SELECT {CHANGE_COLUMNS} FROM user_data WHERE {' AND '.join(conditions)} "
+             "ORDER BY updated_at, user_id LIMIT %s")
+
+    # A fresh pooled connection per poll: release() ends the transaction, so
+    # every poll reads a new snapshot instead of a REPEATABLE READ view
+    with seed.pooled_connection() as connection:
+        cursor = connection.cursor()
+        try:
+            cursor.execute(query, (*params, batch_size))
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+
+def latest_mark(path: Optional[str] = None) -> HighWaterMark:
+    """
+    Returns a mark positioned at the newest existing change
+
+    Starting a feed from it skips the history and reports only changes
+    made from now on.
+
+    Args:
+        path: State file for the mark
+
+    Returns:
+        HighWaterMark: Mark at the greatest (updated_at, user_id)
+    """
+    with seed.pooled_connection() as connection:
+        cursor = connection.cursor()
+        try:
+            cursor.execute("SELECT updated_at, user_id FROM user_data "
+                           "ORDER BY updated_at DESC, user_id DESC LIMIT 1")
+            row = cursor.fetchone()
+        finally:
+            cursor.close()
+    mark = HighWaterMark(path)
+    if row is not None:
+        mark.advance(row[0], row[1])
+        mark.changes = 0
+    return mark
+
+
+def tail_changes(state_file: Optional[str] = None,
+                 mark: Optional[HighWaterMark] = None,
+                 batch_size: int = 1000,
+                 min_interval: float = 0.05,
+                 max_interval: float = 5.0,
+                 settle_seconds: float = 1.0,
+                 save_every: int = 1000,
+                 stop_when_idle: bool = False,
+                 stop: Optional[threading.Event] = None) -> Generator[Dict[str, Any], None, None]:
+    """
+    Generator that yields user_data rows as they are inserted or updated
+
+    The mark advances once the consumer asks for the next change, so a
+    change is never skipped by a crash while it is being processed; it may
+    be delivered again after one (at-least-once delivery).
+
+    Args:
+        state_file: File holding the high-water mark; loaded when it exists
+            and saved every save_every changes, whenever the feed goes
+            idle and when the generator is closed
+        mark: Mark to start from instead of state_file (e.g. latest_mark());
+            it is saved to its own path
+        batch_size: Changes fetched per poll
+        min_interval: Seconds between polls while changes keep arriving
+        max_interval: Longest wait between polls while the table is quiet
+        settle_seconds: Ignore changes younger than this (see _poll)
+        save_every: Changes between saves of the mark
+        stop_when_idle: Return once a poll finds no changes (catch-up mode)
+        stop: Event that ends the feed when set; also interrupts the wait
+
+    Yields:
+        Dictionary per change: {'user_id', 'name', 'email', 'age', 'updated_at'}
+
+    Example:
+        >>> for change in tail_changes('user_data.feed.json'):
+        ...     cache[change['user_id']] = change
+    """
+    if mark is None:
+        mark = HighWaterMark.load(state_file) if state_file else HighWaterMark()
+    stop = stop or threading.Event()
+    interval = min_interval
+    unsaved = 0
+
+    try:
+        while not stop.is_set():
+            rows = _poll(mark, batch_size, settle_seconds)
+            for user_id, name, email, age, updated_at in rows:
+                yield {'user_id': user_id, 'name': name, 'email': email,
+                       'age': int(age), 'updated_at': updated_at}
+                mark.advance(updated_at, user_id)
+                unsaved += 1
+                if unsaved >= save_every:
+                    mark.save()
+                    unsaved = 0
+
+            if len(rows) == batch_size:
+                # More changes are waiting; poll again right away
+                interval = min_interval
+                continue
+            if unsaved:
+                mark.save()
+                unsaved = 0
+            if not rows:
+                if stop_when_idle:
+                    return
+                interval = min(interval * 2, max_interval)
+            else:
+                interval = min_interval
+            stop.wait(interval)
+    finally:
+        if unsaved:
+            mark.save()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: ./change_feed.py STATE_FILE")
+        sys.exit(1)
+    try:
+        for change in tail_changes(sys.argv[1]):
+            print(change)
+            sys.stdout.flush()
+    except KeyboardInterrupt:
+        pass
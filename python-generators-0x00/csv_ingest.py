@@ -0,0 +1,234 @@
+#!/usr/bin/python3
+"""
+Parallel chunked CSV ingestion into user_data
+
+The CSV file is memory-mapped and cut into byte ranges that end on newline
+boundaries. Worker processes parse the ranges into (user_id, name, email,
+age) tuples with csv.reader (no per-row dictionaries), and loader threads,
+each with its own connection, insert the parsed batches as multi-row
+INSERT IGNORE statements.
+
+The split assumes no quoted field contains a newline, which holds for the
+user_data exports (and for files written by datagen.py).
+"""
+
+import csv
+import io
+import mmap
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, List, Optional, Sequence, Tuple, Union
+
+import seed
+
+
+Chunk = Tuple[str, int, int]           # (path, start offset, end offset)
+
+
+def read_header(path: str) -> Tuple[List[str], int]:
+    """
+    Reads the header row of a CSV file
+
+    Args:
+        path: CSV file path
+
+    Returns:
+        Tuple of (header fields, byte offset of the first data row)
+    """
+    with open(path, 'rb') as file:
+        line = file.readline()
+    return next(csv.reader([line.decode('utf-8-sig')])), len(line)
+
+
+def split_csv(path: str, chunk_bytes: int = 16 << 20) -> List[Chunk]:
+    """
+    Cuts the data rows of a CSV file into ranges ending on newline boundaries
+
+    Args:
+        path: CSV file path
+        chunk_bytes: Approximate size of each range
+
+    Returns:
+        List of (path, start, end) byte ranges covering every data row
+    """
+    _, start = read_header(path)
+    size = os.path.getsize(path)
+    if size <= start:
+        return []
+
+    chunks = []
+    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        while start < size:
+            end = min(start + chunk_bytes, size)
+            if end < size:
+                newline = mm.find(b'\n', end - 1)
+                end = size if newline == -1 else newline + 1
+            chunks.append((path, start, end))
+            start = end
+    return chunks
+
+
+def parse_chunk(chunk: Chunk, header: Sequence[str], batch_size: int) -> List[List[Any]]:
+    """
+    Parses one byte range into flattened insert batches (runs in a worker process)
+
+    Args:
+        chunk: (path, start, end) byte range from split_csv
+        header: Header row of the file
+        batch_size: Rows per batch
+
+    Returns:
+        List of batches; each batch is a flat parameter list for
+        seed.multi_row_insert_sql(len(batch) // 4)
+    """
+    path, start, end = chunk
+    parse = seed.csv_row_parser(header)
+    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        text = mm[start:end].decode('utf-8')
+
+    batches = []
+    batch: List[Any] = []
+    limit = batch_size * 4
+    for fields in csv.reader(io.StringIO(text, newline='')):
+        if not fields:
+            continue
+        batch.extend(parse(fields))
+        if len(batch) >= limit:
+            batches.append(batch)
+            batch = []
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class _Loader(threading.Thread):
+    """Loader thread inserting batches from a queue on its own connection"""
+
+    def __init__(self, batches: queue.Queue, commit_every: int, failed: threading.Event):
+        super().__init__(name='csv-loader', daemon=True)
+        self.batches = batches
+        self.commit_every = commit_every
+        self.failed = failed
+        self.rows = 0
+        self.error: Optional[BaseException] = None
+
+    def run(self) -> None:
+        connection = None
+        cursor = None
+        try:
+            connection = seed.connect_to_prodev()
+            if connection is None:
+                raise RuntimeError("Loader failed to connect to ALX_prodev")
+            connection.autocommit = False
+            cursor = connection.cursor()
+            pending = 0
+            while True:
+                batch = self.batches.get()
+                if batch is None:
+                    break
+                rows = len(batch) // 4
+                cursor.execute(seed.multi_row_insert_sql(rows), batch)
+                pending += rows
+                if pending >= self.commit_every:
+                    connection.commit()
+                    self.rows += pending
+                    pending = 0
+            connection.commit()
+            self.rows += pending
+        except BaseException as e:
+            self.error = e
+            self.failed.set()
+            if connection is not None:
+                try:
+                    connection.rollback()
+                except Exception:
+                    pass
+            # Keep draining so the producer never blocks on a dead loader
+            while self.batches.get() is not None:
+                pass
+        finally:
+            if cursor:
+                cursor.close()
+            if connection:
+                connection.close()
+
+
+def parallel_insert_data(csv_files: Union[str, Sequence[str]], parse_workers: Optional[int] = None,
+                         loaders: int = 4, batch_size: int = 2000, commit_every: int = 50000,
+                         chunk_bytes: int = 16 << 20, progress_every: float = 5.0) -> int:
+    """
+    Loads one or more CSV files into user_data with parallel parsing and loading
+
+    Args:
+        csv_files: CSV path or list of paths (e.g. shards from datagen.py)
+        parse_workers: Parser processes (defaults to the CPU count)
+        loaders: Number of loader connections inserting in parallel
+        batch_size: Rows per INSERT statement
+        commit_every: Rows per transaction on each loader connection
+        chunk_bytes: Approximate bytes of CSV handed to a parser at a time
+        progress_every: Seconds between rows/sec progress reports
+
+    Returns:
+        int: Number of rows sent to the database (duplicates are ignored by the server)
+
+    Raises:
+        Exception: The first error raised by a loader; batches committed
+            before it stay in the table
+    """
+    paths = [csv_files] if isinstance(csv_files, str) else list(csv_files)
+    parse_workers = parse_workers or os.cpu_count() or 1
+
+    tasks = []
+    for path in paths:
+        header, _ = read_header(path)
+        tasks.extend((chunk, header) for chunk in split_csv(path, chunk_bytes))
+
+    # Bounded so parsed batches cannot pile up faster than the loaders insert them
+    batches: queue.Queue = queue.Queue(maxsize=loaders * 4)
+    failed = threading.Event()
+    workers = [_Loader(batches, commit_every, failed) for _ in range(loaders)]
+    for worker in workers:
+        worker.start()
+
+    start = time.perf_counter()
+    last_report = start
+    sent = 0
+    try:
+        with ProcessPoolExecutor(max_workers=parse_workers) as executor:
+            # Keep a bounded window of parse tasks in flight, consumed in order
+            in_flight = []
+            next_task = 0
+            while (next_task < len(tasks) or in_flight) and not failed.is_set():
+                while next_task < len(tasks) and len(in_flight) < parse_workers * 2:
+                    chunk, header = tasks[next_task]
+                    in_flight.append(executor.submit(parse_chunk, chunk, header, batch_size))
+                    next_task += 1
+                for batch in in_flight.pop(0).result():
+                    if failed.is_set():
+                        break
+                    batches.put(batch)
+                    sent += len(batch) // 4
+
+                now = time.perf_counter()
+                if now - last_report >= progress_every:
+                    print(f"{sent} rows parsed and queued ({sent / (now - start):,.0f} rows/s)")
+                    last_report = now
+            for future in in_flight:
+                future.cancel()
+    finally:
+        for _ in workers:
+            batches.put(None)
+        for worker in workers:
+            worker.join()
+
+    for worker in workers:
+        if worker.error is not None:
+            raise worker.error
+
+    elapsed = time.perf_counter() - start
+    print(f"Loaded {sent} rows from {len(paths)} file(s) in {elapsed:.1f}s "
+          f"({sent / max(elapsed, 1e-9):,.0f} rows/s)")
+    return sent
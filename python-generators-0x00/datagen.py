@@ -0,0 +1,205 @@
+#!/usr/bin/python3
+"""
+Fast, reproducible synthetic user_data generator
+
+Faker is only used to build small pools of first names, last names and
+email domains. Rows are then assembled from those pools in bulk with a
+seeded random.Random, and large datasets are split into CSV shards written
+by separate processes. Each shard gets its own seed derived from the base
+seed, so the same arguments always produce the same files.
+"""
+
+import csv
+import os
+import random
+import re
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence
+
+
+FIELDNAMES = ['user_id', 'name', 'email', 'age']
+MIN_AGE = 18
+MAX_AGE = 100
+
+# Rows generated and written per chunk inside a shard
+CHUNK_ROWS = 10000
+
+
+def build_pools(seed: int = 0, names: int = 2000, domains: int = 200) -> Dict[str, List[str]]:
+    """
+    Builds the value pools rows are assembled from
+
+    Args:
+        seed: Seed for Faker, so the pools are reproducible
+        names: Number of first and of last names to draw
+        domains: Number of email domains to draw
+
+    Returns:
+        Dictionary with 'first_names', 'last_names' and 'domains' lists
+    """
+    from faker import Faker
+
+    fake = Faker()
+    fake.seed_instance(seed)
+    return {
+        'first_names': sorted({fake.first_name() for _ in range(names)}),
+        'last_names': sorted({fake.last_name() for _ in range(names)}),
+        'domains': sorted({fake.free_email_domain() for _ in range(domains // 2)} |
+                          {fake.domain_name() for _ in range(domains - domains // 2)}),
+    }
+
+
+@lru_cache(maxsize=None)
+def _slug(name: str) -> str:
+    """Lower-cases a name and strips characters not allowed in an email local part"""
+    return re.sub(r'[^a-z]', '', name.lower())
+
+
+def shard_seed(seed: int, shard: int) -> int:
+    """
+    Derives the deterministic seed of one shard
+
+    Args:
+        seed: Base seed of the dataset
+        shard: Shard number
+
+    Returns:
+        int: Seed for the shard's random.Random
+    """
+    return seed * 1_000_003 + shard
+
+
+def generate_rows(rng: random.Random, pools: Dict[str, List[str]], count: int) -> List[tuple]:
+    """
+    Assembles count rows from the pools, drawing each column in bulk
+
+    Args:
+        rng: Seeded random generator
+        pools: Pools from build_pools
+        count: Number of rows
+
+    Returns:
+        List of (user_id, name, email, age) tuples
+    """
+    firsts = rng.choices(pools['first_names'], k=count)
+    lasts = rng.choices(pools['last_names'], k=count)
+    domains = rng.choices(pools['domains'], k=count)
+    suffixes = rng.choices(range(1000), k=count)
+    ages = rng.choices(range(MIN_AGE, MAX_AGE + 1), k=count)
+    bits = rng.getrandbits
+
+    rows = []
+    for first, last, domain, suffix, age in zip(firsts, lasts, domains, suffixes, ages):
+        rows.append((
+            str(uuid.UUID(int=bits(128), version=4)),
+            f"{first} {last}",
+            f"{_slug(first)}.{_slug(last)}{suffix}@{domain}",
+            age,
+        ))
+    return rows
+
+
+def write_shard(path: str, pools: Dict[str, List[str]], count: int, seed: int) -> str:
+    """
+    Writes one CSV shard of count rows
+
+    Args:
+        path: Output CSV path
+        pools: Pools from build_pools
+        count: Number of rows in the shard
+        seed: Seed of the shard's random generator
+
+    Returns:
+        str: The path written
+    """
+    rng = random.Random(seed)
+    with open(path, 'w', newline='', encoding='utf-8', buffering=1 << 20) as file:
+        writer = csv.writer(file)
+        writer.writerow(FIELDNAMES)
+        remaining = count
+        while remaining > 0:
+            chunk = min(CHUNK_ROWS, remaining)
+            writer.writerows(generate_rows(rng, pools, chunk))
+            remaining -= chunk
+    return path
+
+
+def write_sample_csv(csv_file: str, num_records: int, seed: Optional[int] = None,
+                     pools: Optional[Dict[str, List[str]]] = None) -> str:
+    """
+    Writes a single CSV file of num_records synthetic users in this process
+
+    Args:
+        csv_file: Output CSV path
+        num_records: Number of rows
+        seed: Base seed; None picks a random one
+        pools: Pools to reuse (built from the seed if omitted)
+
+    Returns:
+        str: The path written
+    """
+    seed = random.randrange(1 << 32) if seed is None else seed
+    pools = pools or build_pools(seed)
+    return write_shard(csv_file, pools, num_records, shard_seed(seed, 0))
+
+
+def generate_sample_shards(output_dir: str, num_records: int, shards: Optional[int] = None,
+                           seed: int = 0, workers: Optional[int] = None,
+                           prefix: str = 'user_data') -> List[str]:
+    """
+    Generates a large synthetic dataset as CSV shards written in parallel
+
+    The same num_records, shards and seed always produce identical files,
+    whatever the number of workers.
+
+    Args:
+        output_dir: Directory for the shards (created if missing)
+        num_records: Total number of rows
+        shards: Number of CSV files (defaults to the worker count)
+        seed: Base seed of the dataset
+        workers: Number of processes (defaults to the CPU count)
+        prefix: File name prefix; shards are named '<prefix>-0000.csv', ...
+
+    Returns:
+        List of shard paths, in shard order
+    """
+    workers = workers or os.cpu_count() or 1
+    shards = shards or workers
+    os.makedirs(output_dir, exist_ok=True)
+    pools = build_pools(seed)
+
+    counts = _split(num_records, shards)
+    paths = [os.path.join(output_dir, f"{prefix}-{shard:04d}.csv") for shard in range(shards)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(write_shard, path, pools, count, shard_seed(seed, shard))
+            for shard, (path, count) in enumerate(zip(paths, counts))
+        ]
+        for future in futures:
+            future.result()
+
+    print(f"Generated {num_records} records in {shards} shards under '{output_dir}'")
+    return paths
+
+
+def _split(total: int, parts: int) -> Sequence[int]:
+    """Splits total into parts near-equal counts"""
+    base, extra = divmod(total, parts)
+    return [base + (1 if i < extra else 0) for i in range(parts)]
+
+
+if __name__ == "__main__":
+    import sys
+
+    # Usage: ./datagen.py <output_dir> <num_records> [shards] [seed]
+    if len(sys.argv) < 3:
+        print("Usage: ./datagen.py <output_dir> <num_records> [shards] [seed]")
+        sys.exit(1)
+    generate_sample_shards(
+        sys.argv[1],
+        int(sys.argv[2]),
+        shards=int(sys.argv[3]) if len(sys.argv) > 3 else None,
+        seed=int(sys.argv[4]) if len(sys.argv) > 4 else 0,
+    )
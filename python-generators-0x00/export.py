@@ -0,0 +1,349 @@
+#!/usr/bin/python3
+"""
+Streaming export of user_data to CSV, JSONL or a compact binary format
+
+Rows are read with an unbuffered cursor and adaptive fetchmany() batches,
+encoded a batch at a time and written through a large buffer, so memory
+stays constant however big the table is. Optional gzip/zstd compression
+runs on a separate thread, and disjoint user_id ranges can be exported in
+parallel into one file per range.
+
+Usage: ./export.py OUTPUT [--format csv|jsonl|bin] [--compression gzip|zstd] [--shards N]
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import queue
+import threading
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Sequence, Tuple
+
+import seed
+import parallel_scan
+from records import USER_COLUMNS, BINARY_MAGIC, pack_user
+
+
+FORMATS = ('csv', 'jsonl', 'bin')
+COMPRESSIONS = (None, 'gzip', 'zstd')
+EXTENSIONS = {'csv': '.csv', 'jsonl': '.jsonl', 'bin': '.udb', 'gzip': '.gz', 'zstd': '.zst'}
+
+# Size of the write buffer and of the chunks handed to the compression thread
+BUFFER_SIZE = 1 << 20
+
+
+def _encode_csv(rows: Sequence[Sequence[Any]]) -> bytes:
+    text = io.StringIO()
+    csv.writer(text).writerows((row[0], row[1], row[2], int(row[3])) for row in rows)
+    return text.getvalue().encode('utf-8')
+
+
+def _encode_jsonl(rows: Sequence[Sequence[Any]]) -> bytes:
+    dumps = json.dumps
+    return ''.join(
+        dumps({'user_id': row[0], 'name': row[1], 'email': row[2], 'age': int(row[3])},
+              ensure_ascii=False) + '\n'
+        for row in rows
+    ).encode('utf-8')
+
+
+def _encode_bin(rows: Sequence[Sequence[Any]]) -> bytes:
+    return b''.join(map(pack_user, rows))
+
+
+ENCODERS: Dict[str, Callable[[Sequence[Sequence[Any]]], bytes]] = {
+    'csv': _encode_csv,
+    'jsonl': _encode_jsonl,
+    'bin': _encode_bin,
+}
+
+
+def _file_header(fmt: str) -> bytes:
+    if fmt == 'csv':
+        return (','.join(USER_COLUMNS) + '\r\n').encode('utf-8')
+    if fmt == 'bin':
+        return BINARY_MAGIC
+    return b''
+
+
+def _zstandard() -> Any:
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("zstd compression requires the 'zstandard' package")
+    return zstandard
+
+
+def check_compression(compression: Optional[str]) -> None:
+    """
+    Fails early for a compression that cannot be written
+
+    Raises:
+        ValueError: Unknown compression
+        RuntimeError: zstd requested without the zstandard package
+    """
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression: {compression}")
+    if compression == 'zstd':
+        _zstandard()
+
+
+def _compressor(compression: str) -> Any:
+    """Returns an object with compress()/flush() for the codec"""
+    if compression == 'gzip':
+        return zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 writes a gzip container
+    if compression == 'zstd':
+        return _zstandard().ZstdCompressor(level=3).compressobj()
+    raise ValueError(f"Unknown compression: {compression}")
+
+
+class CompressingWriter:
+    """
+    Write-only binary stream that compresses on a background thread
+
+    write() only appends to an in-memory buffer; full buffers are handed to
+    a worker thread (through a small bounded queue) which compresses them and
+    writes the result to the underlying file, so encoding and compression
+    overlap.
+    """
+
+    def __init__(self, raw: BinaryIO, compression: str, chunk_size: int = BUFFER_SIZE):
+        """
+        Args:
+            raw: Underlying binary file, closed by close()
+            compression: 'gzip' or 'zstd'
+            chunk_size: Bytes buffered before a chunk is handed off
+        """
+        self.raw = raw
+        self.chunk_size = chunk_size
+        self._compressor = _compressor(compression)
+        self._buffer: List[bytes] = []
+        self._buffered = 0
+        self._chunks: queue.Queue = queue.Queue(maxsize=4)
+        self._error: Optional[BaseException] = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='export-compress', daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            chunk = self._chunks.get()
+            if chunk is None:
+                break
+            if self._error is not None:
+                continue
+            try:
+                self.raw.write(self._compressor.compress(chunk))
+            except BaseException as e:
+                self._error = e
+        if self._error is None:
+            try:
+                self.raw.write(self._compressor.flush())
+            except BaseException as e:
+                self._error = e
+
+    def write(self, data: bytes) -> int:
+        if self._error is not None:
+            raise self._error
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= self.chunk_size:
+            self._chunks.put(b''.join(self._buffer))
+            self._buffer = []
+            self._buffered = 0
+        return len(data)
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        if self._buffer:
+            self._chunks.put(b''.join(self._buffer))
+            self._buffer = []
+        self._chunks.put(None)
+        self._thread.join()
+        self.raw.close()
+        if self._error is not None:
+            raise self._error
+
+
+def open_output(path: str, compression: Optional[str] = None) -> Any:
+    """
+    Opens an export destination with a large write buffer
+
+    Args:
+        path: Output file path
+        compression: None, 'gzip' or 'zstd'
+
+    Returns:
+        Binary writer with write() and close()
+    """
+    check_compression(compression)
+    raw = open(path, 'wb', buffering=BUFFER_SIZE)
+    if compression is None:
+        return raw
+    try:
+        return CompressingWriter(raw, compression)
+    except BaseException:
+        raw.close()
+        raise
+
+
+def export_range(path: str, fmt: str = 'csv', compression: Optional[str] = None,
+                 key_range: parallel_scan.KeyRange = (None, None),
+                 where: Optional[seed.WhereSpec] = None,
+                 connection: Any = None) -> int:
+    """
+    Exports the users in one user_id range to a file
+
+    The export is written to path + '.tmp' and renamed over path only once
+    it is complete, so readers never see a truncated file.
+
+    Args:
+        path: Output file path
+        fmt: 'csv', 'jsonl' or 'bin'
+        compression: None, 'gzip' or 'zstd'
+        key_range: (low, high) user_id range, None meaning unbounded
+        where: Optional filter evaluated by the database
+        connection: Connection to read from (a new one is opened if omitted)
+
+    Returns:
+        int: Number of rows written
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format: {fmt}")
+    check_compression(compression)
+    encode = ENCODERS[fmt]
+
+    own_connection = connection is None
+    if own_connection:
+        connection = seed.connect_to_prodev()
+        if connection is None:
+            raise RuntimeError("Failed to connect to ALX_prodev database")
+
+    conditions, params = seed.compile_where(where)
+    range_sql, range_params = parallel_scan.range_conditions(key_range)
+    query = seed.select_users_sql(None, conditions + range_sql) + " ORDER BY user_id"
+
+    rows_written = 0
+    cursor = None
+    temp_path = f"{path}.tmp"
+    try:
+        output = open_output(temp_path, compression)
+    except Exception:
+        if own_connection:
+            connection.close()
+        raise
+    try:
+        output.write(_file_header(fmt))
+        cursor = connection.cursor(buffered=False)
+        cursor.execute(query, params + range_params)
+        sizer = seed.AdaptiveFetchSizer()
+        batch: List[Sequence[Any]] = []
+        # Encode a batch at a time, sized by the adaptive fetch sizer
+        for row in seed.fetch_rows(cursor, adaptive=True, sizer=sizer):
+            batch.append(row)
+            if len(batch) >= sizer.size:
+                output.write(encode(batch))
+                rows_written += len(batch)
+                batch = []
+        if batch:
+            output.write(encode(batch))
+            rows_written += len(batch)
+        cursor.close()
+        cursor = None
+        output.close()
+    except BaseException:
+        try:
+            output.close()
+        except Exception:
+            pass
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    finally:
+        if cursor:
+            cursor.close()
+        if own_connection:
+            connection.close()
+    # Publish the complete export
+    os.replace(temp_path, path)
+    return rows_written
+
+
+def shard_path(path: str, shard: int) -> str:
+    """
+    Returns the file name of one shard, e.g. users.csv.gz -> users-0003.csv.gz
+
+    Args:
+        path: Base output path
+        shard: Shard number
+
+    Returns:
+        str: Shard file path
+    """
+    directory, name = os.path.split(path)
+    stem, dot, extensions = name.partition('.')
+    return os.path.join(directory, f"{stem}-{shard:04d}{dot}{extensions}")
+
+
+def export_users(path: str, fmt: str = 'csv', compression: Optional[str] = None,
+                 shards: int = 1, workers: Optional[int] = None,
+                 where: Optional[seed.WhereSpec] = None) -> List[Tuple[str, int]]:
+    """
+    Exports user_data, optionally as parallel shards over disjoint key ranges
+
+    Args:
+        path: Output path; with shards > 1 a four-digit shard number is
+            inserted before the extension
+        fmt: 'csv', 'jsonl' or 'bin'
+        compression: None, 'gzip' or 'zstd'
+        shards: Number of key ranges exported in parallel
+        workers: Worker processes for sharded exports (defaults to shards)
+        where: Optional filter evaluated by the database
+
+    Returns:
+        List of (file path, rows written), in key order
+    """
+    check_compression(compression)
+    if shards <= 1:
+        return [(path, export_range(path, fmt, compression, where=where))]
+
+    with seed.pooled_connection() as connection:
+        ranges = parallel_scan.key_ranges(parallel_scan.sample_boundaries(connection, shards))
+    paths = [shard_path(path, shard) for shard in range(len(ranges))]
+    with ProcessPoolExecutor(max_workers=workers or len(ranges)) as executor:
+        futures = [
+            executor.submit(export_range, shard, fmt, compression, key_range, where)
+            for shard, key_range in zip(paths, ranges)
+        ]
+        return [(shard, future.result()) for shard, future in zip(paths, futures)]
+
+
+def main() -> None:
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Export user_data to a file")
+    parser.add_argument('output', help="output file (extensions are added if missing)")
+    parser.add_argument('--format', choices=FORMATS, default='csv')
+    parser.add_argument('--compression', choices=('gzip', 'zstd'))
+    parser.add_argument('--shards', type=int, default=1,
+                        help="export this many key ranges in parallel, one file each")
+    args = parser.parse_args()
+
+    output = args.output
+    for extension in (EXTENSIONS[args.format], EXTENSIONS.get(args.compression)):
+        if extension and extension not in os.path.basename(output):
+            output += extension
+
+    total = 0
+    for shard, rows in export_users(output, args.format, args.compression, args.shards):
+        print(f"Wrote {rows} rows to {shard}")
+        total += rows
+    print(f"Exported {total} users")
+
+
+if __name__ == "__main__":
+    main()
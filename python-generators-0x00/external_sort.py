@@ -0,0 +1,184 @@
+#!/usr/bin/python3
+"""
+External merge sort for streamed users
+
+The database only hands users out in user_id order. external_sort()
+reorders a user stream on the client instead: it sorts runs of run_size
+users in memory, spills each sorted run to a temporary file in the compact
+records.pack_user binary format, and k-way merges the runs with
+heapq.merge. Memory holds one run while sorting and one buffered record
+per run while merging, so reports can be sorted by name or email without a
+filesort on the shared server.
+"""
+
+import os
+import shutil
+import tempfile
+from heapq import merge
+from operator import itemgetter
+from typing import Any, Callable, Generator, Iterable, List, Optional, Sequence, Tuple, Union
+
+from records import USER_COLUMNS, BINARY_MAGIC, LazyUserRow, UserRecord, pack_user, read_users
+
+
+Row = Tuple[str, str, str, int]
+
+# Upper bound on the runs merged at once; more runs are merged in passes
+MAX_FAN_IN = 64
+
+OUTPUT_FORMATS = ('dict', 'record', 'tuple')
+
+
+def _as_row(user: Any) -> Row:
+    """Converts a user dictionary, UserRecord, LazyUserRow or row tuple to a row tuple"""
+    if isinstance(user, (dict, LazyUserRow)):
+        return user['user_id'], user['name'], user['email'], int(user['age'])
+    if isinstance(user, UserRecord):
+        return user.as_tuple()
+    return user[0], user[1], user[2], int(user[3])
+
+
+def _sort_key(key: Union[str, Sequence[str]]) -> Callable[[Row], Any]:
+    """Builds the row key function for one column or a sequence of columns"""
+    columns = (key,) if isinstance(key, str) else tuple(key)
+    unknown = [column for column in columns if column not in USER_COLUMNS]
+    if unknown or not columns:
+        raise ValueError(f"Unknown sort column(s): {', '.join(unknown) or '(none)'}")
+    return itemgetter(*(USER_COLUMNS.index(column) for column in columns))
+
+
+def _write_run(directory: str, index: int, rows: Iterable[Row]) -> str:
+    """Writes sorted rows to a run file and returns its path"""
+    path = os.path.join(directory, f"run-{index:06d}.udb")
+    with open(path, 'wb', buffering=1 << 20) as file:
+        file.write(BINARY_MAGIC)
+        file.write(b''.join(map(pack_user, rows)))
+    return path
+
+
+def _read_run(path: str) -> Generator[Row, None, None]:
+    """Yields the rows of a run file, deleting it once exhausted"""
+    with open(path, 'rb', buffering=1 << 16) as file:
+        if file.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+            raise ValueError(f"Not a run file: {path}")
+        yield from read_users(file)
+    os.remove(path)
+
+
+def _merge_runs(paths: List[str], key: Callable[[Row], Any], reverse: bool) -> Iterable[Row]:
+    return merge(*(_read_run(path) for path in paths), key=key, reverse=reverse)
+
+
+def external_sort(users: Iterable[Any], key: Union[str, Sequence[str]] = 'name',
+                  reverse: bool = False, run_size: int = 100000,
+                  format: str = 'dict', spill_dir: Optional[str] = None,
+                  fan_in: int = MAX_FAN_IN) -> Generator[Any, None, None]:
+    """
+    Sorts a stream of users that may not fit in memory
+
+    The sort is stable: users with equal keys keep their input order.
+
+    Args:
+        users: Users with all four columns, e.g. stream_users(); dictionaries,
+            UserRecords or (user_id, name, email, age) tuples
+        key: Column or sequence of columns to sort by
+        reverse: Sort in descending order
+        run_size: Users sorted in memory per run
+        format: Output as 'dict', 'record' or 'tuple'
+        spill_dir: Parent directory for the run files (system default if omitted)
+        fan_in: Maximum runs merged at once; larger run counts are merged
+            in several passes
+
+    Yields:
+        Users in sorted order, in the requested format
+
+    Example:
+        >>> for user in external_sort(stream_users(), key=('name', 'email')):
+        ...     print(user['name'], user['email'])
+    """
+    if format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format: {format}")
+    if run_size < 1 or fan_in < 2:
+        raise ValueError("run_size must be positive and fan_in at least 2")
+    sort_key = _sort_key(key)
+
+    directory = None
+    try:
+        runs: List[str] = []
+        rows: List[Row] = []
+        for user in users:
+            rows.append(_as_row(user))
+            if len(rows) >= run_size:
+                if directory is None:
+                    directory = tempfile.mkdtemp(prefix='external_sort-', dir=spill_dir)
+                rows.sort(key=sort_key, reverse=reverse)
+                runs.append(_write_run(directory, len(runs), rows))
+                rows = []
+
+        if not runs:
+            # Everything fit in one run: no disk involved
+            rows.sort(key=sort_key, reverse=reverse)
+            ordered: Iterable[Row] = rows
+        else:
+            if rows:
+                rows.sort(key=sort_key, reverse=reverse)
+                runs.append(_write_run(directory, len(runs), rows))
+                rows = []
+            # Merge in passes until one merge can take every run; consecutive
+            # runs are merged together so equal keys keep their order
+            written = len(runs)
+            while len(runs) > fan_in:
+                merged = []
+                for start in range(0, len(runs), fan_in):
+                    group = runs[start:start + fan_in]
+                    if len(group) == 1:
+                        merged.append(group[0])
+                        continue
+                    merged.append(_write_run(directory, written, _merge_runs(group, sort_key, reverse)))
+                    written += 1
+                runs = merged
+            ordered = _merge_runs(runs, sort_key, reverse)
+
+        if format == 'tuple':
+            yield from ordered
+        elif format == 'record':
+            for row in ordered:
+                yield UserRecord(*row)
+        else:
+            for row in ordered:
+                yield dict(zip(USER_COLUMNS, row))
+    finally:
+        if directory is not None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def external_sort_batches(batches: Iterable[Any], key: Union[str, Sequence[str]] = 'name',
+                          reverse: bool = False, run_size: int = 100000,
+                          format: str = 'dict', spill_dir: Optional[str] = None,
+                          batch_size: Optional[int] = None) -> Generator[List[Any], None, None]:
+    """
+    Sorts the output of stream_users_in_batches and re-batches it
+
+    Args:
+        batches: Batches in the 'dict' or 'record' format (all columns), or
+            UserColumns batches
+        key: Column or sequence of columns to sort by
+        reverse: Sort in descending order
+        run_size: Users sorted in memory per run
+        format: Output users as 'dict', 'record' or 'tuple'
+        spill_dir: Parent directory for the run files
+        batch_size: Users per output batch (defaults to run_size)
+
+    Yields:
+        Lists of users in sorted order
+    """
+    users = (user for batch in batches for user in batch)
+    batch_size = batch_size or run_size
+    batch: List[Any] = []
+    for user in external_sort(users, key, reverse, run_size, format, spill_dir):
+        batch.append(user)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
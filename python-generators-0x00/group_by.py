@@ -0,0 +1,317 @@
+#!/usr/bin/python3
+"""
+Group-by aggregation over streamed users with bounded memory
+
+SpillingHashAggregator keeps per-group partial aggregates (count, sum,
+min, max) in a dict. When the estimated size of the dict exceeds the memory
+budget, the groups are hash-partitioned into temporary files and the dict
+starts over. At the end every partition file is aggregated on its own, so
+each group is finished in memory exactly once; a partition that is still
+too large is re-partitioned recursively with a different hash salt.
+
+Usage: ./group_by.py [email_domain|name_prefix|COLUMN] [MEMORY_MB]
+"""
+
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+from functools import partial
+from typing import Any, Callable, Dict, Generator, Hashable, Iterable, List, Optional, Tuple, Union
+
+from records import USER_COLUMNS, UserColumns, email_domain
+
+
+# Rough bytes per group besides its key: dict slot, partial list and its numbers
+GROUP_OVERHEAD = 200
+# Partial aggregates per pickle.dump() when spilling
+SPILL_CHUNK = 10000
+# Beyond this depth a partition is aggregated in memory whatever its size
+MAX_DEPTH = 6
+
+Partial = List[Any]                   # [count, sum, min, max]
+
+
+def name_prefix(name: str, length: int = 3) -> str:
+    """Returns the first length characters of a name, upper-cased"""
+    return name[:length].upper()
+
+
+class SpillingHashAggregator:
+    """
+    Hash aggregation of (key, value) pairs that spills to disk past a memory budget
+
+    Example:
+        >>> with SpillingHashAggregator() as aggregator:
+        ...     aggregator.add_many(['a.com', 'b.org', 'a.com'], [20, 30, 40])
+        ...     sorted(aggregator.results())
+        [('a.com', [2, 60, 20, 40]), ('b.org', [1, 30, 30, 30])]
+    """
+
+    def __init__(self, memory_budget: int = 64 << 20, partitions: int = 16,
+                 spill_dir: Optional[str] = None, depth: int = 0):
+        """
+        Args:
+            memory_budget: Estimated bytes the in-memory groups may use
+            partitions: Number of partition files a spill is split into
+            spill_dir: Parent directory for the temporary files (system
+                default if omitted)
+            depth: Recursion depth; salts the partitioning hash
+        """
+        self.memory_budget = memory_budget
+        self.partitions = partitions
+        self.spill_dir = spill_dir
+        self.depth = depth
+        self.groups: Dict[Hashable, Partial] = {}
+        self.spills = 0
+        self.spilled_groups = 0
+        self._estimated_bytes = 0
+        self._directory: Optional[str] = None
+        self._files: List[Any] = []
+
+    def __enter__(self) -> 'SpillingHashAggregator':
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def _account(self, key: Hashable) -> None:
+        self._estimated_bytes += sys.getsizeof(key) + GROUP_OVERHEAD
+        if self._estimated_bytes > self.memory_budget:
+            self.spill()
+
+    def add(self, key: Hashable, value: Any) -> None:
+        """
+        Adds one value to its group
+
+        Args:
+            key: Group key
+            value: Number to aggregate
+        """
+        partial_ = self.groups.get(key)
+        if partial_ is None:
+            self.groups[key] = [1, value, value, value]
+            self._account(key)
+            return
+        partial_[0] += 1
+        partial_[1] += value
+        if value < partial_[2]:
+            partial_[2] = value
+        if value > partial_[3]:
+            partial_[3] = value
+
+    def add_many(self, keys: Iterable[Hashable], values: Iterable[Any]) -> None:
+        """
+        Adds values to their groups, pairwise
+
+        Args:
+            keys: Group keys
+            values: Numbers to aggregate, one per key
+        """
+        groups = self.groups
+        for key, value in zip(keys, values):
+            partial_ = groups.get(key)
+            if partial_ is None:
+                groups[key] = [1, value, value, value]
+                self._account(key)
+                groups = self.groups       # A spill replaces the dict
+                continue
+            partial_[0] += 1
+            partial_[1] += value
+            if value < partial_[2]:
+                partial_[2] = value
+            if value > partial_[3]:
+                partial_[3] = value
+
+    def merge_partial(self, key: Hashable, other: Partial) -> None:
+        """
+        Folds a partial aggregate (e.g. read back from a spill) into its group
+
+        Args:
+            key: Group key
+            other: [count, sum, min, max]
+        """
+        partial_ = self.groups.get(key)
+        if partial_ is None:
+            self.groups[key] = list(other)
+            self._account(key)
+            return
+        partial_[0] += other[0]
+        partial_[1] += other[1]
+        if other[2] < partial_[2]:
+            partial_[2] = other[2]
+        if other[3] > partial_[3]:
+            partial_[3] = other[3]
+
+    def _partition(self, key: Hashable) -> int:
+        return hash((self.depth, key)) % self.partitions
+
+    def spill(self) -> None:
+        """Writes the in-memory groups to the partition files and clears them"""
+        if not self.groups:
+            return
+        if self._directory is None:
+            self._directory = tempfile.mkdtemp(prefix='group_by-', dir=self.spill_dir)
+            self._files = [
+                open(os.path.join(self._directory, f"part-{index:03d}.pkl"), 'w+b', buffering=1 << 20)
+                for index in range(self.partitions)
+            ]
+
+        buckets: List[List[Tuple[Hashable, Partial]]] = [[] for _ in range(self.partitions)]
+        for key, partial_ in self.groups.items():
+            bucket = buckets[self._partition(key)]
+            bucket.append((key, partial_))
+            if len(bucket) >= SPILL_CHUNK:
+                pickle.dump(bucket, self._files[self._partition(key)], pickle.HIGHEST_PROTOCOL)
+                bucket.clear()
+        for file, bucket in zip(self._files, buckets):
+            if bucket:
+                pickle.dump(bucket, file, pickle.HIGHEST_PROTOCOL)
+
+        self.spills += 1
+        self.spilled_groups += len(self.groups)
+        self.groups = {}
+        self._estimated_bytes = 0
+
+    @staticmethod
+    def _read_partition(file: Any) -> Generator[Tuple[Hashable, Partial], None, None]:
+        file.seek(0)
+        while True:
+            try:
+                chunk = pickle.load(file)
+            except EOFError:
+                return
+            yield from chunk
+
+    def results(self) -> Generator[Tuple[Hashable, Partial], None, None]:
+        """
+        Yields every group with its final aggregate, in no particular order
+
+        Once anything was spilled, the remaining groups are spilled too and
+        each partition is aggregated separately (recursively if needed).
+
+        Yields:
+            Tuple of (key, [count, sum, min, max])
+        """
+        if self._directory is None:
+            yield from self.groups.items()
+            return
+
+        self.spill()
+        for file in self._files:
+            if self.depth >= MAX_DEPTH:
+                # Hash salts stopped helping; finish this partition in memory
+                groups: Dict[Hashable, Partial] = {}
+                for key, partial_ in self._read_partition(file):
+                    merged = groups.setdefault(key, [0, 0, partial_[2], partial_[3]])
+                    merged[0] += partial_[0]
+                    merged[1] += partial_[1]
+                    merged[2] = min(merged[2], partial_[2])
+                    merged[3] = max(merged[3], partial_[3])
+                yield from groups.items()
+                continue
+            with SpillingHashAggregator(self.memory_budget, self.partitions,
+                                        self._directory, self.depth + 1) as child:
+                for key, partial_ in self._read_partition(file):
+                    child.merge_partial(key, partial_)
+                yield from child.results()
+            file.truncate(0)
+
+    def close(self) -> None:
+        """Deletes the partition files"""
+        for file in self._files:
+            file.close()
+        self._files = []
+        if self._directory is not None:
+            shutil.rmtree(self._directory, ignore_errors=True)
+            self._directory = None
+        self.groups = {}
+
+
+KeySpec = Union[str, Tuple[str, Callable[[Any], Hashable]]]
+
+
+def resolve_key(key: KeySpec, prefix_length: int = 3) -> Tuple[str, Optional[Callable[[Any], Hashable]]]:
+    """
+    Turns a key specification into (column, transform)
+
+    Args:
+        key: 'email_domain', 'name_prefix', a column name, or a
+            (column, function) tuple
+        prefix_length: Characters kept by 'name_prefix'
+
+    Returns:
+        Tuple of (column to read, function applied to it or None)
+    """
+    if key == 'email_domain':
+        return 'email', email_domain
+    if key == 'name_prefix':
+        return 'name', partial(name_prefix, length=prefix_length)
+    if isinstance(key, tuple):
+        column, transform = key
+    else:
+        column, transform = key, None
+    if column not in USER_COLUMNS:
+        raise ValueError(f"Unknown group-by column: {column}")
+    return column, transform
+
+
+def group_by(batches: Iterable[Any], key: KeySpec = 'email_domain', value: str = 'age',
+             memory_budget: int = 64 << 20, partitions: int = 16, prefix_length: int = 3,
+             spill_dir: Optional[str] = None) -> Generator[Dict[str, Any], None, None]:
+    """
+    Aggregates streamed users per group in bounded memory
+
+    Args:
+        batches: Output of stream_users_in_batches() in any format
+            ('columnar' batches are read column-wise)
+        key: 'email_domain', 'name_prefix', a column name, or a
+            (column, function) tuple
+        value: Numeric column to aggregate
+        memory_budget: Estimated bytes the in-memory groups may use
+            before they are spilled to disk
+        partitions: Partition files per spill
+        prefix_length: Characters kept by 'name_prefix'
+        spill_dir: Directory for the temporary files
+
+    Yields:
+        Dictionary per group: {'group', 'count', 'sum_<value>',
+        'avg_<value>', 'min_<value>', 'max_<value>'}, in no particular order
+
+    Example:
+        >>> for row in group_by(stream_users_in_batches(5000, format='columnar')):
+        ...     print(row['group'], row['count'], row['avg_age'])
+    """
+    column, transform = resolve_key(key, prefix_length)
+    if value not in USER_COLUMNS:
+        raise ValueError(f"Unknown aggregate column: {value}")
+
+    with SpillingHashAggregator(memory_budget, partitions, spill_dir) as aggregator:
+        for batch in batches:
+            if isinstance(batch, UserColumns):
+                keys = batch.column(column)
+                values = batch.column(value)
+            else:
+                keys = [user[column] for user in batch]
+                values = [user[value] for user in batch]
+            aggregator.add_many(keys if transform is None else map(transform, keys), values)
+
+        for group, (count, total, low, high) in aggregator.results():
+            yield {
+                'group': group,
+                'count': count,
+                f'sum_{value}': total,
+                f'avg_{value}': total / count,
+                f'min_{value}': low,
+                f'max_{value}': high,
+            }
+
+
+if __name__ == "__main__":
+    batch_processing = __import__('1-batch_processing')
+    key = sys.argv[1] if len(sys.argv) > 1 else 'email_domain'
+    budget = int(sys.argv[2]) << 20 if len(sys.argv) > 2 else 64 << 20
+    batches = batch_processing.stream_users_in_batches(5000, format='columnar')
+    for row in sorted(group_by(batches, key, memory_budget=budget), key=lambda row: -row['count']):
+        print(f"{row['group']}: {row['count']} users, average age {row['avg_age']:.1f}")
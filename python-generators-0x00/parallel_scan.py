@@ -0,0 +1,236 @@
+#!/usr/bin/python3
+"""
+Range-partitioned parallel scan of user_data
+
+The table is split into disjoint user_id ranges at boundaries sampled from
+the primary key, sized so that each holds about chunk_size rows. Worker
+processes scan one range per task on a connection they keep between
+tasks. Only a bounded window of ranges is in flight or waiting to be
+consumed at a time, so the parent holds a few chunks rather than the
+scanned table. Results come back in key order or in completion order.
+"""
+
+import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Callable, Dict, Generator, List, Optional, Sequence, Tuple
+
+import mysql.connector
+
+import seed
+from records import rows_to_dicts
+
+
+KeyRange = Tuple[Optional[str], Optional[str]]
+
+# Connection reused by the scan tasks of one worker process
+_worker_connection: Optional[mysql.connector.MySQLConnection] = None
+
+
+def sample_boundaries(connection: mysql.connector.MySQLConnection, partitions: int,
+                      sample_size: int = 10000) -> List[str]:
+    """
+    Picks user_id values that split the table into roughly equal ranges
+
+    Args:
+        connection: MySQL connection object
+        partitions: Number of ranges wanted
+        sample_size: Approximate number of user_ids to sample
+
+    Returns:
+        Sorted, distinct boundary keys (at most partitions - 1 of them)
+    """
+    if partitions < 2:
+        return []
+    total = seed.get_user_count(connection)
+    if total == 0:
+        return []
+
+    cursor = connection.cursor()
+    try:
+        if total <= sample_size:
+            cursor.execute("SELECT user_id FROM user_data")
+        else:
+            cursor.execute("SELECT user_id FROM user_data WHERE RAND() < %s",
+                           (sample_size / total,))
+        sample = sorted(row[0] for row in cursor.fetchall())
+    finally:
+        cursor.close()
+    if not sample:
+        return []
+
+    boundaries = []
+    for i in range(1, partitions):
+        key = sample[i * len(sample) // partitions]
+        if not boundaries or key > boundaries[-1]:
+            boundaries.append(key)
+    return boundaries
+
+
+def key_ranges(boundaries: Sequence[str]) -> List[KeyRange]:
+    """
+    Turns sorted boundary keys into half-open [low, high) ranges
+
+    The first range has no lower bound and the last none upper bound, so
+    the ranges cover the whole key space.
+
+    Args:
+        boundaries: Sorted boundary keys
+
+    Returns:
+        List of (low, high) tuples, None meaning unbounded
+    """
+    edges = [None, *boundaries, None]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def range_conditions(key_range: KeyRange) -> Tuple[List[str], List[Any]]:
+    """
+    Builds the SQL conditions selecting one key range
+
+    Args:
+        key_range: (low, high) tuple from key_ranges
+
+    Returns:
+        Tuple of (list of SQL conditions, list of parameters)
+    """
+    low, high = key_range
+    conditions, params = [], []
+    if low is not None:
+        conditions.append("user_id >= %s")
+        params.append(low)
+    if high is not None:
+        conditions.append("user_id < %s")
+        params.append(high)
+    return conditions, params
+
+
+def _scan_partition(index: int, key_range: KeyRange,
+                    callback: Optional[Callable[[Dict[str, Any]], Any]],
+                    predicate: Optional[Callable[[Dict[str, Any]], bool]],
+                    where: Optional[seed.WhereSpec],
+                    fetch_size: int) -> Tuple[int, List[Any]]:
+    """
+    Scans one key range in a worker process
+
+    Ranges are sized by parallel_scan to about chunk_size rows, which
+    bounds the list returned (and pickled) per task.
+
+    Returns:
+        Tuple of (partition index, list of results)
+    """
+    global _worker_connection
+    if _worker_connection is None or not _worker_connection.is_connected():
+        _worker_connection = seed.connect_to_prodev()
+        if _worker_connection is None:
+            raise RuntimeError(f"Partition {index}: failed to connect to ALX_prodev")
+    connection = _worker_connection
+
+    conditions, params = seed.compile_where(where)
+    range_sql, range_params = range_conditions(key_range)
+    query = seed.select_users_sql(None, conditions + range_sql) + " ORDER BY user_id"
+
+    results = []
+    cursor = None
+    try:
+        cursor = connection.cursor(buffered=False)
+        cursor.execute(query, params + range_params)
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            for user in rows_to_dicts(rows):
+                if predicate is not None and not predicate(user):
+                    continue
+                result = callback(user) if callback is not None else user
+                if result is not None:
+                    results.append(result)
+    finally:
+        if cursor:
+            cursor.close()
+    return index, results
+
+
+def parallel_scan(callback: Optional[Callable[[Dict[str, Any]], Any]] = None,
+                  predicate: Optional[Callable[[Dict[str, Any]], bool]] = None,
+                  where: Optional[seed.WhereSpec] = None,
+                  workers: Optional[int] = None,
+                  partitions: Optional[int] = None,
+                  ordered: bool = True,
+                  fetch_size: int = 1000,
+                  chunk_size: int = 10000,
+                  max_pending: Optional[int] = None) -> Generator[Any, None, None]:
+    """
+    Scans user_data in parallel worker processes, one key range per task
+
+    callback and predicate run inside the workers, so they must be
+    picklable (module-level functions, not lambdas). Closing the generator
+    early cancels the ranges not yet started and returns without waiting
+    for the running ones, each of which is at most one chunk.
+
+    Args:
+        callback: Called with each user dictionary; its non-None return
+            values are yielded (defaults to yielding the users themselves)
+        predicate: Only users for which predicate(user) is true are passed on,
+            e.g. the age > 25 filter of batch_processing
+        where: Filter evaluated by the database, e.g. ("age", ">", 25)
+        workers: Number of worker processes (defaults to the CPU count)
+        partitions: Number of key ranges (defaults to one per chunk_size
+            rows, and at least 4 per worker so a slow range does not hold
+            up the others)
+        ordered: Yield results in user_id order; otherwise yield each
+            range's results as soon as it finishes
+        fetch_size: Rows per fetchmany() call in the workers
+        chunk_size: Approximate rows per range, bounding each task's result
+        max_pending: Ranges submitted but not yet consumed (defaults to
+            2 per worker); the parent holds at most this many chunks
+
+    Yields:
+        Callback results (or users) from every partition
+    """
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or workers * 2
+
+    with seed.pooled_connection() as connection:
+        if partitions is None:
+            total = seed.get_user_count(connection)
+            partitions = max(workers * 4, -(-total // chunk_size))
+        # Enough samples per range to keep the range sizes close to even
+        boundaries = sample_boundaries(connection, partitions, max(10000, partitions * 16))
+    ranges = iter(enumerate(key_ranges(boundaries)))
+
+    executor = ProcessPoolExecutor(max_workers=workers)
+
+    def submit() -> Optional[Future]:
+        task = next(ranges, None)
+        if task is None:
+            return None
+        index, key_range = task
+        return executor.submit(_scan_partition, index, key_range, callback, predicate, where, fetch_size)
+
+    completed = False
+    try:
+        futures = [future for future in (submit() for _ in range(max_pending)) if future is not None]
+        if ordered:
+            queue = deque(futures)
+            while queue:
+                _, results = queue.popleft().result()
+                future = submit()
+                if future is not None:
+                    queue.append(future)
+                yield from results
+        else:
+            running = set(futures)
+            while running:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for finished in done:
+                    future = submit()
+                    if future is not None:
+                        running.add(future)
+                for finished in done:
+                    _, results = finished.result()
+                    yield from results
+        completed = True
+    finally:
+        # On an early stop, drop the queued ranges and do not wait for running ones
+        executor.shutdown(wait=completed, cancel_futures=True)
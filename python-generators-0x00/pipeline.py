@@ -0,0 +1,396 @@
+#!/usr/bin/python3
+"""
+Composable, chunked pipelines over the stream generators
+
+A pipeline is a source followed by stages joined with '|':
+
+    Pipeline.from_batches(stream_users_in_batches(1000)) | Flatten() \\
+        | Filter(is_over_25) | Map(format_user) | Sink(print)
+
+Items travel between stages in chunks (the source's batches, or
+chunk_size items pulled from an item source), so the per-item cost is a
+C-level map()/filter() step rather than a Python generator frame per
+stage. Adjacent stateless stages (Map, Filter, Flatten) are fused into a
+single pass over each chunk. Every step records the items it received and
+produced and the time it spent, available from stats() and report() after
+the run; build the pipeline with fuse=False to time each stage separately.
+"""
+
+import time
+from collections import deque
+from itertools import chain, islice
+from typing import Any, Callable, Dict, Generator, Iterable, Iterator, List, Optional
+
+
+class Stage:
+    """
+    One pipeline step that turns a chunk of items into a chunk of items
+
+    Stateless stages set fusable = True and implement wrap(), which lazily
+    applies the stage to an iterator; stateful stages implement process()
+    and finish().
+    """
+
+    fusable = False
+
+    @property
+    def name(self) -> str:
+        return type(self).__name__.lower()
+
+    def wrap(self, items: Iterator[Any]) -> Iterator[Any]:
+        """Applies a stateless stage lazily to an iterator of items"""
+        raise NotImplementedError
+
+    def process(self, chunk: List[Any]) -> List[Any]:
+        """
+        Processes one chunk
+
+        Args:
+            chunk: Items from the previous step
+
+        Returns:
+            List of items for the next step (possibly empty)
+        """
+        return list(self.wrap(iter(chunk)))
+
+    def finish(self) -> List[Any]:
+        """Returns items still held by the stage once the input is exhausted"""
+        return []
+
+
+def _callable_name(function: Callable[..., Any]) -> str:
+    return getattr(function, '__name__', type(function).__name__)
+
+
+class Map(Stage):
+    """Applies a function to every item"""
+
+    fusable = True
+
+    def __init__(self, function: Callable[[Any], Any]):
+        self.function = function
+
+    @property
+    def name(self) -> str:
+        return f"map({_callable_name(self.function)})"
+
+    def wrap(self, items: Iterator[Any]) -> Iterator[Any]:
+        return map(self.function, items)
+
+
+class Filter(Stage):
+    """Keeps the items for which a predicate is true"""
+
+    fusable = True
+
+    def __init__(self, predicate: Callable[[Any], bool]):
+        self.predicate = predicate
+
+    @property
+    def name(self) -> str:
+        return f"filter({_callable_name(self.predicate)})"
+
+    def wrap(self, items: Iterator[Any]) -> Iterator[Any]:
+        return filter(self.predicate, items)
+
+
+class Flatten(Stage):
+    """Turns each item (a batch) into its elements, e.g. batches into users"""
+
+    fusable = True
+
+    def wrap(self, items: Iterator[Any]) -> Iterator[Any]:
+        return chain.from_iterable(items)
+
+
+class Batch(Stage):
+    """Groups items into lists of size items (the last one may be shorter)"""
+
+    def __init__(self, size: int):
+        if size < 1:
+            raise ValueError("Batch size must be positive")
+        self.size = size
+        self._pending: List[Any] = []
+
+    @property
+    def name(self) -> str:
+        return f"batch({self.size})"
+
+    def process(self, chunk: List[Any]) -> List[Any]:
+        pending = self._pending
+        pending.extend(chunk)
+        full = len(pending) - len(pending) % self.size
+        batches = [pending[start:start + self.size] for start in range(0, full, self.size)]
+        self._pending = pending[full:]
+        return batches
+
+    def finish(self) -> List[Any]:
+        pending, self._pending = self._pending, []
+        return [pending] if pending else []
+
+
+class Window(Stage):
+    """
+    Emits tuples of the last size items every step items
+
+    step == size gives tumbling windows, step == 1 sliding windows; a final
+    partial window is not emitted.
+    """
+
+    def __init__(self, size: int, step: Optional[int] = None):
+        step = size if step is None else step
+        if size < 1 or step < 1:
+            raise ValueError("Window size and step must be positive")
+        self.size = size
+        self.step = step
+        self._window: deque = deque(maxlen=size)
+        self._since_last = 0
+
+    @property
+    def name(self) -> str:
+        return f"window({self.size}, {self.step})"
+
+    def process(self, chunk: List[Any]) -> List[Any]:
+        windows = []
+        window = self._window
+        size, step = self.size, self.step
+        for item in chunk:
+            window.append(item)
+            self._since_last += 1
+            if len(window) == size and self._since_last >= step:
+                windows.append(tuple(window))
+                self._since_last = 0
+        return windows
+
+
+class Sink(Stage):
+    """
+    Consumes items with a function; nothing flows past a sink
+
+    Args:
+        function: Called with each item, or with each chunk when per_chunk is set
+        per_chunk: Call function once per chunk (a list) instead of per item
+    """
+
+    def __init__(self, function: Callable[[Any], Any], per_chunk: bool = False):
+        self.function = function
+        self.per_chunk = per_chunk
+
+    @property
+    def name(self) -> str:
+        return f"sink({_callable_name(self.function)})"
+
+    def process(self, chunk: List[Any]) -> List[Any]:
+        if self.per_chunk:
+            self.function(chunk)
+        else:
+            for item in chunk:
+                self.function(item)
+        return []
+
+
+class _Fused(Stage):
+    """Adjacent stateless stages applied in one pass over each chunk"""
+
+    def __init__(self, stages: List[Stage]):
+        self.stages = stages
+
+    @property
+    def name(self) -> str:
+        return ' | '.join(stage.name for stage in self.stages)
+
+    def process(self, chunk: List[Any]) -> List[Any]:
+        items: Iterator[Any] = iter(chunk)
+        for stage in self.stages:
+            items = stage.wrap(items)
+        return list(items)
+
+
+class StepStats:
+    """Items and time recorded for one executed step"""
+
+    __slots__ = ('name', 'items_in', 'items_out', 'seconds')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items_in = 0
+        self.items_out = 0
+        self.seconds = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {'stage': self.name, 'items_in': self.items_in,
+                'items_out': self.items_out, 'seconds': self.seconds}
+
+
+class Pipeline:
+    """
+    A source of chunks and the stages applied to them
+
+    Pipelines are immutable: 'pipeline | stage' returns a new pipeline.
+    Iterating a pipeline yields the items leaving its last stage; run()
+    drains it (typically when it ends in a Sink) and returns the stats.
+
+    Example:
+        >>> from pipeline import Pipeline, Map, Filter, Sink
+        >>> out = []
+        >>> stats = (Pipeline.from_items(range(10), chunk_size=4)
+        ...          | Filter(lambda n: n % 2) | Map(lambda n: n * n) | Sink(out.append)).run()
+        >>> out
+        [1, 9, 25, 49, 81]
+    """
+
+    def __init__(self, chunks: Callable[[], Iterable[List[Any]]], stages: Optional[List[Stage]] = None,
+                 name: str = 'source', fuse: bool = True):
+        """
+        Args:
+            chunks: Function returning the source's iterable of chunks
+            stages: Stages applied in order
+            name: Name of the source in the stats
+            fuse: Fuse adjacent stateless stages into one pass
+        """
+        self._chunks = chunks
+        self.stages = list(stages or [])
+        self.source_name = name
+        self.fuse = fuse
+        self._stats: List[StepStats] = []
+
+    @classmethod
+    def from_items(cls, items: Iterable[Any], chunk_size: int = 1000,
+                   name: str = 'source', fuse: bool = True) -> 'Pipeline':
+        """
+        Builds a pipeline over an item generator such as stream_users()
+
+        Args:
+            items: Iterable of items
+            chunk_size: Items pulled from the source per chunk
+            name: Name of the source in the stats
+            fuse: Fuse adjacent stateless stages into one pass
+
+        Returns:
+            Pipeline: Pipeline without stages
+        """
+        def chunks() -> Generator[List[Any], None, None]:
+            iterator = iter(items)
+            while True:
+                chunk = list(islice(iterator, chunk_size))
+                if not chunk:
+                    return
+                yield chunk
+        return cls(chunks, name=name, fuse=fuse)
+
+    @classmethod
+    def from_batches(cls, batches: Iterable[Iterable[Any]], name: str = 'source',
+                     fuse: bool = True) -> 'Pipeline':
+        """
+        Builds a pipeline whose items are the batches of e.g. stream_users_in_batches()
+
+        Each batch travels as a chunk of one item; add Flatten() to work
+        on the users themselves.
+
+        Args:
+            batches: Iterable of batches
+            name: Name of the source in the stats
+            fuse: Fuse adjacent stateless stages into one pass
+
+        Returns:
+            Pipeline: Pipeline without stages
+        """
+        return cls(lambda: ([batch] for batch in batches), name=name, fuse=fuse)
+
+    def __or__(self, stage: Stage) -> 'Pipeline':
+        if not isinstance(stage, Stage):
+            return NotImplemented
+        if self.stages and isinstance(self.stages[-1], Sink):
+            raise ValueError("Nothing can follow a Sink")
+        return Pipeline(self._chunks, self.stages + [stage], self.source_name, self.fuse)
+
+    def _plan(self) -> List[Stage]:
+        """Groups runs of fusable stages into single steps"""
+        if not self.fuse:
+            return list(self.stages)
+        steps: List[Stage] = []
+        run: List[Stage] = []
+        for stage in self.stages:
+            if stage.fusable:
+                run.append(stage)
+                continue
+            if run:
+                steps.append(run[0] if len(run) == 1 else _Fused(run))
+                run = []
+            steps.append(stage)
+        if run:
+            steps.append(run[0] if len(run) == 1 else _Fused(run))
+        return steps
+
+    def _push(self, steps: List[Stage], stats: List[StepStats], start: int,
+              chunk: List[Any]) -> List[Any]:
+        """Runs a chunk through steps[start:] and returns what leaves the last one"""
+        clock = time.perf_counter
+        for step, step_stats in zip(steps[start:], stats[start + 1:]):
+            if not chunk:
+                break
+            began = clock()
+            step_stats.items_in += len(chunk)
+            chunk = step.process(chunk)
+            step_stats.items_out += len(chunk)
+            step_stats.seconds += clock() - began
+        return chunk
+
+    def __iter__(self) -> Iterator[Any]:
+        steps = self._plan()
+        stats = [StepStats(self.source_name)] + [StepStats(step.name) for step in steps]
+        self._stats = stats
+        clock = time.perf_counter
+        source = stats[0]
+        chunks = iter(self._chunks())
+
+        while True:
+            began = clock()
+            chunk = next(chunks, None)
+            source.seconds += clock() - began
+            if chunk is None:
+                break
+            source.items_out += len(chunk)
+            yield from self._push(steps, stats, 0, chunk)
+
+        # Flush stateful stages in order, pushing what they release downstream
+        for index, step in enumerate(steps):
+            began = clock()
+            chunk = step.finish()
+            stats[index + 1].items_out += len(chunk)
+            stats[index + 1].seconds += clock() - began
+            yield from self._push(steps, stats, index + 1, chunk)
+
+    def run(self) -> List[Dict[str, Any]]:
+        """
+        Drains the pipeline
+
+        Returns:
+            Per-step stats, as returned by stats()
+        """
+        for _ in self:
+            pass
+        return self.stats()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """
+        Returns the stats of the latest run
+
+        Returns:
+            List of {'stage', 'items_in', 'items_out', 'seconds'}, source first
+        """
+        return [step.as_dict() for step in self._stats]
+
+    def report(self) -> str:
+        """
+        Formats the stats of the latest run as a table
+
+        Returns:
+            str: One line per step with items and time
+        """
+        total = sum(step.seconds for step in self._stats) or 1e-9
+        lines = [f"{'stage':<40} {'in':>10} {'out':>10} {'seconds':>9} {'share':>6}"]
+        for step in self._stats:
+            lines.append(f"{step.name[:40]:<40} {step.items_in:>10} {step.items_out:>10} "
+                         f"{step.seconds:>9.3f} {step.seconds / total:>6.1%}")
+        return '\n'.join(lines)
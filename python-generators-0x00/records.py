@@ -0,0 +1,440 @@
+#!/usr/bin/python3
+"""
+Compact in-memory representations of user_data rows
+
+Besides the plain dictionaries the generators yield by default, batches can
+be held as __slots__ records, as a column-oriented batch with the ages in
+an array('H'), which needs a fraction of the memory for large batches, or
+as lazy views over raw cursor rows that decode a column only when read.
+"""
+
+import operator
+import struct
+from array import array
+from itertools import compress, repeat
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+
+USER_COLUMNS = ('user_id', 'name', 'email', 'age')
+
+# Comparison operators accepted by filters
+OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    '=': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+
+class UserRecord:
+    """
+    One user_data row stored in __slots__ instead of a per-row dictionary
+
+    Supports both attribute access (user.age) and item access (user['age'])
+    so code written against the dictionary rows keeps working.
+    """
+
+    __slots__ = USER_COLUMNS
+
+    def __init__(self, user_id: str, name: str, email: str, age: int):
+        self.user_id = user_id
+        self.name = name
+        self.email = email
+        self.age = age
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in USER_COLUMNS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, UserRecord):
+            return NotImplemented
+        return self.as_tuple() == other.as_tuple()
+
+    def __repr__(self) -> str:
+        return (f"UserRecord(user_id={self.user_id!r}, name={self.name!r}, "
+                f"email={self.email!r}, age={self.age!r})")
+
+    def as_tuple(self) -> tuple:
+        """Returns the row as (user_id, name, email, age)"""
+        return (self.user_id, self.name, self.email, self.age)
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Returns the row as the dictionary the generators yield by default"""
+        return dict(zip(USER_COLUMNS, self.as_tuple()))
+
+
+class UserColumns:
+    """
+    Column-oriented batch of users
+
+    Ids, names and emails are kept in parallel lists and ages in an
+    array('H') (ages fit the DECIMAL(3,0) column), so a batch costs one list
+    slot per string instead of a dictionary per row. Filters run over whole
+    columns at C speed and return a new, smaller batch.
+
+    Example:
+        >>> batch = UserColumns.from_rows([('a', 'Ann', 'a@x.io', 30)])
+        >>> len(batch.where('age', '>', 25))
+        1
+    """
+
+    __slots__ = ('user_ids', 'names', 'emails', 'ages')
+
+    def __init__(self, user_ids: Optional[List[str]] = None,
+                 names: Optional[List[str]] = None,
+                 emails: Optional[List[str]] = None,
+                 ages: Optional[array] = None):
+        self.user_ids = user_ids if user_ids is not None else []
+        self.names = names if names is not None else []
+        self.emails = emails if emails is not None else []
+        self.ages = ages if ages is not None else array('H')
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[Sequence[Any]]) -> 'UserColumns':
+        """
+        Builds a batch from (user_id, name, email, age) rows
+
+        Args:
+            rows: Rows as returned by the cursor
+
+        Returns:
+            UserColumns: The rows split into columns
+        """
+        if not rows:
+            return cls()
+        user_ids, names, emails, ages = zip(*rows)
+        return cls(list(user_ids), list(names), list(emails), array('H', map(int, ages)))
+
+    def column(self, name: str) -> Sequence[Any]:
+        """
+        Returns one column by its user_data column name
+
+        Args:
+            name: One of user_id, name, email, age
+
+        Returns:
+            The column's list or array
+        """
+        columns = {'user_id': self.user_ids, 'name': self.names,
+                   'email': self.emails, 'age': self.ages}
+        try:
+            return columns[name]
+        except KeyError:
+            raise ValueError(f"Unknown column: {name}")
+
+    def mask(self, column: str, op: str, value: Any) -> List[bool]:
+        """
+        Evaluates a comparison over a whole column
+
+        Args:
+            column: Column name, e.g. 'age'
+            op: One of =, !=, <, <=, >, >=
+            value: Value to compare against
+
+        Returns:
+            List of booleans, one per row
+        """
+        try:
+            compare = OPERATORS[op]
+        except KeyError:
+            raise ValueError(f"Unsupported operator: {op}")
+        return list(map(compare, self.column(column), repeat(value)))
+
+    def select(self, mask: Iterable[bool]) -> 'UserColumns':
+        """
+        Returns the rows whose mask entry is true as a new batch
+
+        Args:
+            mask: One boolean per row
+
+        Returns:
+            UserColumns: The selected rows
+        """
+        mask = list(mask)
+        return UserColumns(list(compress(self.user_ids, mask)),
+                           list(compress(self.names, mask)),
+                           list(compress(self.emails, mask)),
+                           array('H', compress(self.ages, mask)))
+
+    def where(self, column: str, op: str, value: Any) -> 'UserColumns':
+        """
+        Filters the batch, e.g. batch.where('age', '>', 25)
+
+        Args:
+            column: Column name
+            op: One of =, !=, <, <=, >, >=
+            value: Value to compare against
+
+        Returns:
+            UserColumns: The matching rows
+        """
+        return self.select(self.mask(column, op, value))
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+    def __iter__(self) -> Iterator[UserRecord]:
+        return map(UserRecord, self.user_ids, self.names, self.emails, self.ages)
+
+    def __getitem__(self, index: int) -> UserRecord:
+        """Builds the record of one row, without touching the others"""
+        return UserRecord(self.user_ids[index], self.names[index],
+                          self.emails[index], self.ages[index])
+
+    def __repr__(self) -> str:
+        return f"UserColumns({len(self)} rows)"
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        """Returns the batch as a list of row dictionaries"""
+        return [dict(zip(USER_COLUMNS, row))
+                for row in zip(self.user_ids, self.names, self.emails, self.ages)]
+
+
+def email_domain(email: str) -> str:
+    """Returns the lower-cased domain part of an email address"""
+    return email.rpartition('@')[2].lower()
+
+
+def rows_to_dicts(rows: Sequence[Sequence[Any]],
+                  columns: Sequence[str] = USER_COLUMNS) -> List[Dict[str, Any]]:
+    """
+    Converts cursor rows to dictionaries
+
+    Args:
+        rows: Rows whose values are in the order of columns
+        columns: Names of the selected columns
+
+    Returns:
+        List of row dictionaries, with ages converted to int
+    """
+    if tuple(columns) == USER_COLUMNS:
+        return [{'user_id': row[0], 'name': row[1], 'email': row[2], 'age': int(row[3])}
+                for row in rows]
+    dicts = [dict(zip(columns, row)) for row in rows]
+    if 'age' in columns:
+        for user in dicts:
+            user['age'] = int(user['age'])
+    return dicts
+
+
+def rows_to_records(rows: Sequence[Sequence[Any]]) -> List[UserRecord]:
+    """Converts (user_id, name, email, age) rows to UserRecord objects"""
+    return [UserRecord(row[0], row[1], row[2], int(row[3])) for row in rows]
+
+
+_UNDECODED = object()
+
+# Column positions of each projection, shared by all rows of that projection
+_POSITIONS: Dict[Tuple[str, ...], Dict[str, int]] = {}
+
+
+def _decode_column(column: str, value: Any) -> Any:
+    if column == 'age':
+        # Selected as CAST(age AS UNSIGNED), so the raw value is ASCII digits
+        return int(value) if value is not None else 0
+    return value.decode('utf-8') if value is not None else None
+
+
+class LazyUserRow:
+    """
+    Read-only view over one row of a raw cursor (bytes values)
+
+    A column is decoded the first time it is accessed and cached, so a
+    consumer that only reads user['age'] never pays for decoding the
+    strings. Supports item access like the dictionary rows and attribute
+    access like UserRecord.
+    """
+
+    __slots__ = ('_values', '_positions', '_decoded')
+
+    def __init__(self, values: Sequence[Any], columns: Sequence[str] = USER_COLUMNS):
+        """
+        Args:
+            values: Raw row from a cursor(raw=True)
+            columns: Names of the selected columns, in row order
+        """
+        columns = tuple(columns)
+        positions = _POSITIONS.get(columns)
+        if positions is None:
+            positions = _POSITIONS[columns] = {name: index for index, name in enumerate(columns)}
+        self._values = values
+        self._positions = positions
+        self._decoded: Optional[List[Any]] = None
+
+    def __getitem__(self, key: str) -> Any:
+        position = self._positions[key]
+        decoded = self._decoded
+        if decoded is None:
+            decoded = self._decoded = [_UNDECODED] * len(self._positions)
+        value = decoded[position]
+        if value is _UNDECODED:
+            value = decoded[position] = _decode_column(key, self._values[position])
+        return value
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._positions
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Returns a column, or default if it was not selected"""
+        return self[key] if key in self._positions else default
+
+    def keys(self) -> Iterable[str]:
+        """Returns the selected column names"""
+        return self._positions.keys()
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Decodes every column into the dictionary the generators yield by default"""
+        return {name: self[name] for name in self._positions}
+
+    def __repr__(self) -> str:
+        return f"LazyUserRow({self.as_dict()!r})"
+
+
+def lazy_rows(rows: Sequence[Sequence[Any]],
+              columns: Sequence[str] = USER_COLUMNS) -> List[LazyUserRow]:
+    """Wraps raw cursor rows in LazyUserRow views without decoding them"""
+    return [LazyUserRow(row, columns) for row in rows]
+
+
+BATCH_FORMATS: Dict[str, Callable[[Sequence[Sequence[Any]]], Any]] = {
+    'dict': rows_to_dicts,
+    'record': rows_to_records,
+    'columnar': UserColumns.from_rows,
+    'lazy': lazy_rows,
+}
+
+# Formats built from a raw cursor (bytes values, age selected as an integer)
+RAW_FORMATS = ('lazy',)
+
+# Formats that can hold a projection of the user_data columns
+PROJECTING_FORMATS = ('dict', 'lazy')
+
+
+def convert_batch(rows: Sequence[Sequence[Any]], format: str = 'dict',
+                  columns: Sequence[str] = USER_COLUMNS) -> Any:
+    """
+    Converts a batch of cursor rows to the requested representation
+
+    Args:
+        rows: Rows whose values are in the order of columns
+        format: 'dict' (list of dicts), 'record' (list of UserRecord),
+            'columnar' (UserColumns) or 'lazy' (list of LazyUserRow over
+            raw cursor rows)
+        columns: Names of the selected columns; projections other than
+            all four columns are only supported by 'dict' and 'lazy'
+
+    Returns:
+        The converted batch
+
+    Raises:
+        ValueError: If the format is unknown or cannot hold the projection
+    """
+    check_format(format, columns)
+    if format in PROJECTING_FORMATS:
+        return BATCH_FORMATS[format](rows, columns)
+    return BATCH_FORMATS[format](rows)
+
+
+def check_format(format: str, columns: Sequence[str] = USER_COLUMNS) -> None:
+    """
+    Checks that a batch format exists and can represent the selected columns
+
+    Args:
+        format: Batch format name
+        columns: Names of the selected columns
+
+    Raises:
+        ValueError: If the format is unknown or cannot hold the projection
+    """
+    if format not in BATCH_FORMATS:
+        raise ValueError(f"Unknown batch format: {format}")
+    if format not in PROJECTING_FORMATS and tuple(columns) != USER_COLUMNS:
+        raise ValueError(f"The '{format}' format needs all columns; use format='dict' with a projection")
+
+
+# Length-prefixed binary encoding of (user_id, name, email, age) rows.
+# A record is a little-endian uint32 payload length followed by the payload:
+# three uint16-length-prefixed UTF-8 strings and a uint16 age.
+BINARY_MAGIC = b'UDB1'
+_LENGTH = struct.Struct('<I')
+_FIELD_LENGTH = struct.Struct('<H')
+
+
+def pack_user(row: Sequence[Any]) -> bytes:
+    """
+    Encodes one (user_id, name, email, age) row as a binary record
+
+    Args:
+        row: The row to encode
+
+    Returns:
+        bytes: Length-prefixed record
+    """
+    user_id, name, email = (value.encode('utf-8') for value in row[:3])
+    payload = b''.join((
+        _FIELD_LENGTH.pack(len(user_id)), user_id,
+        _FIELD_LENGTH.pack(len(name)), name,
+        _FIELD_LENGTH.pack(len(email)), email,
+        _FIELD_LENGTH.pack(int(row[3])),
+    ))
+    return _LENGTH.pack(len(payload)) + payload
+
+
+def unpack_user(payload: bytes) -> Tuple[str, str, str, int]:
+    """
+    Decodes the payload of one binary record (without its length prefix)
+
+    Args:
+        payload: Record payload
+
+    Returns:
+        Tuple of (user_id, name, email, age)
+    """
+    fields = []
+    offset = 0
+    for _ in range(3):
+        (length,) = _FIELD_LENGTH.unpack_from(payload, offset)
+        offset += 2
+        fields.append(payload[offset:offset + length].decode('utf-8'))
+        offset += length
+    (age,) = _FIELD_LENGTH.unpack_from(payload, offset)
+    return fields[0], fields[1], fields[2], age
+
+
+def read_users(stream: BinaryIO) -> Iterator[Tuple[str, str, str, int]]:
+    """
+    Decodes binary records from a stream until it is exhausted
+
+    Args:
+        stream: Binary stream positioned at the first record
+
+    Yields:
+        Tuple of (user_id, name, email, age)
+
+    Raises:
+        ValueError: If the stream ends in the middle of a record
+    """
+    read = stream.read
+    while True:
+        prefix = read(4)
+        if not prefix:
+            return
+        if len(prefix) < 4:
+            raise ValueError("Truncated record length")
+        (length,) = _LENGTH.unpack(prefix)
+        payload = read(length)
+        if len(payload) < length:
+            raise ValueError("Truncated record payload")
+        yield unpack_user(payload)
@@ -0,0 +1,355 @@
+#!/usr/bin/python3
+"""
+Single-pass, fixed-memory sampling of user_data
+
+    reservoir_sample          uniform sample of k items from any stream
+                              (Algorithm L: draws how many items to skip,
+                              so skipped items are never looked at)
+    reservoir_sample_batches  the same over stream_users_in_batches(),
+                              stepping over skipped rows by index
+    sample_users              k users straight from the table, read with a
+                              raw cursor; only the sampled rows are decoded
+    stratified_sample         k items per stratum, e.g. per age band
+    sample_by_key_range       server-side sample reading only a fraction of
+                              the table through primary-key ranges
+
+Usage: ./sampling.py K [SEED]
+"""
+
+import math
+import random
+import sys
+import uuid
+from bisect import bisect_right
+from itertools import islice
+from typing import Any, Callable, Dict, Generator, Hashable, Iterable, List, Optional, Sequence, Union
+
+import seed
+import parallel_scan
+from records import LazyUserRow, rows_to_dicts
+
+
+_END = object()
+
+# Lower bounds of the age bands used for stratified sampling
+AGE_BANDS = (18, 25, 35, 50, 65)
+AGE_BAND_LABELS = ('<18', '18-24', '25-34', '35-49', '50-64', '65+')
+
+KEY_SPACE = 1 << 128
+
+
+def _random_generator(rng: Union[random.Random, int, None]) -> random.Random:
+    return rng if isinstance(rng, random.Random) else random.Random(rng)
+
+
+class Reservoir:
+    """
+    Uniform reservoir of at most k items (Li's Algorithm L)
+
+    Once the reservoir is full, the number of items to pass over before
+    the next replacement is drawn directly; skip holds how many remain, so
+    callers that can step over items in bulk (see reservoir_sample) never
+    touch them.
+
+    Example:
+        >>> reservoir = Reservoir(3, random.Random(7))
+        >>> for n in range(1000):
+        ...     reservoir.offer(n)
+        >>> len(reservoir.items), reservoir.seen
+        (3, 1000)
+    """
+
+    def __init__(self, k: int, rng: Union[random.Random, int, None] = None):
+        """
+        Args:
+            k: Sample size
+            rng: Random generator or seed
+        """
+        if k < 1:
+            raise ValueError("Sample size must be positive")
+        self.k = k
+        self.items: List[Any] = []
+        self.seen = 0
+        self.skip = 0
+        self._rng = _random_generator(rng)
+        self._w = 1.0
+
+    def _uniform(self) -> float:
+        """Uniform draw from the open interval (0, 1)"""
+        value = self._rng.random()
+        while value == 0.0:
+            value = self._rng.random()
+        return value
+
+    def _draw_skip(self) -> None:
+        self._w *= math.exp(math.log(self._uniform()) / self.k)
+        self.skip = int(math.log(self._uniform()) / math.log1p(-self._w))
+
+    @property
+    def full(self) -> bool:
+        return len(self.items) >= self.k
+
+    def offer(self, item: Any) -> None:
+        """
+        Passes one item through the reservoir
+
+        Args:
+            item: The next item of the stream
+        """
+        self.seen += 1
+        if len(self.items) < self.k:
+            self.items.append(item)
+            if len(self.items) == self.k:
+                self._draw_skip()
+        elif self.skip:
+            self.skip -= 1
+        else:
+            self.items[self._rng.randrange(self.k)] = item
+            self._draw_skip()
+
+    def replace(self, item: Any) -> None:
+        """
+        Admits an item once skip has been stepped over by the caller
+
+        Args:
+            item: The item following the skipped ones
+        """
+        self.seen += 1
+        self.items[self._rng.randrange(self.k)] = item
+        self._draw_skip()
+
+
+def reservoir_sample(items: Iterable[Any], k: int,
+                     rng: Union[random.Random, int, None] = None) -> List[Any]:
+    """
+    Draws a uniform sample of k items in one pass
+
+    Skipped items are consumed with islice() and never bound to a Python
+    name, so with a raw source (e.g. cursor rows) they are never converted.
+
+    Args:
+        items: Stream of items
+        k: Sample size
+        rng: Random generator or seed, for reproducible samples
+
+    Returns:
+        List of min(k, number of items) items, in no particular order
+    """
+    reservoir = Reservoir(k, rng)
+    iterator = iter(items)
+    for item in islice(iterator, k):
+        reservoir.offer(item)
+    if not reservoir.full:
+        return reservoir.items
+
+    while True:
+        if reservoir.skip:
+            # Consume skip items without keeping any of them
+            if next(islice(iterator, reservoir.skip - 1, reservoir.skip), _END) is _END:
+                break
+            reservoir.seen += reservoir.skip
+        item = next(iterator, _END)
+        if item is _END:
+            break
+        reservoir.replace(item)
+    return reservoir.items
+
+
+def reservoir_sample_batches(batches: Iterable[Sequence[Any]], k: int,
+                             rng: Union[random.Random, int, None] = None) -> List[Any]:
+    """
+    Draws a uniform sample of k users from stream_users_in_batches() output
+
+    Whole runs of skipped rows are stepped over by index arithmetic, so
+    only the sampled rows of a batch are ever accessed (for 'columnar'
+    batches only those rows become UserRecords).
+
+    Args:
+        batches: Batches in any stream_users_in_batches() format
+        k: Sample size
+        rng: Random generator or seed
+
+    Returns:
+        List of sampled users, in the batches' item type
+    """
+    reservoir = Reservoir(k, rng)
+    for batch in batches:
+        size = len(batch)
+        index = 0
+        while index < size and not reservoir.full:
+            reservoir.offer(batch[index])
+            index += 1
+        while index < size:
+            remaining = size - index
+            if reservoir.skip >= remaining:
+                reservoir.skip -= remaining
+                reservoir.seen += remaining
+                break
+            index += reservoir.skip
+            reservoir.seen += reservoir.skip
+            reservoir.replace(batch[index])
+            index += 1
+    return reservoir.items
+
+
+def sample_users(k: int, rng: Union[random.Random, int, None] = None,
+                 where: Optional[seed.WhereSpec] = None,
+                 columns: Optional[Sequence[str]] = None,
+                 fetch_size: int = 5000) -> List[Dict[str, Any]]:
+    """
+    Draws a uniform sample of k users with one pass over the table
+
+    Rows are read with an unbuffered raw cursor, so the connector hands
+    over undecoded bytes; only the sampled rows are decoded into
+    dictionaries.
+
+    Args:
+        k: Sample size
+        rng: Random generator or seed
+        where: Filter evaluated by the database, e.g. ("age", ">", 25)
+        columns: Columns to fetch; None fetches all
+        fetch_size: Rows per fetchmany() round trip
+
+    Returns:
+        List of user dictionaries
+    """
+    selected = seed.compile_columns(columns)
+    conditions, params = seed.compile_where(where)
+    with seed.pooled_connection() as connection:
+        cursor = connection.cursor(buffered=False, raw=True)
+        try:
+            cursor.execute(seed.select_users_sql(selected, conditions, raw=True), params)
+            rows = reservoir_sample(seed.fetch_rows(cursor, fetch_size), k, rng)
+        finally:
+            cursor.close()
+    return [LazyUserRow(row, selected).as_dict() for row in rows]
+
+
+def age_band(user: Any) -> str:
+    """
+    Returns the AGE_BAND_LABELS label of a user
+
+    Args:
+        user: Dictionary or UserRecord with an 'age'
+
+    Returns:
+        str: Band label, e.g. '25-34'
+    """
+    return AGE_BAND_LABELS[bisect_right(AGE_BANDS, user['age'])]
+
+
+def stratified_sample(users: Iterable[Any], per_stratum: int,
+                      key: Callable[[Any], Hashable] = age_band,
+                      rng: Union[random.Random, int, None] = None) -> Dict[Hashable, Reservoir]:
+    """
+    Draws a uniform sample of per_stratum users from every stratum in one pass
+
+    Each stratum has its own Algorithm L reservoir, so a rare band is
+    sampled as fully as a common one.
+
+    Args:
+        users: Stream of users, e.g. stream_users()
+        per_stratum: Sample size per stratum
+        key: Function mapping a user to its stratum (age band by default)
+        rng: Random generator or seed
+
+    Returns:
+        Dictionary of stratum -> Reservoir; its items are the stratum's
+        sample and its seen count the stratum's population (seen / len(items)
+        is the weight of a sampled user when estimating totals)
+    """
+    rng = _random_generator(rng)
+    reservoirs: Dict[Hashable, Reservoir] = {}
+    for user in users:
+        stratum = key(user)
+        reservoir = reservoirs.get(stratum)
+        if reservoir is None:
+            reservoir = reservoirs[stratum] = Reservoir(per_stratum, rng)
+        reservoir.offer(user)
+    return reservoirs
+
+
+def key_sample_ranges(fraction: float, slices: int = 16,
+                      rng: Union[random.Random, int, None] = None) -> List[parallel_scan.KeyRange]:
+    """
+    Picks user_id ranges covering a fraction of the UUID key space
+
+    The key space is cut into equal slices and a randomly placed range of
+    fraction of each slice is taken, so the sample is spread over the
+    whole table.
+
+    Args:
+        fraction: Share of the key space to cover, in (0, 1]
+        slices: Number of ranges
+        rng: Random generator or seed
+
+    Returns:
+        List of (low, high) user_id ranges; high is None at the top of the space
+    """
+    if not 0 < fraction <= 1:
+        raise ValueError("fraction must be in (0, 1]")
+    rng = _random_generator(rng)
+    width = KEY_SPACE // slices
+    span = max(1, int(width * fraction))
+    ranges = []
+    for index in range(slices):
+        low = index * width + rng.randrange(width - span + 1)
+        high = low + span
+        ranges.append((str(uuid.UUID(int=low)),
+                       str(uuid.UUID(int=high)) if high < KEY_SPACE else None))
+    return ranges
+
+
+def sample_by_key_range(fraction: float, rng: Union[random.Random, int, None] = None,
+                        slices: int = 16, where: Optional[seed.WhereSpec] = None,
+                        columns: Optional[Sequence[str]] = None,
+                        fetch_size: int = 5000) -> Generator[Dict[str, Any], None, None]:
+    """
+    Streams an approximately fraction-sized sample read through primary-key ranges
+
+    user_id values are random (UUID4), so a user_id range is a random
+    subset of users: the database reads only the rows inside the ranges,
+    not the whole table. The sample size is fraction * table size on
+    average rather than fixed, and the estimate is only unbiased while
+    user_ids stay UUID4.
+
+    Args:
+        fraction: Share of users to sample, in (0, 1]
+        rng: Random generator or seed
+        slices: Number of key ranges the sample is spread over
+        where: Additional filter evaluated by the database
+        columns: Columns to fetch; None fetches all
+        fetch_size: Rows per fetchmany() round trip
+
+    Yields:
+        User dictionaries, in user_id order
+    """
+    selected = seed.compile_columns(columns)
+    conditions, params = seed.compile_where(where)
+    range_sql = []
+    for key_range in key_sample_ranges(fraction, slices, rng):
+        sql, range_params = parallel_scan.range_conditions(key_range)
+        range_sql.append("(" + " AND ".join(sql) + ")")
+        params = params + range_params
+    conditions = conditions + ["(" + " OR ".join(range_sql) + ")"]
+    query = seed.select_users_sql(selected, conditions) + " ORDER BY user_id"
+
+    with seed.pooled_connection() as connection:
+        cursor = connection.cursor(buffered=False)
+        try:
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                yield from rows_to_dicts(rows, selected)
+        finally:
+            cursor.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: ./sampling.py K [SEED]")
+        sys.exit(1)
+    for user in sample_users(int(sys.argv[1]), int(sys.argv[2]) if len(sys.argv) > 2 else None):
+        print(user)
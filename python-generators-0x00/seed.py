@@ -6,9 +6,33 @@ Sets up MySQL database and provides a generator to stream rows one by one
 
 import mysql.connector
 import csv
+import json
 import uuid
 import os
-from typing import Generator, Tuple, Any, Optional
+import queue
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Generator, Tuple, Any, Optional, Dict, Callable, Iterator, Iterable, TypeVar, List, Sequence, Union
+
+from records import USER_COLUMNS, OPERATORS, LazyUserRow
+
+
+T = TypeVar('T')
+
+# A filter is one (column, operator, value) triple or a sequence of them (ANDed)
+Condition = Tuple[str, str, Any]
+WhereSpec = Union[Condition, Sequence[Condition]]
+
+
+# Connection settings for the ALX_prodev database
+PRODEV_CONFIG = {
+    'host': 'localhost',
+    'user': 'root',       # Replace with your MySQL username
+    'password': '',       # Replace with your MySQL password
+    'database': 'ALX_prodev',
+}
 
 
 def connect_db() -> Optional[mysql.connector.MySQLConnection]:
@@ -46,26 +70,306 @@ def create_database(connection: mysql.connector.MySQLConnection) -> None:
         print(f"Error creating database: {e}")
 
 
-def connect_to_prodev() -> Optional[mysql.connector.MySQLConnection]:
+def connect_to_prodev(**options: Any) -> Optional[mysql.connector.MySQLConnection]:
     """
     Connects to the ALX_prodev database in MySQL
     
+    Args:
+        **options: Extra mysql.connector.connect() arguments, e.g.
+            allow_local_infile=True for bulk loads
+    
     Returns:
         MySQLConnection: Connection object to ALX_prodev database or None if failed
     """
     try:
-        connection = mysql.connector.connect(
-            host='localhost',
-            user='root',      # Replace with your MySQL username
-            password='',      # Replace with your MySQL password
-            database='ALX_prodev'
-        )
+        connection = mysql.connector.connect(**{**PRODEV_CONFIG, **options})
         return connection
     except mysql.connector.Error as e:
         print(f"Error connecting to ALX_prodev database: {e}")
         return None
 
 
+class ConnectionPool:
+    """
+    Bounded pool of reusable connections to the ALX_prodev database
+    
+    Connections are created lazily up to max_size. A borrower waits up to
+    checkout_timeout seconds for a free connection, connections that fail
+    the health check on borrow are replaced, and connections left idle for
+    longer than idle_timeout seconds are closed.
+    """
+    
+    def __init__(self, max_size: int = 8, checkout_timeout: float = 10.0,
+                 idle_timeout: float = 300.0, validate_after: float = 5.0,
+                 factory: Optional[Callable[[], Any]] = None):
+        """
+        Args:
+            max_size: Maximum number of open connections
+            checkout_timeout: Seconds to wait for a free connection before failing
+            idle_timeout: Seconds an idle connection is kept before it is closed
+            validate_after: Connections idle for longer than this many seconds
+                are pinged before being handed out
+            factory: Callable returning a new connection (defaults to ALX_prodev)
+        """
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.idle_timeout = idle_timeout
+        self.validate_after = validate_after
+        self._factory = factory or self._connect
+        self._cond = threading.Condition()
+        self._idle = deque()        # (connection, released_at), most recent on the right
+        self._size = 0              # open connections, idle and in use
+        self._closed = False
+        self._stats = {
+            'created': 0,
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time': 0.0,
+            'max_wait_time': 0.0,
+            'timeouts': 0,
+            'health_check_failures': 0,
+            'evicted_idle': 0,
+        }
+    
+    @staticmethod
+    def _connect() -> mysql.connector.MySQLConnection:
+        # consume_results lets an unbuffered cursor be closed before all of
+        # its rows are read, e.g. when a consumer stops a stream early
+        return mysql.connector.connect(consume_results=True, **PRODEV_CONFIG)
+    
+    def _evict_idle(self, now: float) -> list:
+        """Removes idle connections past idle_timeout; caller holds the lock"""
+        expired = []
+        while self._idle and now - self._idle[0][1] > self.idle_timeout:
+            expired.append(self._idle.popleft()[0])
+        self._size -= len(expired)
+        self._stats['evicted_idle'] += len(expired)
+        return expired
+    
+    @staticmethod
+    def _close_quietly(connection: Any) -> None:
+        try:
+            connection.close()
+        except Exception:
+            pass
+    
+    def acquire(self, timeout: Optional[float] = None) -> mysql.connector.MySQLConnection:
+        """
+        Borrows a connection from the pool
+        
+        Args:
+            timeout: Seconds to wait for a free connection (defaults to checkout_timeout)
+        
+        Returns:
+            MySQLConnection: A healthy connection, to be handed back with release()
+        
+        Raises:
+            mysql.connector.errors.PoolError: If no connection frees up in time
+            mysql.connector.Error: If a new connection cannot be opened
+        """
+        timeout = self.checkout_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        waited = None
+        
+        while True:
+            connection = None
+            released_at = 0.0
+            create = False
+            with self._cond:
+                if self._closed:
+                    raise mysql.connector.errors.PoolError("Connection pool is closed")
+                now = time.monotonic()
+                expired = self._evict_idle(now)
+                
+                # Wait while every connection is in use
+                while not self._idle and self._size >= self.max_size:
+                    if waited is None:
+                        waited = now
+                        self._stats['waits'] += 1
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        self._record_wait(waited)
+                        raise mysql.connector.errors.PoolError(
+                            f"Timed out after {timeout}s waiting for a database connection")
+                    self._cond.wait(remaining)
+                    if self._closed:
+                        raise mysql.connector.errors.PoolError("Connection pool is closed")
+                
+                if self._idle:
+                    connection, released_at = self._idle.pop()
+                else:
+                    self._size += 1
+                    create = True
+                if waited is not None:
+                    self._record_wait(waited)
+                    waited = None
+            
+            for stale in expired:
+                self._close_quietly(stale)
+            
+            if create:
+                try:
+                    connection = self._factory()
+                except Exception:
+                    self._discard()
+                    raise
+                with self._cond:
+                    self._stats['created'] += 1
+                    self._stats['checkouts'] += 1
+                return connection
+            
+            # Health check on borrow, skipped for recently used connections
+            healthy = True
+            if time.monotonic() - released_at > self.validate_after:
+                try:
+                    healthy = connection.is_connected()
+                except Exception:
+                    healthy = False
+            if healthy:
+                with self._cond:
+                    self._stats['checkouts'] += 1
+                return connection
+            
+            with self._cond:
+                self._stats['health_check_failures'] += 1
+            self._close_quietly(connection)
+            self._discard()
+    
+    def _record_wait(self, started: float) -> None:
+        """Accounts for time spent waiting; caller holds the lock"""
+        waited = time.monotonic() - started
+        self._stats['wait_time'] += waited
+        self._stats['max_wait_time'] = max(self._stats['max_wait_time'], waited)
+    
+    def _discard(self) -> None:
+        """Frees the slot of a connection that will not come back"""
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+    
+    def release(self, connection: mysql.connector.MySQLConnection) -> None:
+        """
+        Returns a borrowed connection to the pool
+        
+        Any open transaction is rolled back; connections that cannot be reset
+        are closed instead of being reused.
+        
+        Args:
+            connection: Connection obtained from acquire()
+        """
+        try:
+            if connection.unread_result:
+                connection.consume_results()
+            connection.rollback()
+        except Exception:
+            self._close_quietly(connection)
+            self._discard()
+            return
+        
+        with self._cond:
+            if not self._closed:
+                self._idle.append((connection, time.monotonic()))
+                self._cond.notify()
+                return
+            self._size -= 1
+        self._close_quietly(connection)
+    
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None) -> Iterator[mysql.connector.MySQLConnection]:
+        """
+        Context manager that borrows a connection and always returns it
+        
+        Args:
+            timeout: Seconds to wait for a free connection (defaults to checkout_timeout)
+        
+        Yields:
+            MySQLConnection: A pooled connection
+        """
+        connection = self.acquire(timeout)
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns a snapshot of the pool counters for sizing the pool
+        
+        Returns:
+            Dictionary with current size, idle and in-use connections plus
+            cumulative checkouts, waits, wait time and eviction counts
+        """
+        with self._cond:
+            snapshot = dict(self._stats)
+            snapshot['max_size'] = self.max_size
+            snapshot['size'] = self._size
+            snapshot['idle'] = len(self._idle)
+            snapshot['in_use'] = self._size - len(self._idle)
+        checkouts = snapshot['checkouts']
+        snapshot['avg_wait_time'] = snapshot['wait_time'] / checkouts if checkouts else 0.0
+        return snapshot
+    
+    def close(self) -> None:
+        """Closes idle connections; borrowed ones are closed when released"""
+        with self._cond:
+            self._closed = True
+            idle = [connection for connection, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for connection in idle:
+            self._close_quietly(connection)
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(**pool_options: Any) -> ConnectionPool:
+    """
+    Returns the shared ALX_prodev connection pool, creating it on first use
+    
+    Args:
+        **pool_options: ConnectionPool arguments, only used when the pool is created
+    
+    Returns:
+        ConnectionPool: The process-wide pool
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool._closed:
+            _pool = ConnectionPool(**pool_options)
+        return _pool
+
+
+@contextmanager
+def pooled_connection(timeout: Optional[float] = None) -> Iterator[mysql.connector.MySQLConnection]:
+    """
+    Borrows a connection from the shared pool for the duration of a with block
+    
+    Args:
+        timeout: Seconds to wait for a free connection
+    
+    Yields:
+        MySQLConnection: A pooled connection to ALX_prodev
+    """
+    with get_pool().connection(timeout) as connection:
+        yield connection
+
+
+def pool_stats() -> Dict[str, Any]:
+    """
+    Returns the shared pool's counters (see ConnectionPool.stats)
+    
+    Returns:
+        Dictionary of pool statistics
+    """
+    return get_pool().stats()
+
+
 def create_table(connection: mysql.connector.MySQLConnection) -> None:
     """
     Creates a table user_data if it does not exist with the required fields
@@ -82,24 +386,186 @@ def create_table(connection: mysql.connector.MySQLConnection) -> None:
             name VARCHAR(255) NOT NULL,
             email VARCHAR(255) NOT NULL,
             age DECIMAL(3,0) NOT NULL,
-            INDEX idx_user_id (user_id)
+            created_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+            updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6)
+                ON UPDATE CURRENT_TIMESTAMP(6),
+            INDEX idx_user_id (user_id),
+            INDEX idx_age (age),
+            INDEX idx_updated_at (updated_at, user_id)
         )
         """
         
         cursor.execute(create_table_query)
-        print("Table user_data created successfully")
         cursor.close()
+        ensure_columns(connection)
+        ensure_indexes(connection)
+        print("Table user_data created successfully")
     except mysql.connector.Error as e:
         print(f"Error creating table: {e}")
 
 
-def insert_data(connection: mysql.connector.MySQLConnection, csv_file: str) -> None:
+# Change-tracking columns of user_data: column name -> definition
+TIMESTAMP_COLUMNS = {
+    'created_at': "TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6)",
+    'updated_at': "TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6)",
+}
+
+# Secondary indexes of user_data: index name -> indexed columns
+SECONDARY_INDEXES = {
+    'idx_age': '(age)',
+    'idx_updated_at': '(updated_at, user_id)',
+}
+
+
+def ensure_columns(connection: mysql.connector.MySQLConnection) -> None:
+    """
+    Adds the TIMESTAMP_COLUMNS missing from an existing user_data table
+    
+    Rows that predate the columns get the time of the ALTER TABLE.
+    
+    Args:
+        connection: MySQL connection object
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            "SELECT column_name FROM information_schema.columns "
+            "WHERE table_schema = DATABASE() AND table_name = 'user_data'"
+        )
+        existing = {row[0].lower() for row in cursor.fetchall()}
+        for name, definition in TIMESTAMP_COLUMNS.items():
+            if name not in existing:
+                cursor.execute(f"ALTER TABLE user_data ADD COLUMN {name} {definition}")
+                print(f"Added column {name} to user_data")
+    finally:
+        cursor.close()
+
+
+def ensure_indexes(connection: mysql.connector.MySQLConnection) -> None:
+    """
+    Adds any secondary index missing from an existing user_data table
+    
+    CREATE TABLE IF NOT EXISTS leaves tables created by older versions of
+    this script untouched, so new indexes are added here.
+    
+    Args:
+        connection: MySQL connection object
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            "SELECT DISTINCT index_name FROM information_schema.statistics "
+            "WHERE table_schema = DATABASE() AND table_name = 'user_data'"
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+        for name, columns in SECONDARY_INDEXES.items():
+            if name not in existing:
+                cursor.execute(f"CREATE INDEX {name} ON user_data {columns}")
+                print(f"Created index {name} on user_data")
+    finally:
+        cursor.close()
+
+
+def compile_columns(columns: Optional[Sequence[str]] = None) -> Tuple[str, ...]:
+    """
+    Validates a projection against the user_data columns
+    
+    Args:
+        columns: Column names to select, None for all columns
+    
+    Returns:
+        Tuple of column names, in the order given
+    
+    Raises:
+        ValueError: If a column does not exist or none are given
+    """
+    if columns is None:
+        return USER_COLUMNS
+    columns = tuple(columns)
+    if not columns:
+        raise ValueError("At least one column must be selected")
+    for column in columns:
+        if column not in USER_COLUMNS:
+            raise ValueError(f"Unknown column: {column}")
+    return columns
+
+
+def compile_where(where: Optional[WhereSpec] = None) -> Tuple[List[str], List[Any]]:
+    """
+    Compiles a filter spec into parameterized SQL conditions
+    
+    Column names and operators are checked against whitelists; values are
+    always passed as query parameters.
+    
+    Args:
+        where: ("age", ">", 25) or a sequence of such triples, ANDed together
+    
+    Returns:
+        Tuple of (list of SQL conditions, list of parameters)
+    
+    Raises:
+        ValueError: If a column or operator is not supported
+    
+    Example:
+        >>> compile_where(("age", ">", 25))
+        (['age > %s'], [25])
+    """
+    if not where:
+        return [], []
+    if isinstance(where[0], str):
+        where = [where]
+    
+    conditions = []
+    params = []
+    for column, op, value in where:
+        if column not in USER_COLUMNS:
+            raise ValueError(f"Unknown column: {column}")
+        if op not in OPERATORS:
+            raise ValueError(f"Unsupported operator: {op}")
+        conditions.append(f"{column} {op} %s")
+        params.append(value)
+    return conditions, params
+
+
+# Select-list expressions for raw cursors: the server sends age as integer digits
+RAW_COLUMN_SQL = {'age': "CAST(age AS UNSIGNED) AS age"}
+
+
+def select_users_sql(columns: Optional[Sequence[str]] = None,
+                     conditions: Sequence[str] = (),
+                     raw: bool = False) -> str:
+    """
+    Builds the SELECT ... FROM user_data [WHERE ...] part of a query
+    
+    Args:
+        columns: Column names to select, None for all columns
+        conditions: SQL conditions (e.g. from compile_where), ANDed together
+        raw: Query is for a raw cursor; age is cast to an integer in SQL
+            so it decodes with a plain int()
+    
+    Returns:
+        SQL string; callers append ORDER BY / LIMIT clauses
+    """
+    selected = compile_columns(columns)
+    if raw:
+        selected = tuple(RAW_COLUMN_SQL.get(column, column) for column in selected)
+    sql = f"SELECT {', '.join(selected)} FROM user_data"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    return sql
+
+
+def insert_data(connection: mysql.connector.MySQLConnection, csv_file: str,
+                batch_size: int = 100) -> None:
     """
     Inserts data in the database if it does not exist
     
+    For large files use bulk_insert_data instead.
+    
     Args:
         connection: MySQL connection object
         csv_file: Path to the CSV file containing user data
+        batch_size: Number of rows sent per executemany() call
     """
     try:
         # Check if data already exists
@@ -138,8 +604,8 @@ def insert_data(connection: mysql.connector.MySQLConnection, csv_file: str) -> N
                 batch_data.append((user_id, name, email, age))
                 inserted_count += 1
                 
-                # Insert in batches of 100 for efficiency
-                if len(batch_data) >= 100:
+                # Insert in batches for efficiency
+                if len(batch_data) >= batch_size:
                     cursor.executemany(insert_query, batch_data)
                     batch_data = []
             
@@ -161,66 +627,760 @@ def insert_data(connection: mysql.connector.MySQLConnection, csv_file: str) -> N
         connection.rollback()
 
 
-def create_sample_data(csv_file: str, num_records: int = 100) -> None:
+def csv_row_parser(header: Sequence[str]) -> Callable[[Sequence[str]], Tuple[str, str, str, int]]:
+    """
+    Returns a function turning a CSV record into a (user_id, name, email, age) tuple
+    
+    Column positions are resolved once from the header instead of building
+    a dictionary per row. Rows without a user_id column get a new UUID.
+    
+    Args:
+        header: The CSV header row
+    
+    Returns:
+        Callable taking a list of CSV fields
+    
+    Raises:
+        ValueError: If the header lacks name, email or age
+    """
+    positions = {name.strip(): i for i, name in enumerate(header)}
+    missing = [column for column in ('name', 'email', 'age') if column not in positions]
+    if missing:
+        raise ValueError(f"CSV header is missing columns: {', '.join(missing)}")
+    name_at, email_at, age_at = positions['name'], positions['email'], positions['age']
+    
+    if 'user_id' in positions:
+        id_at = positions['user_id']
+        return lambda fields: (fields[id_at], fields[name_at], fields[email_at], int(fields[age_at]))
+    return lambda fields: (str(uuid.uuid4()), fields[name_at], fields[email_at], int(fields[age_at]))
+
+
+def _load_checkpoint(checkpoint_file: str, csv_file: str) -> int:
+    """
+    Reads the number of rows already committed for csv_file, 0 if none
+    
+    A checkpoint written for a different or since modified CSV file is ignored.
+    """
+    try:
+        with open(checkpoint_file, 'r', encoding='utf-8') as file:
+            state = json.load(file)
+    except (OSError, ValueError):
+        return 0
+    stat = os.stat(csv_file)
+    if state.get('csv_file') != os.path.abspath(csv_file) or \
+            state.get('size') != stat.st_size or state.get('mtime') != stat.st_mtime:
+        print(f"Ignoring checkpoint {checkpoint_file}: it belongs to another version of the file")
+        return 0
+    return int(state.get('rows_committed', 0))
+
+
+def _save_checkpoint(checkpoint_file: str, csv_file: str, rows_committed: int) -> None:
+    """Atomically records how many CSV rows have been committed"""
+    stat = os.stat(csv_file)
+    state = {
+        'csv_file': os.path.abspath(csv_file),
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'rows_committed': rows_committed,
+    }
+    write_json_atomic(checkpoint_file, state)
+
+
+def write_json_atomic(path: str, state: Dict[str, Any]) -> None:
+    """
+    Writes a small JSON state file so readers never see a partial write
+    
+    Args:
+        path: Destination file
+        state: JSON-serializable dictionary
+    """
+    temp_file = f"{path}.tmp"
+    with open(temp_file, 'w', encoding='utf-8') as file:
+        json.dump(state, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_file, path)
+
+
+def local_infile_enabled(connection: mysql.connector.MySQLConnection) -> bool:
+    """
+    Checks whether the server accepts LOAD DATA LOCAL INFILE
+    
+    The client side must also allow it: open the connection with
+    connect_to_prodev(allow_local_infile=True).
+    
+    Args:
+        connection: MySQL connection object
+    
+    Returns:
+        bool: True if the server's local_infile variable is ON
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SHOW GLOBAL VARIABLES LIKE 'local_infile'")
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+    return row is not None and str(row[1]).upper() in ('ON', '1')
+
+
+def _drop_secondary_indexes(connection: mysql.connector.MySQLConnection) -> None:
+    """Drops the SECONDARY_INDEXES so a bulk load does not maintain them row by row"""
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            "SELECT DISTINCT index_name FROM information_schema.statistics "
+            "WHERE table_schema = DATABASE() AND table_name = 'user_data'"
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+        for name in SECONDARY_INDEXES:
+            if name in existing:
+                cursor.execute(f"DROP INDEX {name} ON user_data")
+    finally:
+        cursor.close()
+
+
+def _load_data_infile(connection: mysql.connector.MySQLConnection, csv_file: str,
+                      header: Sequence[str], line_terminator: str) -> int:
+    """
+    Loads the whole CSV file with one LOAD DATA LOCAL INFILE statement
+    
+    Returns:
+        int: Number of rows the server inserted
+    
+    Raises:
+        ValueError: If a header name is not a user_data column or repeats
+    """
+    names = [name.strip() for name in header]
+    for name in names:
+        if name not in USER_COLUMNS:
+            raise ValueError(f"Unknown column in CSV header: {name!r}")
+    if len(set(names)) != len(names):
+        raise ValueError("CSV header repeats a column")
+    # Names are checked against USER_COLUMNS, so quoting them is safe
+    columns = ', '.join(f"`{name}`" for name in names)
+    query = (
+        "LOAD DATA LOCAL INFILE %s IGNORE INTO TABLE user_data "
+        "CHARACTER SET utf8mb4 "
+        "FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' "
+        f"LINES TERMINATED BY '{line_terminator}' "
+        f"IGNORE 1 LINES ({columns})"
+    )
+    cursor = connection.cursor()
+    try:
+        cursor.execute(query, (os.path.abspath(csv_file),))
+        loaded = cursor.rowcount
+    finally:
+        cursor.close()
+    connection.commit()
+    return loaded
+
+
+def multi_row_insert_sql(rows: int) -> str:
+    """
+    Builds an INSERT IGNORE statement with placeholders for rows users
+    
+    Parameters are passed flattened: user_id, name, email, age of the first
+    row, then of the second row, and so on.
+    
+    Args:
+        rows: Number of rows in the statement
+    
+    Returns:
+        str: The SQL statement
+    """
+    return ("INSERT IGNORE INTO user_data (user_id, name, email, age) VALUES "
+            + ", ".join(["(%s, %s, %s, %s)"] * rows))
+
+
+def bulk_insert_data(connection: mysql.connector.MySQLConnection, csv_file: str,
+                     batch_size: int = 5000, commit_every: int = 50000,
+                     use_load_data: bool = True, defer_indexes: bool = False,
+                     checkpoint_file: Optional[str] = None,
+                     progress_every: float = 5.0) -> int:
+    """
+    Loads a large CSV file into user_data as fast as the server allows
+    
+    Uses LOAD DATA LOCAL INFILE when both client and server allow it.
+    Otherwise rows are sent as multi-row INSERT IGNORE ... VALUES statements
+    of batch_size rows with autocommit off, committing every commit_every
+    rows. After each commit the number of committed CSV records (blank
+    records are not counted) is written to checkpoint_file, and a later call
+    with the same file resumes after them.
+    
+    Args:
+        connection: MySQL connection object (open it with
+            connect_to_prodev(allow_local_infile=True) to enable LOAD DATA)
+        csv_file: Path to the CSV file with user_id, name, email, age columns
+        batch_size: Rows per INSERT statement
+        commit_every: Rows per transaction (rounded up to whole batches)
+        use_load_data: Try LOAD DATA LOCAL INFILE first
+        defer_indexes: Drop secondary indexes for the load and rebuild them
+            afterwards, which is faster than maintaining them row by row
+        checkpoint_file: Where to record progress (defaults to
+            '<csv_file>.checkpoint'); removed once the load completes
+        progress_every: Seconds between rows/sec progress reports
+    
+    Returns:
+        int: Number of CSV rows loaded by this call
+    
+    Raises:
+        mysql.connector.Error: If the load fails; committed chunks are kept
+            and the checkpoint lets the next call resume after them
+    """
+    checkpoint_file = checkpoint_file or f"{csv_file}.checkpoint"
+    
+    with open(csv_file, 'r', newline='', encoding='utf-8') as file:
+        first_line = file.readline()
+    header = next(csv.reader([first_line]))
+    line_terminator = '\\r\\n' if first_line.endswith('\r\n') else '\\n'
+    parse = csv_row_parser(header)
+    
+    start = time.perf_counter()
+    previous_autocommit = connection.autocommit
+    connection.autocommit = False
+    if defer_indexes:
+        _drop_secondary_indexes(connection)
+    
+    try:
+        if use_load_data and 'user_id' in (name.strip() for name in header):
+            try:
+                if local_infile_enabled(connection):
+                    loaded = _load_data_infile(connection, csv_file, header, line_terminator)
+                    elapsed = time.perf_counter() - start
+                    print(f"Loaded {loaded} rows with LOAD DATA in {elapsed:.1f}s "
+                          f"({loaded / max(elapsed, 1e-9):,.0f} rows/s)")
+                    return loaded
+            except mysql.connector.Error as e:
+                connection.rollback()
+                print(f"LOAD DATA LOCAL INFILE unavailable ({e}); falling back to INSERT batches")
+        
+        skip = _load_checkpoint(checkpoint_file, csv_file)
+        if skip:
+            print(f"Resuming after {skip} committed rows")
+        
+        full_batch_query = multi_row_insert_sql(batch_size)
+        
+        cursor = connection.cursor()
+        committed = skip
+        pending = 0
+        loaded = 0
+        last_report = start
+        try:
+            with open(csv_file, 'r', newline='', encoding='utf-8') as file:
+                reader = csv.reader(file)
+                next(reader)  # header
+                # Blank records are skipped without being counted, as in the load loop below
+                skipped = 0
+                while skipped < skip:
+                    fields = next(reader, None)
+                    if fields is None:
+                        break
+                    if fields:
+                        skipped += 1
+                
+                batch: List[Any] = []
+                for fields in reader:
+                    if not fields:
+                        continue
+                    batch.extend(parse(fields))
+                    if len(batch) < batch_size * 4:
+                        continue
+                    
+                    cursor.execute(full_batch_query, batch)
+                    pending += batch_size
+                    batch = []
+                    if pending >= commit_every:
+                        connection.commit()
+                        committed += pending
+                        loaded += pending
+                        pending = 0
+                        _save_checkpoint(checkpoint_file, csv_file, committed)
+                    
+                    now = time.perf_counter()
+                    if now - last_report >= progress_every:
+                        done = loaded + pending
+                        print(f"{committed + pending} rows loaded "
+                              f"({done / (now - start):,.0f} rows/s)")
+                        last_report = now
+                
+                if batch:
+                    rows = len(batch) // 4
+                    cursor.execute(multi_row_insert_sql(rows), batch)
+                    pending += rows
+                connection.commit()
+                committed += pending
+                loaded += pending
+        except Exception:
+            connection.rollback()
+            print(f"Load interrupted; {committed} rows committed, resume with the same checkpoint")
+            raise
+        finally:
+            cursor.close()
+        
+        if os.path.exists(checkpoint_file):
+            os.remove(checkpoint_file)
+        elapsed = time.perf_counter() - start
+        print(f"Loaded {loaded} rows in {elapsed:.1f}s ({loaded / max(elapsed, 1e-9):,.0f} rows/s)")
+        return loaded
+    finally:
+        if defer_indexes:
+            ensure_indexes(connection)
+        connection.autocommit = previous_autocommit
+
+
+def _sorted_by_user_id(rows: Iterable[Tuple[Any, ...]], side: str) -> Generator[Tuple[Any, ...], None, None]:
+    """Passes rows through, failing fast if user_ids are not strictly increasing"""
+    previous = None
+    for row in rows:
+        if previous is not None and row[0] <= previous:
+            raise ValueError(f"{side} is not sorted by user_id: {row[0]!r} follows {previous!r}")
+        previous = row[0]
+        yield row
+
+
+def diff_users(source: Iterable[Tuple[Any, ...]],
+               target: Iterable[Tuple[Any, ...]]) -> Generator[Tuple[str, Tuple[Any, ...]], None, None]:
+    """
+    Merge-joins two user streams sorted by user_id and yields the changes
+    that turn target into source
+    
+    Only the current row of each side is held in memory.
+    
+    Args:
+        source: Desired (user_id, name, email, age) rows, sorted by user_id
+        target: Current rows, sorted by user_id
+    
+    Yields:
+        ('insert', row), ('update', row) or ('delete', row) tuples
+    
+    Raises:
+        ValueError: If either side is not strictly sorted by user_id
+    """
+    source = _sorted_by_user_id(source, "Source")
+    target = _sorted_by_user_id(target, "Target")
+    new = next(source, None)
+    old = next(target, None)
+    while new is not None or old is not None:
+        if old is None or (new is not None and new[0] < old[0]):
+            yield 'insert', new
+            new = next(source, None)
+        elif new is None or old[0] < new[0]:
+            yield 'delete', old
+            old = next(target, None)
+        else:
+            if (new[1], new[2], int(new[3])) != (old[1], old[2], int(old[3])):
+                yield 'update', new
+            new = next(source, None)
+            old = next(target, None)
+
+
+def sync_data(connection: mysql.connector.MySQLConnection, csv_file: str,
+              batch_size: int = 1000, delete_missing: bool = True,
+              dry_run: bool = False) -> Dict[str, int]:
+    """
+    Brings user_data in line with a CSV file by applying only the differences
+    
+    The CSV file and the table are streamed side by side, both ordered by
+    user_id, and merge-joined; inserts, updates and deletes are sent in
+    batches of batch_size, each batch committed on its own. Neither side is
+    held in memory, so the cost is one sequential read of each plus writes
+    proportional to the delta.
+    
+    The CSV must have a user_id column and be sorted by it. user_id values
+    must sort the same in Python and in the column collation, which holds
+    for lowercase UUIDs.
+    
+    Args:
+        connection: MySQL connection used for the writes (the table is read
+            on a separate pooled connection)
+        csv_file: Path to the CSV file with the desired contents
+        batch_size: Rows per INSERT/UPDATE/DELETE statement
+        delete_missing: Delete users absent from the CSV
+        dry_run: Only count the differences, write nothing
+    
+    Returns:
+        Dictionary with the number of inserted, updated and deleted rows
+    
+    Raises:
+        ValueError: If the CSV lacks user_id or either side is unsorted
+        mysql.connector.Error: If a write fails; batches committed before it are kept
+    """
+    counts = {'inserted': 0, 'updated': 0, 'deleted': 0}
+    counted_as = {'insert': 'inserted', 'update': 'updated', 'delete': 'deleted'}
+    pending: Dict[str, List[Tuple[Any, ...]]] = {'insert': [], 'update': [], 'delete': []}
+    cursor = connection.cursor()
+    
+    def flush(kind: str) -> None:
+        rows = pending[kind]
+        if not rows:
+            return
+        if not dry_run:
+            if kind == 'delete':
+                cursor.execute(
+                    "DELETE FROM user_data WHERE user_id IN (" + ", ".join(["%s"] * len(rows)) + ")",
+                    [row[0] for row in rows]
+                )
+            else:
+                query = multi_row_insert_sql(len(rows))
+                if kind == 'update':
+                    query = query.replace("INSERT IGNORE", "INSERT", 1) + (
+                        " ON DUPLICATE KEY UPDATE name = VALUES(name), "
+                        "email = VALUES(email), age = VALUES(age)"
+                    )
+                cursor.execute(query, [value for row in rows for value in row])
+            connection.commit()
+        counts[counted_as[kind]] += len(rows)
+        pending[kind] = []
+    
+    try:
+        with open(csv_file, 'r', newline='', encoding='utf-8') as file, \
+                pooled_connection() as read_connection:
+            reader = csv.reader(file)
+            header = next(reader)
+            if 'user_id' not in (name.strip() for name in header):
+                raise ValueError("sync_data needs a CSV with a user_id column")
+            parse = csv_row_parser(header)
+            source = (parse(fields) for fields in reader if fields)
+            
+            read_cursor = read_connection.cursor(buffered=False)
+            try:
+                read_cursor.execute("SELECT user_id, name, email, age FROM user_data ORDER BY user_id")
+                target = fetch_rows(read_cursor, fetch_size=batch_size)
+                
+                for kind, row in diff_users(source, target):
+                    if kind == 'delete' and not delete_missing:
+                        continue
+                    pending[kind].append(row)
+                    if len(pending[kind]) >= batch_size:
+                        flush(kind)
+            finally:
+                read_cursor.close()
+        
+        for kind in pending:
+            flush(kind)
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    
+    print(f"Sync {'(dry run) ' if dry_run else ''}of {csv_file}: {counts['inserted']} inserted, "
+          f"{counts['updated']} updated, {counts['deleted']} deleted")
+    return counts
+
+
+def create_sample_data(csv_file: str, num_records: int = 100,
+                       random_seed: Optional[int] = None) -> None:
     """
     Creates sample CSV data if the original file is not found
     
+    Rows are assembled in bulk from pre-generated name and domain pools
+    (see datagen.py), which is orders of magnitude faster than calling Faker
+    for every field. For multi-million-row datasets use
+    datagen.generate_sample_shards, which writes shards in parallel.
+    
     Args:
         csv_file: Path to the CSV file to create
         num_records: Number of sample records to generate
+        random_seed: Seed for reproducible output; None for a random dataset
+    """
+    import datagen
+    
+    datagen.write_sample_csv(csv_file, num_records, random_seed)
+    print(f"Created sample CSV file '{csv_file}' with {num_records} records")
+
+
+class AdaptiveFetchSizer:
+    """
+    Chooses the fetchmany() batch size for a streaming cursor
+    
+    The size is capped so a batch stays within a byte budget (estimated from
+    the rows seen so far) and is steered towards a target fetch latency, so
+    a slow network or server gets smaller batches and a fast one larger ones.
+    """
+    
+    def __init__(self, target_bytes: int = 1 << 20, target_seconds: float = 0.05,
+                 initial_rows: int = 256, min_rows: int = 16, max_rows: int = 50000):
+        """
+        Args:
+            target_bytes: Approximate upper bound on the size of one batch
+            target_seconds: Fetch latency each batch should aim for
+            initial_rows: Size of the first batch
+            min_rows: Smallest batch size ever requested
+            max_rows: Largest batch size ever requested
+        """
+        self.target_bytes = target_bytes
+        self.target_seconds = target_seconds
+        self.min_rows = min_rows
+        self.max_rows = max_rows
+        self.size = max(min_rows, min(initial_rows, max_rows))
+        self.row_bytes: Optional[float] = None
+    
+    @staticmethod
+    def _estimate_row_bytes(rows: list) -> float:
+        # Sample a few rows; string/bytes columns dominate the row size
+        sample = rows[:8]
+        total = 0
+        for row in sample:
+            for value in row:
+                total += len(value) if isinstance(value, (str, bytes, bytearray)) else 8
+        return total / len(sample)
+    
+    def observe(self, rows: list, elapsed: float) -> None:
+        """
+        Updates the batch size after a fetch
+        
+        Args:
+            rows: The batch that was just fetched
+            elapsed: Seconds the fetch took
+        """
+        if not rows:
+            return
+        
+        row_bytes = self._estimate_row_bytes(rows)
+        # Exponential moving average smooths out uneven rows
+        self.row_bytes = row_bytes if self.row_bytes is None else 0.8 * self.row_bytes + 0.2 * row_bytes
+        byte_limit = self.target_bytes / max(self.row_bytes, 1.0)
+        
+        # Scale towards the latency target, at most doubling or halving per step
+        if elapsed > 0:
+            factor = min(2.0, max(0.5, self.target_seconds / elapsed))
+        else:
+            factor = 2.0
+        wanted = min(len(rows) * factor, byte_limit)
+        self.size = int(max(self.min_rows, min(wanted, self.max_rows)))
+
+
+def fetch_rows(cursor: Any, fetch_size: Optional[int] = None,
+               adaptive: bool = False,
+               sizer: Optional[AdaptiveFetchSizer] = None) -> Generator[Tuple[Any, ...], None, None]:
     """
-    import random
-    from faker import Faker
+    Yields the rows of an executed cursor one at a time
     
-    fake = Faker()
+    Args:
+        cursor: Cursor on which a query has been executed
+        fetch_size: Pull this many rows per fetchmany() call; None uses fetchone()
+        adaptive: Size each fetchmany() call with an AdaptiveFetchSizer
+        sizer: Sizer to use in adaptive mode (a default one is created otherwise)
     
-    with open(csv_file, 'w', newline='', encoding='utf-8') as file:
-        fieldnames = ['user_id', 'name', 'email', 'age']
-        writer = csv.DictWriter(file, fieldnames=fieldnames)
+    Yields:
+        Tuple: One row at a time
+    """
+    if adaptive:
+        sizer = sizer or AdaptiveFetchSizer()
+        while True:
+            start = time.perf_counter()
+            rows = cursor.fetchmany(sizer.size)
+            if not rows:
+                return
+            sizer.observe(rows, time.perf_counter() - start)
+            yield from rows
+    elif fetch_size:
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                return
+            yield from rows
+    else:
+        while True:
+            row = cursor.fetchone()
+            if row is None:
+                return
+            yield row
+
+
+class StreamCheckpoint:
+    """
+    Progress of a stream ordered by user_id: the last user_id the consumer
+    finished with and the number of rows streamed so far
+    
+    The state is written to a small JSON file every `every` rows and when
+    the stream ends, so a restarted job can resume after last_user_id with
+    a keyset predicate instead of starting from row zero.
+    """
+    
+    def __init__(self, path: Optional[str] = None, every: int = 10000,
+                 last_user_id: Optional[str] = None, rows: int = 0):
+        """
+        Args:
+            path: State file to write, None to keep the checkpoint in memory only
+            every: Save after this many rows
+            last_user_id: user_id of the last row already processed
+            rows: Number of rows already processed
+        """
+        self.path = path
+        self.every = every
+        self.last_user_id = last_user_id
+        self.rows = rows
+        self.complete = False
+    
+    @classmethod
+    def load(cls, path: str, every: int = 10000) -> 'StreamCheckpoint':
+        """
+        Reads a checkpoint file; a missing file gives an empty checkpoint
+        
+        Args:
+            path: State file written by a previous stream
+            every: Save interval for the resumed stream
         
-        writer.writeheader()
+        Returns:
+            StreamCheckpoint: The saved progress
+        """
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                state = json.load(file)
+        except FileNotFoundError:
+            return cls(path, every)
+        checkpoint = cls(path, every, state.get('last_user_id'), int(state.get('rows', 0)))
+        checkpoint.complete = bool(state.get('complete', False))
+        return checkpoint
+    
+    def advance(self, user_id: str) -> None:
+        """
+        Records that the consumer is done with the row user_id
         
-        for i in range(num_records):
-            writer.writerow({
-                'user_id': str(uuid.uuid4()),
-                'name': fake.name(),
-                'email': fake.email(),
-                'age': random.randint(18, 100)
+        Args:
+            user_id: user_id of the processed row
+        """
+        self.last_user_id = user_id
+        self.rows += 1
+        if self.rows % self.every == 0:
+            self.save()
+    
+    def save(self) -> None:
+        """Writes the current progress to the state file, if there is one"""
+        if self.path is not None:
+            write_json_atomic(self.path, {
+                'last_user_id': self.last_user_id,
+                'rows': self.rows,
+                'complete': self.complete,
+                'saved_at': time.time(),
             })
+
+
+def open_checkpoint(checkpoint_file: Optional[str] = None, checkpoint_every: int = 10000,
+                    resume_from: Union[str, StreamCheckpoint, None] = None) -> Optional[StreamCheckpoint]:
+    """
+    Resolves the checkpoint options shared by the stream functions
     
-    print(f"Created sample CSV file '{csv_file}' with {num_records} records")
+    Args:
+        checkpoint_file: Where to save progress; defaults to the file of
+            resume_from when resuming from a path
+        checkpoint_every: Save after this many rows
+        resume_from: Checkpoint file path or StreamCheckpoint to continue from
+    
+    Returns:
+        StreamCheckpoint to advance while streaming, or None when
+        checkpointing is not requested
+    """
+    if isinstance(resume_from, StreamCheckpoint):
+        checkpoint = StreamCheckpoint(checkpoint_file or resume_from.path, checkpoint_every,
+                                      resume_from.last_user_id, resume_from.rows)
+    elif resume_from is not None:
+        checkpoint = StreamCheckpoint.load(resume_from, checkpoint_every)
+        checkpoint.path = checkpoint_file or resume_from
+    elif checkpoint_file is not None:
+        checkpoint = StreamCheckpoint(checkpoint_file, checkpoint_every)
+    else:
+        return None
+    checkpoint.complete = False
+    return checkpoint
 
 
-def stream_users(connection: mysql.connector.MySQLConnection) -> Generator[Tuple[Any, ...], None, None]:
+def raw_user_id(row: Sequence[Any]) -> str:
+    """
+    Decodes the user_id of a raw cursor row (e.g. for checkpointed)
+    
+    Args:
+        row: Row from a cursor(raw=True) with user_id first
+    
+    Returns:
+        str: The user_id
+    """
+    return bytes(row[0]).decode('ascii')
+
+
+def checkpointed(rows: Iterable[T], checkpoint: Optional[StreamCheckpoint],
+                 key: Callable[[T], str] = lambda row: row[0]) -> Generator[T, None, None]:
+    """
+    Passes rows through, advancing the checkpoint once the consumer has
+    finished with each row (i.e. when it asks for the next one)
+    
+    Args:
+        rows: Rows ordered by user_id
+        checkpoint: Checkpoint to advance, None to pass rows through untouched
+        key: Extracts the user_id from a row
+    
+    Yields:
+        The rows, unchanged
+    """
+    if checkpoint is None:
+        yield from rows
+        return
+    try:
+        for row in rows:
+            yield row
+            checkpoint.advance(key(row))
+        checkpoint.complete = True
+    finally:
+        checkpoint.save()
+
+
+def stream_users(connection: mysql.connector.MySQLConnection,
+                 fetch_size: Optional[int] = None,
+                 adaptive: bool = False,
+                 checkpoint_file: Optional[str] = None,
+                 checkpoint_every: int = 10000,
+                 resume_from: Union[str, StreamCheckpoint, None] = None,
+                 raw: bool = False) -> Generator[Any, None, None]:
     """
     Generator that streams rows from user_data table one by one
     
     Args:
         connection: MySQL connection object
+        fetch_size: Buffer this many rows per fetchmany() round trip instead
+            of calling fetchone() for every row
+        adaptive: Size the fetchmany() buffer automatically from a byte
+            budget and the measured fetch time (overrides fetch_size)
+        checkpoint_file: Save the last processed user_id and the row count
+            to this file every checkpoint_every rows and at the end
+        checkpoint_every: Rows between checkpoint saves
+        resume_from: Checkpoint file (or StreamCheckpoint) of an earlier run;
+            streaming continues after its last user_id
+        raw: Read with a raw cursor and yield records.LazyUserRow views that
+            decode a column only when it is accessed
     
     Yields:
-        Tuple: One row from the user_data table as (user_id, name, email, age)
+        Tuple: One row from the user_data table as (user_id, name, email, age),
+        or a LazyUserRow in raw mode
     
     Raises:
         mysql.connector.Error: If there's a database error during streaming
     """
+    checkpoint = open_checkpoint(checkpoint_file, checkpoint_every, resume_from)
     cursor = None
     try:
         # Use a server-side cursor for efficient memory usage with large datasets
-        cursor = connection.cursor(buffered=False)
+        cursor = connection.cursor(buffered=False, raw=raw)
         
-        # Execute query to get all users
-        query = "SELECT user_id, name, email, age FROM user_data ORDER BY user_id"
-        cursor.execute(query)
+        # Execute query to get all users, after the checkpoint when resuming
+        if checkpoint is not None and checkpoint.last_user_id is not None:
+            query = select_users_sql(None, ["user_id > %s"], raw) + " ORDER BY user_id"
+            cursor.execute(query, (checkpoint.last_user_id,))
+            print(f"Resuming stream after {checkpoint.rows} rows (user_id {checkpoint.last_user_id})...")
+        else:
+            query = select_users_sql(None, (), raw) + " ORDER BY user_id"
+            cursor.execute(query)
         
         print("Starting to stream users from database...")
         
         # Stream rows one by one using generator
-        while True:
-            row = cursor.fetchone()
-            if row is None:
-                break
-            yield row
+        rows = fetch_rows(cursor, fetch_size, adaptive)
+        if raw:
+            yield from map(LazyUserRow, checkpointed(rows, checkpoint, raw_user_id))
+        else:
+            yield from checkpointed(rows, checkpoint)
             
     except mysql.connector.Error as e:
         print(f"Database error during streaming: {e}")
@@ -302,6 +1462,83 @@ def get_user_count(connection: mysql.connector.MySQLConnection) -> int:
         return 0
 
 
+_PREFETCH_DONE = object()
+
+
+def prefetch(source_factory: Callable[[], Iterable[T]], depth: int = 2) -> Generator[T, None, None]:
+    """
+    Runs a page/batch generator on a background thread, keeping up to
+    depth items buffered ahead of the consumer
+    
+    The producer blocks once the buffer is full, so at most depth items are
+    held in memory. If the consumer stops early (break, exception or close()),
+    the producer is told to stop, its source generator is closed on the
+    producer thread (releasing any connection it holds) and the thread is
+    joined before this generator finishes.
+    
+    Args:
+        source_factory: Zero-argument callable returning the iterable to
+            prefetch; it is called on the background thread
+        depth: Maximum number of items fetched ahead of the consumer
+    
+    Yields:
+        The items of the source, in order
+    
+    Raises:
+        Any exception raised by the source, re-raised on the consumer side
+    """
+    if depth < 1:
+        raise ValueError("depth must be at least 1")
+    
+    buffer: queue.Queue = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    
+    def put(item: Any) -> bool:
+        # Backpressure: wait for room, but give up as soon as we are stopped
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def produce() -> None:
+        source = None
+        error = None
+        try:
+            source = iter(source_factory())
+            for item in source:
+                if not put((item, None)):
+                    break
+        except BaseException as e:
+            error = e
+        finally:
+            if source is not None and hasattr(source, 'close'):
+                source.close()
+        put((_PREFETCH_DONE, error))
+    
+    producer = threading.Thread(target=produce, name='seed-prefetch', daemon=True)
+    producer.start()
+    try:
+        while True:
+            item, error = buffer.get()
+            if item is _PREFETCH_DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+        # Drain so a producer blocked on a full buffer notices the stop
+        while True:
+            try:
+                buffer.get_nowait()
+            except queue.Empty:
+                break
+        producer.join()
+
+
 # Example usage and demonstration
 if __name__ == "__main__":
     # Demo the streaming functionality
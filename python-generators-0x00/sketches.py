@@ -0,0 +1,806 @@
+#!/usr/bin/python3
+"""
+Mergeable approximate sketches over the user stream
+
+Each sketch consumes values one at a time in fixed memory, can be merged
+with a sketch of the same shape built over another part of the data (e.g.
+one key range of a parallel scan), and round-trips through to_bytes() /
+from_bytes():
+
+    HyperLogLog      distinct counts (e.g. distinct email domains)
+    KLLSketch        quantiles with a bounded rank error (e.g. age percentiles)
+    CountMinSketch   frequency estimates that never under-count
+    HeavyHitters     top-k items: a Count-Min sketch plus a heap of candidates
+
+UserSketches bundles the three dashboard metrics and can be fed from
+stream_users(), from any batch format of stream_users_in_batches(), or
+built per key range in worker processes with sketch_parallel().
+
+Usage: ./sketches.py [WORKERS]
+"""
+
+import hashlib
+import heapq
+import math
+import os
+import random
+import struct
+import sys
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import seed
+import parallel_scan
+from records import UserColumns, email_domain
+
+
+_U64 = struct.Struct('<Q')
+_STRING_LENGTH = struct.Struct('<I')
+
+
+def hash64(value: str) -> int:
+    """
+    Returns a stable 64-bit hash of a string
+
+    Python's hash() is salted per process, so sketches built in different
+    processes would not merge; blake2b is stable and fast enough.
+
+    Args:
+        value: String to hash
+
+    Returns:
+        int: Unsigned 64-bit hash
+    """
+    return _U64.unpack(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest())[0]
+
+
+def _little_endian(values: array) -> bytes:
+    if sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _read_array(typecode: str, payload: bytes, offset: int, count: int) -> Tuple[array, int]:
+    values = array(typecode)
+    end = offset + count * values.itemsize
+    values.frombytes(payload[offset:end])
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values, end
+
+
+def _check_magic(payload: bytes, magic: bytes) -> None:
+    if payload[:len(magic)] != magic:
+        raise ValueError(f"Not a serialized {magic[:-1].decode('ascii')} sketch")
+
+
+class HyperLogLog:
+    """
+    Distinct-count estimator with about 1.04 / sqrt(2 ** precision) relative error
+
+    Example:
+        >>> hll = HyperLogLog()
+        >>> hll.update(['a.com', 'b.org', 'a.com'])
+        >>> round(hll.count())
+        2
+    """
+
+    MAGIC = b'HLL1'
+
+    def __init__(self, precision: int = 14):
+        """
+        Args:
+            precision: log2 of the register count (4-18); 14 uses 16 KiB
+                and gives roughly 0.8% error
+        """
+        if not 4 <= precision <= 18:
+            raise ValueError("precision must be between 4 and 18")
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, value: str) -> None:
+        """
+        Adds one value
+
+        Args:
+            value: String to count
+        """
+        hashed = hash64(value)
+        bits = 64 - self.precision
+        index = hashed >> bits
+        # Rank of the first set bit in the remaining bits (bits + 1 if none)
+        rank = bits - (hashed & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, values: Iterable[str]) -> None:
+        """
+        Adds every value of an iterable
+
+        Args:
+            values: Strings to count
+        """
+        for value in values:
+            self.add(value)
+
+    def count(self) -> float:
+        """
+        Estimates the number of distinct values added
+
+        Returns:
+            float: Estimated distinct count
+        """
+        m = len(self.registers)
+        alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+        estimate = alpha * m * m / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate while many registers are empty
+            return m * math.log(m / zeros)
+        return estimate
+
+    def merge(self, other: 'HyperLogLog') -> 'HyperLogLog':
+        """
+        Folds another sketch into this one
+
+        Args:
+            other: Sketch with the same precision
+
+        Returns:
+            HyperLogLog: self, for chaining
+        """
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches with different precisions")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def to_bytes(self) -> bytes:
+        """Serializes the sketch"""
+        return self.MAGIC + bytes([self.precision]) + bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, payload: bytes) -> 'HyperLogLog':
+        """Rebuilds a sketch serialized with to_bytes()"""
+        _check_magic(payload, cls.MAGIC)
+        sketch = cls(payload[4])
+        registers = payload[5:]
+        if len(registers) != len(sketch.registers):
+            raise ValueError("Truncated HyperLogLog payload")
+        sketch.registers = bytearray(registers)
+        return sketch
+
+
+class KLLSketch:
+    """
+    Quantile sketch (Karnin, Lang and Liberty) with bounded rank error
+
+    Values enter the level-0 compactor; a full compactor sorts itself and
+    promotes every other item (randomly the odd or even ones) to the next
+    level, where each item stands for twice as many values. Memory stays
+    around 3k items however many values are added.
+
+    Example:
+        >>> kll = KLLSketch()
+        >>> kll.update(range(1, 101))
+        >>> kll.quantile(0.5)
+        50
+    """
+
+    MAGIC = b'KLL1'
+    _HEADER = struct.Struct('<IdQI')
+
+    def __init__(self, k: int = 200, c: float = 2 / 3, seed: Optional[int] = None):
+        """
+        Args:
+            k: Capacity of the top compactor; rank error is roughly 1.7 / k
+            c: Capacity ratio between consecutive levels
+            seed: Seed of the coin flips, for reproducible sketches
+        """
+        self.k = k
+        self.c = c
+        self.n = 0
+        self.compactors: List[List[float]] = [[]]
+        self._random = random.Random(seed)
+        self._max_size = self._capacity(0)
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.compactors) - level - 1
+        return int(math.ceil(self.k * self.c ** depth)) + 1
+
+    def _grow(self) -> None:
+        self.compactors.append([])
+        self._max_size = sum(self._capacity(level) for level in range(len(self.compactors)))
+
+    def _size(self) -> int:
+        return sum(len(compactor) for compactor in self.compactors)
+
+    def _compress(self) -> None:
+        for level, compactor in enumerate(self.compactors):
+            if len(compactor) < self._capacity(level):
+                continue
+            if level + 1 == len(self.compactors):
+                self._grow()
+            compactor.sort()
+            # An odd item out stays behind, the rest are halved into the next level
+            keep = compactor[:len(compactor) % 2]
+            pairs = compactor[len(keep):]
+            self.compactors[level + 1].extend(pairs[self._random.random() < 0.5::2])
+            self.compactors[level] = keep
+            if self._size() < self._max_size:
+                break
+
+    def add(self, value: float) -> None:
+        """
+        Adds one value
+
+        Args:
+            value: Number to add
+        """
+        level0 = self.compactors[0]
+        level0.append(value)
+        self.n += 1
+        if len(level0) >= self._capacity(0) and self._size() >= self._max_size:
+            self._compress()
+
+    def update(self, values: Iterable[float]) -> None:
+        """
+        Adds every value of an iterable
+
+        Args:
+            values: Numbers to add
+        """
+        for value in values:
+            self.add(value)
+
+    def merge(self, other: 'KLLSketch') -> 'KLLSketch':
+        """
+        Folds another sketch into this one
+
+        Args:
+            other: Sketch built with the same k and c
+
+        Returns:
+            KLLSketch: self, for chaining
+        """
+        if (other.k, other.c) != (self.k, self.c):
+            raise ValueError("Cannot merge KLL sketches with different parameters")
+        while len(self.compactors) < len(other.compactors):
+            self._grow()
+        for level, compactor in enumerate(other.compactors):
+            self.compactors[level].extend(compactor)
+        self.n += other.n
+        while self._size() >= self._max_size:
+            self._compress()
+        return self
+
+    def _weighted(self) -> List[Tuple[float, int]]:
+        items = [(value, 1 << level)
+                 for level, compactor in enumerate(self.compactors)
+                 for value in compactor]
+        items.sort()
+        return items
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Returns an approximate q-quantile
+
+        Args:
+            q: Fraction in [0, 1], e.g. 0.5 for the median
+
+        Returns:
+            The smallest retained value whose estimated rank reaches q * n,
+            or None if the sketch is empty
+        """
+        return self.quantiles([q])[0]
+
+    def quantiles(self, fractions: Iterable[float]) -> List[Optional[float]]:
+        """
+        Returns several approximate quantiles in one pass over the sketch
+
+        Args:
+            fractions: Fractions in [0, 1]
+
+        Returns:
+            List of quantile values, in the order of fractions
+        """
+        fractions = list(fractions)
+        if any(not 0 <= q <= 1 for q in fractions):
+            raise ValueError("Quantile fractions must be between 0 and 1")
+        items = self._weighted()
+        if not items:
+            return [None] * len(fractions)
+        total = sum(weight for _, weight in items)
+        results = []
+        for q in fractions:
+            target = max(1, math.ceil(q * total))
+            seen = 0
+            for value, weight in items:
+                seen += weight
+                if seen >= target:
+                    break
+            results.append(value)
+        return results
+
+    def rank(self, value: float) -> float:
+        """
+        Estimates the fraction of added values that are <= value
+
+        Args:
+            value: Number to rank
+
+        Returns:
+            float: Fraction in [0, 1]
+        """
+        items = self._weighted()
+        total = sum(weight for _, weight in items)
+        if not total:
+            return 0.0
+        return sum(weight for item, weight in items if item <= value) / total
+
+    def to_bytes(self) -> bytes:
+        """Serializes the sketch"""
+        parts = [self.MAGIC, self._HEADER.pack(self.k, self.c, self.n, len(self.compactors))]
+        for compactor in self.compactors:
+            parts.append(_STRING_LENGTH.pack(len(compactor)))
+            parts.append(_little_endian(array('d', compactor)))
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, payload: bytes) -> 'KLLSketch':
+        """Rebuilds a sketch serialized with to_bytes()"""
+        _check_magic(payload, cls.MAGIC)
+        k, c, n, levels = cls._HEADER.unpack_from(payload, 4)
+        sketch = cls(k, c)
+        sketch.n = n
+        offset = 4 + cls._HEADER.size
+        compactors = []
+        for _ in range(levels):
+            (count,) = _STRING_LENGTH.unpack_from(payload, offset)
+            values, offset = _read_array('d', payload, offset + _STRING_LENGTH.size, count)
+            compactors.append(values.tolist())
+        sketch.compactors = compactors or [[]]
+        sketch._max_size = sum(sketch._capacity(level) for level in range(len(sketch.compactors)))
+        return sketch
+
+
+class CountMinSketch:
+    """
+    Frequency estimator that never under-counts
+
+    With width w and depth d an estimate exceeds the true count by more
+    than e / w of the total only with probability e ** -d.
+    """
+
+    MAGIC = b'CMS1'
+    _HEADER = struct.Struct('<IIQ')
+
+    def __init__(self, width: int = 2048, depth: int = 4):
+        """
+        Args:
+            width: Counters per row
+            depth: Number of rows (independent hash functions)
+        """
+        self.width = width
+        self.depth = depth
+        self.total = 0
+        self.rows = [array('Q', bytes(8 * width)) for _ in range(depth)]
+
+    def _indexes(self, item: str) -> List[int]:
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        first, second = struct.unpack('<QQ', digest)
+        # Kirsch-Mitzenmacher: d hash functions from two
+        return [(first + row * second) % self.width for row in range(self.depth)]
+
+    def add(self, item: str, count: int = 1) -> int:
+        """
+        Adds count occurrences of an item
+
+        Args:
+            item: Item to count
+            count: Number of occurrences
+
+        Returns:
+            int: The item's new estimated count
+        """
+        self.total += count
+        estimate = None
+        for row, index in zip(self.rows, self._indexes(item)):
+            row[index] += count
+            if estimate is None or row[index] < estimate:
+                estimate = row[index]
+        return estimate
+
+    def estimate(self, item: str) -> int:
+        """
+        Returns the estimated count of an item
+
+        Args:
+            item: Item to look up
+
+        Returns:
+            int: Upper bound on the item's true count
+        """
+        return min(row[index] for row, index in zip(self.rows, self._indexes(item)))
+
+    def merge(self, other: 'CountMinSketch') -> 'CountMinSketch':
+        """
+        Folds another sketch into this one
+
+        Args:
+            other: Sketch with the same width and depth
+
+        Returns:
+            CountMinSketch: self, for chaining
+        """
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("Cannot merge Count-Min sketches with different shapes")
+        self.rows = [array('Q', map(int.__add__, mine, theirs))
+                     for mine, theirs in zip(self.rows, other.rows)]
+        self.total += other.total
+        return self
+
+    def to_bytes(self) -> bytes:
+        """Serializes the sketch"""
+        return b''.join([self.MAGIC, self._HEADER.pack(self.width, self.depth, self.total)]
+                        + [_little_endian(row) for row in self.rows])
+
+    @classmethod
+    def from_bytes(cls, payload: bytes) -> 'CountMinSketch':
+        """Rebuilds a sketch serialized with to_bytes()"""
+        _check_magic(payload, cls.MAGIC)
+        width, depth, total = cls._HEADER.unpack_from(payload, 4)
+        sketch = cls(width, depth)
+        sketch.total = total
+        offset = 4 + cls._HEADER.size
+        rows = []
+        for _ in range(depth):
+            row, offset = _read_array('Q', payload, offset, width)
+            rows.append(row)
+        sketch.rows = rows
+        return sketch
+
+
+class HeavyHitters:
+    """
+    Top-k items by frequency: a Count-Min sketch plus k candidates
+
+    Candidates sit in a min-heap keyed by their estimate; an item outside
+    the candidates replaces the smallest one once its estimate is larger.
+    Heap entries are refreshed lazily, so updates cost O(log k).
+
+    Example:
+        >>> hitters = HeavyHitters(k=1)
+        >>> hitters.update(['Ann', 'Bob', 'Ann'])
+        >>> hitters.top()
+        [('Ann', 2)]
+    """
+
+    MAGIC = b'TOPK'
+
+    def __init__(self, k: int = 10, width: int = 2048, depth: int = 4):
+        """
+        Args:
+            k: Number of items to track
+            width: Width of the underlying Count-Min sketch
+            depth: Depth of the underlying Count-Min sketch
+        """
+        self.k = k
+        self.counts = CountMinSketch(width, depth)
+        self._candidates: Dict[str, int] = {}
+        self._heap: List[Tuple[int, str]] = []
+
+    def _push(self, item: str, estimate: int) -> None:
+        self._candidates[item] = estimate
+        heapq.heappush(self._heap, (estimate, item))
+        if len(self._heap) > 4 * self.k:
+            # Drop stale entries before the heap outgrows the candidates
+            self._heap = [(count, name) for name, count in self._candidates.items()]
+            heapq.heapify(self._heap)
+
+    def _smallest(self) -> Tuple[int, str]:
+        heap = self._heap
+        while heap[0][0] != self._candidates.get(heap[0][1]):
+            heapq.heappop(heap)
+        return heap[0]
+
+    def add(self, item: str, count: int = 1) -> None:
+        """
+        Adds count occurrences of an item
+
+        Args:
+            item: Item to count
+            count: Number of occurrences
+        """
+        estimate = self.counts.add(item, count)
+        if item in self._candidates or len(self._candidates) < self.k:
+            self._push(item, estimate)
+            return
+        smallest, smallest_item = self._smallest()
+        if estimate > smallest:
+            del self._candidates[smallest_item]
+            heapq.heappop(self._heap)
+            self._push(item, estimate)
+
+    def update(self, items: Iterable[str]) -> None:
+        """
+        Adds one occurrence of every item of an iterable
+
+        Args:
+            items: Items to count
+        """
+        for item in items:
+            self.add(item)
+
+    def top(self, n: Optional[int] = None) -> List[Tuple[str, int]]:
+        """
+        Returns the most frequent items
+
+        Args:
+            n: Number of items (defaults to k)
+
+        Returns:
+            List of (item, estimated count), most frequent first
+        """
+        ranked = sorted(self._candidates.items(), key=lambda entry: (-entry[1], entry[0]))
+        return ranked[:self.k if n is None else n]
+
+    def merge(self, other: 'HeavyHitters') -> 'HeavyHitters':
+        """
+        Folds another sketch into this one
+
+        The candidates of both sides are re-estimated against the merged
+        Count-Min sketch and the k largest are kept.
+
+        Args:
+            other: Sketch with the same k, width and depth
+
+        Returns:
+            HeavyHitters: self, for chaining
+        """
+        if other.k != self.k:
+            raise ValueError("Cannot merge heavy-hitter sketches with different k")
+        self.counts.merge(other.counts)
+        items = set(self._candidates) | set(other._candidates)
+        estimates = sorted(((self.counts.estimate(item), item) for item in items), reverse=True)
+        self._candidates = {item: estimate for estimate, item in estimates[:self.k]}
+        self._heap = [(estimate, item) for item, estimate in self._candidates.items()]
+        heapq.heapify(self._heap)
+        return self
+
+    def to_bytes(self) -> bytes:
+        """Serializes the sketch"""
+        parts = [self.MAGIC, _STRING_LENGTH.pack(self.k), _STRING_LENGTH.pack(len(self._candidates))]
+        for item in self._candidates:
+            encoded = item.encode('utf-8')
+            parts.append(_STRING_LENGTH.pack(len(encoded)))
+            parts.append(encoded)
+        parts.append(self.counts.to_bytes())
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, payload: bytes) -> 'HeavyHitters':
+        """Rebuilds a sketch serialized with to_bytes()"""
+        _check_magic(payload, cls.MAGIC)
+        (k,) = _STRING_LENGTH.unpack_from(payload, 4)
+        (candidates,) = _STRING_LENGTH.unpack_from(payload, 8)
+        offset = 12
+        items = []
+        for _ in range(candidates):
+            (length,) = _STRING_LENGTH.unpack_from(payload, offset)
+            offset += _STRING_LENGTH.size
+            items.append(payload[offset:offset + length].decode('utf-8'))
+            offset += length
+        counts = CountMinSketch.from_bytes(payload[offset:])
+        sketch = cls(k, counts.width, counts.depth)
+        sketch.counts = counts
+        sketch._candidates = {item: counts.estimate(item) for item in items}
+        sketch._heap = [(estimate, item) for item, estimate in sketch._candidates.items()]
+        heapq.heapify(sketch._heap)
+        return sketch
+
+
+class UserSketches:
+    """
+    The dashboard sketches over user_data: distinct email domains, age
+    quantiles and the most common names
+
+    Example:
+        >>> sketches = UserSketches()
+        >>> sketches.add({'name': 'Ann Lee', 'email': 'ann@example.com', 'age': 30})
+        >>> sketches.summary()['distinct_domains']
+        1
+    """
+
+    _LENGTH = struct.Struct('<III')
+
+    def __init__(self, top_k: int = 10, precision: int = 14, k: int = 200):
+        """
+        Args:
+            top_k: Number of most common names to track
+            precision: HyperLogLog precision for the domain count
+            k: KLL accuracy parameter for the age quantiles
+        """
+        self.rows = 0
+        self.domains = HyperLogLog(precision)
+        self.ages = KLLSketch(k)
+        self.names = HeavyHitters(top_k)
+
+    def add(self, user: Any) -> None:
+        """
+        Adds one user
+
+        Args:
+            user: Dictionary or UserRecord with 'name', 'email' and 'age'
+        """
+        self.rows += 1
+        self.domains.add(email_domain(user['email']))
+        self.ages.add(user['age'])
+        self.names.add(user['name'])
+
+    def update(self, users: Iterable[Any]) -> None:
+        """
+        Adds every user of an iterable, e.g. stream_users()
+
+        Args:
+            users: Dictionaries or UserRecords
+        """
+        for user in users:
+            self.add(user)
+
+    def update_batch(self, batch: Any) -> None:
+        """
+        Adds one batch from stream_users_in_batches() in any format
+
+        Column batches are consumed column by column, without building a
+        record per user.
+
+        Args:
+            batch: UserColumns, or a list of dictionaries or UserRecords
+        """
+        if not isinstance(batch, UserColumns):
+            self.update(batch)
+            return
+        self.rows += len(batch)
+        self.domains.update(map(email_domain, batch.emails))
+        self.ages.update(batch.ages)
+        self.names.update(batch.names)
+
+    def update_batches(self, batches: Iterable[Any]) -> None:
+        """
+        Adds every batch of an iterable, e.g. stream_users_in_batches()
+
+        Args:
+            batches: Batches in any stream_users_in_batches() format
+        """
+        for batch in batches:
+            self.update_batch(batch)
+
+    def merge(self, other: 'UserSketches') -> 'UserSketches':
+        """
+        Folds the sketches of another part of the table into these
+
+        Args:
+            other: Sketches built with the same parameters
+
+        Returns:
+            UserSketches: self, for chaining
+        """
+        self.rows += other.rows
+        self.domains.merge(other.domains)
+        self.ages.merge(other.ages)
+        self.names.merge(other.names)
+        return self
+
+    def to_bytes(self) -> bytes:
+        """Serializes all three sketches"""
+        parts = [self.domains.to_bytes(), self.ages.to_bytes(), self.names.to_bytes()]
+        return _U64.pack(self.rows) + self._LENGTH.pack(*map(len, parts)) + b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, payload: bytes) -> 'UserSketches':
+        """Rebuilds sketches serialized with to_bytes()"""
+        (rows,) = _U64.unpack_from(payload)
+        lengths = cls._LENGTH.unpack_from(payload, _U64.size)
+        offset = _U64.size + cls._LENGTH.size
+        pieces = []
+        for length in lengths:
+            pieces.append(payload[offset:offset + length])
+            offset += length
+        sketches = cls.__new__(cls)
+        sketches.rows = rows
+        sketches.domains = HyperLogLog.from_bytes(pieces[0])
+        sketches.ages = KLLSketch.from_bytes(pieces[1])
+        sketches.names = HeavyHitters.from_bytes(pieces[2])
+        return sketches
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Returns the dashboard metrics
+
+        Returns:
+            Dictionary with rows, distinct_domains, age quantiles and top_names
+        """
+        p25, median, p75, p95, p99 = self.ages.quantiles([0.25, 0.5, 0.75, 0.95, 0.99])
+        return {
+            'rows': self.rows,
+            'distinct_domains': round(self.domains.count()),
+            'age_p25': p25,
+            'age_median': median,
+            'age_p75': p75,
+            'age_p95': p95,
+            'age_p99': p99,
+            'top_names': self.names.top(),
+        }
+
+
+def _sketch_range(key_range: parallel_scan.KeyRange, where: Optional[seed.WhereSpec],
+                  top_k: int, fetch_size: int) -> bytes:
+    """
+    Sketches one key range in a worker process
+
+    Returns:
+        bytes: Serialized UserSketches of the range
+    """
+    connection = seed.connect_to_prodev()
+    if connection is None:
+        raise RuntimeError("Failed to connect to ALX_prodev database")
+
+    conditions, params = seed.compile_where(where)
+    range_sql, range_params = parallel_scan.range_conditions(key_range)
+    query = seed.select_users_sql(None, conditions + range_sql)
+
+    sketches = UserSketches(top_k)
+    cursor = None
+    try:
+        cursor = connection.cursor(buffered=False)
+        cursor.execute(query, params + range_params)
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            sketches.update_batch(UserColumns.from_rows(rows))
+    finally:
+        if cursor:
+            cursor.close()
+        connection.close()
+    return sketches.to_bytes()
+
+
+def sketch_parallel(workers: Optional[int] = None, partitions: Optional[int] = None,
+                    where: Optional[seed.WhereSpec] = None, top_k: int = 10,
+                    fetch_size: int = 5000) -> UserSketches:
+    """
+    Builds UserSketches over user_data with one worker process per key range
+
+    Each worker returns its serialized sketches and the parent merges them.
+
+    Args:
+        workers: Number of worker processes (defaults to the CPU count)
+        partitions: Number of key ranges (defaults to 4 per worker)
+        where: Optional filter evaluated by the database
+        top_k: Number of most common names to track
+        fetch_size: Rows per fetchmany() call in the workers
+
+    Returns:
+        UserSketches: Sketches over the whole (filtered) table
+    """
+    workers = workers or os.cpu_count() or 1
+    partitions = partitions or workers * 4
+    with seed.pooled_connection() as connection:
+        ranges = parallel_scan.key_ranges(parallel_scan.sample_boundaries(connection, partitions))
+
+    merged = UserSketches(top_k)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_sketch_range, key_range, where, top_k, fetch_size)
+                   for key_range in ranges]
+        for future in futures:
+            merged.merge(UserSketches.from_bytes(future.result()))
+    return merged
+
+
+if __name__ == "__main__":
+    summary = sketch_parallel(int(sys.argv[1]) if len(sys.argv) > 1 else None).summary()
+    for metric, value in summary.items():
+        print(f"{metric}: {value}")
@@ -0,0 +1,195 @@
+#!/usr/bin/python3
+"""
+Single-pass statistics over a stream of ages
+
+StreamingStats consumes values one at a time in constant memory and keeps
+count, mean and variance (Welford's algorithm), min/max and an exact
+histogram over the 0-999 domain of the DECIMAL(3,0) age column, from which
+percentiles are read without a second pass.
+"""
+
+import math
+from typing import Any, Dict, Iterable, List, Mapping, Optional
+
+
+# user_data.age is DECIMAL(3,0), so every age falls in [0, AGE_DOMAIN)
+AGE_DOMAIN = 1000
+
+
+class StreamingStats:
+    """
+    Constant-memory accumulator for integer values in [0, domain)
+
+    Example:
+        >>> stats = StreamingStats()
+        >>> stats.update([20, 30, 40])
+        >>> stats.mean, stats.percentile(50)
+        (30.0, 30)
+    """
+
+    def __init__(self, domain: int = AGE_DOMAIN):
+        """
+        Args:
+            domain: Values must lie in [0, domain); sets the histogram size
+        """
+        self.domain = domain
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0              # Sum of squared deviations from the mean
+        self.min: Optional[int] = None
+        self.max: Optional[int] = None
+        self.histogram: List[int] = [0] * domain
+
+    def add(self, value: int) -> None:
+        """
+        Adds one value to the accumulator
+
+        Args:
+            value: Integer in [0, domain)
+
+        Raises:
+            ValueError: If the value is outside the domain
+        """
+        if not 0 <= value < self.domain:
+            raise ValueError(f"Value {value} outside [0, {self.domain})")
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        self.histogram[value] += 1
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def update(self, values: Iterable[int]) -> None:
+        """
+        Adds every value of an iterable
+
+        Args:
+            values: Integers in [0, domain)
+        """
+        for value in values:
+            self.add(value)
+
+    def update_counts(self, counts: Mapping[int, int]) -> None:
+        """
+        Adds values given as value -> occurrences, e.g. a Counter over a column
+
+        Costs one step per distinct value rather than per value.
+
+        Args:
+            counts: Mapping of integers in [0, domain) to how often they occur
+
+        Raises:
+            ValueError: If a value is outside the domain
+        """
+        other = StreamingStats(self.domain)
+        for value, occurrences in counts.items():
+            if not occurrences:
+                continue
+            if not 0 <= value < self.domain:
+                raise ValueError(f"Value {value} outside [0, {self.domain})")
+            other.histogram[value] += occurrences
+            other.count += occurrences
+        if other.count == 0:
+            return
+        present = [value for value, occurrences in enumerate(other.histogram) if occurrences]
+        other.min, other.max = present[0], present[-1]
+        other.mean = sum(value * other.histogram[value] for value in present) / other.count
+        other._m2 = sum(other.histogram[value] * (value - other.mean) ** 2 for value in present)
+        self.merge(other)
+
+    def merge(self, other: 'StreamingStats') -> 'StreamingStats':
+        """
+        Folds another accumulator into this one (e.g. per-partition results)
+
+        Args:
+            other: Accumulator over the same domain
+
+        Returns:
+            StreamingStats: self, for chaining
+        """
+        if other.domain != self.domain:
+            raise ValueError("Cannot merge accumulators with different domains")
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.count, self.mean, self._m2 = other.count, other.mean, other._m2
+            self.min, self.max = other.min, other.max
+            self.histogram = list(other.histogram)
+            return self
+
+        # Chan et al. parallel combination of mean and M2
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / total
+        self._m2 += other._m2 + delta * delta * self.count * other.count / total
+        self.count = total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.histogram = [a + b for a, b in zip(self.histogram, other.histogram)]
+        return self
+
+    @property
+    def variance(self) -> float:
+        """Population variance (0.0 for fewer than one value)"""
+        return self._m2 / self.count if self.count else 0.0
+
+    @property
+    def sample_variance(self) -> float:
+        """Sample variance (0.0 for fewer than two values)"""
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def stddev(self) -> float:
+        """Population standard deviation"""
+        return math.sqrt(self.variance)
+
+    def percentile(self, p: float) -> Optional[int]:
+        """
+        Returns the exact p-th percentile (nearest-rank) from the histogram
+
+        Args:
+            p: Percentile in [0, 100]
+
+        Returns:
+            The smallest value with at least p% of values at or below it,
+            or None if no values were added
+        """
+        if not 0 <= p <= 100:
+            raise ValueError("Percentile must be between 0 and 100")
+        if self.count == 0:
+            return None
+        rank = max(1, math.ceil(p / 100 * self.count))
+        seen = 0
+        for value, frequency in enumerate(self.histogram):
+            seen += frequency
+            if seen >= rank:
+                return value
+        return self.max
+
+    @property
+    def median(self) -> Optional[int]:
+        """50th percentile"""
+        return self.percentile(50)
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Returns the headline statistics as a dictionary
+
+        Returns:
+            Dictionary with count, mean, stddev, min, p25, median, p75, p95, p99, max
+        """
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'stddev': self.stddev,
+            'min': self.min,
+            'p25': self.percentile(25),
+            'median': self.percentile(50),
+            'p75': self.percentile(75),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': self.max,
+        }